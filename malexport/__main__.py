@@ -1,5 +1,6 @@
 import os
 import sys
+import functools
 from pathlib import Path
 from typing import Any, Literal
 from collections.abc import Callable
@@ -35,6 +36,15 @@ ONLY = click.option(
     help="Only update anime or manga history specifically",
 )
 
+WORKERS = click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=None,
+    envvar="MALEXPORT_DRIVER_POOL_SIZE",
+    help="how many browsers to use to download pages at the same time",
+)
+
 STREAM = click.option(
     "-s",
     "--stream",
@@ -57,6 +67,38 @@ def apply_shared(*chosen: Any) -> Any:
     return _add_options
 
 
+def record_metrics(func: Callable[..., None]) -> Callable[..., None]:
+    """
+    Decorator to record metrics for the requests an update command makes,
+    saved to data_dir/metrics/{command}.json once it finishes
+    """
+
+    @functools.wraps(func)
+    def _record(*args: Any, **kwargs: Any) -> None:
+        from .metrics import METRICS
+        from .log import logger
+
+        command = click.get_current_context().info_name or func.__name__
+        METRICS.start()
+        success = False
+        try:
+            func(*args, **kwargs)
+            success = True
+        finally:
+            localdir = LocalDir.from_username(kwargs["username"])
+            try:
+                METRICS.save(
+                    localdir.data_dir / "metrics" / f"{command}.json",
+                    command=command,
+                    username=localdir.username,
+                    success=success,
+                )
+            except OSError as e:
+                logger.warning(f"Could not save metrics for {command}: {e}")
+
+    return _record
+
+
 @main.group()
 def update() -> None:
     """
@@ -65,6 +107,7 @@ def update() -> None:
 
 
 @update.command(name="all", short_help="update all data")
+@record_metrics
 @apply_shared(USERNAME)
 def _all(username: str) -> None:
     """
@@ -83,19 +126,38 @@ def _all(username: str) -> None:
 
 
 @update.command(name="lists", short_help="update animelist and mangalists")
+@record_metrics
 @apply_shared(USERNAME, ONLY)
-def _lists_update(only: str, username: str) -> None:
+@click.option(
+    "-c",
+    "--concurrency",
+    type=int,
+    default=None,
+    envvar="MALEXPORT_LIST_CONCURRENCY",
+    help="how many pages to request at the same time",
+)
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    envvar="MALEXPORT_LIST_INCREMENTAL",
+    help="stop requesting once a page matches the saved list",
+)
+def _lists_update(
+    only: str, username: str, concurrency: int | None, incremental: bool
+) -> None:
     from .exporter import Account
 
     acc = Account.from_username(username)
     only_update: ListType | None = None
     if only is not None:
         only_update = ListType.__members__[only.upper()]
-    acc.update_lists(only=only_update)
+    acc.update_lists(only=only_update, concurrency=concurrency, incremental=incremental)
 
 
 @update.command(name="messages", short_help="update messages (DMs)")
-@apply_shared(USERNAME)
+@record_metrics
+@apply_shared(USERNAME, WORKERS)
 @click.option(
     "--thread-count",
     type=int,
@@ -106,29 +168,54 @@ def _lists_update(only: str, username: str) -> None:
     "--start-page", type=int, default=1, help="which page to start requesting from"
 )
 def _messages_update(
-    username: str, start_page: int, thread_count: int | None = None
+    username: str,
+    start_page: int,
+    workers: int | None,
+    thread_count: int | None = None,
 ) -> None:
     from .exporter import Account
 
     acc = Account.from_username(username)
-    acc.update_messages(start_page=start_page, thread_count=thread_count)
+    acc.update_messages(
+        start_page=start_page, thread_count=thread_count, workers=workers
+    )
 
 
 @update.command(
     name="api-lists", short_help="update animelist and mangalists using the API"
 )
+@record_metrics
 @apply_shared(USERNAME, ONLY)
-def _api_lists(only: str, username: str) -> None:
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    envvar="MALEXPORT_API_LIST_INCREMENTAL",
+    help="only request entries which changed since the lists were last updated",
+)
+@click.option(
+    "--shared-metadata",
+    default=False,
+    is_flag=True,
+    envvar="MALEXPORT_SHARED_API_METADATA",
+    help="store metadata in a store shared by all accounts, only save list status per account",
+)
+def _api_lists(
+    only: str, username: str, incremental: bool, shared_metadata: bool
+) -> None:
     from .exporter import Account
 
     acc = Account.from_username(username)
     only_update: ListType | None = None
     if only is not None:
         only_update = ListType.__members__[only.upper()]
-    acc.update_api_lists(only=only_update)
+    acc.update_api_lists(
+        only=only_update, incremental=incremental, shared_metadata=shared_metadata
+    )
 
 
 @update.command(name="export", short_help="export xml lists")
+@record_metrics
 @apply_shared(USERNAME)
 def _export(username: str) -> None:
     from .exporter import Account
@@ -138,7 +225,8 @@ def _export(username: str) -> None:
 
 
 @update.command(name="history", short_help="update episode history")
-@apply_shared(USERNAME, ONLY)
+@record_metrics
+@apply_shared(USERNAME, ONLY, WORKERS)
 @click.option(
     "-c",
     "--count",
@@ -160,12 +248,37 @@ def _export(username: str) -> None:
     envvar="MALEXPORT_USE_MERGED_FILE",
     help="use a single merged JSON file instead of storing history data in individual files",
 )
+@click.option(
+    "--use-requests",
+    default=False,
+    is_flag=True,
+    envvar="MALEXPORT_HISTORY_USE_REQUESTS",
+    help="only use selenium to login, request history pages with the browser cookies",
+)
+@click.option(
+    "--prioritize",
+    default=False,
+    is_flag=True,
+    envvar="MALEXPORT_HISTORY_PRIORITIZE",
+    help="request entries likely to have new history first, instead of in list order",
+)
+@click.option(
+    "--skip-unchanged",
+    default=False,
+    is_flag=True,
+    envvar="MALEXPORT_HISTORY_SKIP_UNCHANGED",
+    help="skip entries whose list data hasn't changed since their history was requested",
+)
 def _history(
     username: str,
     only: str | None,
     driver_type: str,
     count: int | None,
     use_merged_file: bool,
+    use_requests: bool,
+    workers: int | None,
+    prioritize: bool,
+    skip_unchanged: bool,
 ) -> None:
     from .exporter import Account
 
@@ -178,19 +291,33 @@ def _history(
         count=count,
         driver_type=driver_type,
         use_merged_file=use_merged_file,
+        use_requests=use_requests,
+        workers=workers,
+        prioritize=prioritize,
+        skip_unchanged=skip_unchanged,
     )
 
 
 @update.command(name="forum", short_help="update forum posts")
+@record_metrics
 @apply_shared(USERNAME)
-def _forum(username: str) -> None:
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=None,
+    envvar="MALEXPORT_FORUM_WORKERS",
+    help="how many forum topics to download at the same time",
+)
+def _forum(username: str, workers: int | None) -> None:
     from .exporter import Account
 
     acc = Account.from_username(username)
-    acc.update_forum_posts()
+    acc.update_forum_posts(workers=workers)
 
 
 @update.command(name="friends", short_help="update friends")
+@record_metrics
 @apply_shared(USERNAME)
 def _friends(username: str) -> None:
     from .exporter import Account
@@ -205,13 +332,19 @@ def parse() -> None:
 
 
 @parse.command(name="xml", short_help="parse the XML export files")
+@apply_shared(STREAM)
 @click.argument("XML_FILE", type=click.Path(exists=True))
-def _xml(xml_file: str) -> None:
-    from .parse import parse_xml
+def _xml(xml_file: str, stream: bool) -> None:
+    from .parse import parse_xml, iter_xml
     from .common import serialize
 
-    xml_data = parse_xml(xml_file)
-    click.echo(serialize(xml_data))
+    if stream:
+        for entry in iter_xml(xml_file):
+            sys.stdout.write(serialize(entry))
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+    else:
+        click.echo(serialize(parse_xml(xml_file)))
 
 
 @parse.command(name="list", short_help="parse the list file")
@@ -347,7 +480,15 @@ def _manual_history_parse(
     name="combine", short_help="combines lists, api-lists, xml and history data"
 )
 @apply_shared(USERNAME, ONLY)
-def _combine_parse(only: str | None, username: str) -> None:
+@click.option(
+    "--cache/--no-cache",
+    "use_cache",
+    default=False,
+    envvar="MALEXPORT_PARSE_CACHE",
+    show_default=True,
+    help="Save the results, and reuse them till the exported files change",
+)
+def _combine_parse(only: str | None, username: str, use_cache: bool) -> None:
     """
     This combines relevant info from the lists, xml and history files
     It removes some of the commonly unused fields, and uses the xml for rewatch info/better dates
@@ -357,7 +498,7 @@ def _combine_parse(only: str | None, username: str) -> None:
     from .parse.combine import combine
     from .common import serialize
 
-    anime, manga = combine(username)
+    anime, manga = combine(username, use_cache=use_cache)
     if only == "anime":
         click.echo(serialize(anime))
     elif only == "manga":
@@ -366,6 +507,24 @@ def _combine_parse(only: str | None, username: str) -> None:
         click.echo(serialize({"anime": anime, "manga": manga}))
 
 
+@parse.command(name="clear-cache", short_help="remove cached combine results")
+@click.option(
+    "-u",
+    "--username",
+    "username",
+    required=False,
+    help="Only remove results for this user, else removes everything",
+)
+def _clear_cache(username: str | None) -> None:
+    from .parse.cache import ParseCache
+
+    cache = ParseCache()
+    if username is not None:
+        cache.invalidate(username, LocalDir.from_username(username).data_dir)
+    else:
+        cache.clear()
+
+
 @parse.command(name="history", short_help="parse downloaded user history")
 @apply_shared(USERNAME)
 def _history_parse(username: str) -> None:
@@ -0,0 +1,101 @@
+"""
+A metadata store for anime/manga from the MAL API (synopsis, pictures,
+related entries, statistics...), shared by every account in the data directory
+
+When this is enabled, each accounts animelist_api.json/mangalist_api.json only
+stores its list status, and the metadata is joined back in when parsing
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Any
+from collections.abc import Iterable
+
+from .common import Json, serialize, atomic_write_text, read_json
+from .list_type import ListType
+from .log import logger
+from .paths import _expand_file
+
+SHARED_METADATA = bool(int(os.environ.get("MALEXPORT_SHARED_API_METADATA", 0)))
+
+# metadata older than this is requested again
+METADATA_TTL_DAYS = float(os.environ.get("MALEXPORT_API_METADATA_TTL_DAYS", 14))
+
+# the only fields kept in each accounts list file
+LIST_FIELDS = {"id", "title", "my_list_status"}
+
+
+def metadata_path(application_base: Path, list_type: ListType) -> Path:
+    return application_base / ".api_metadata" / f"{list_type.value}.json"
+
+
+def is_slim(node: Json) -> bool:
+    """
+    Whether this node from a list file only has the list status
+    """
+    return set(node) <= LIST_FIELDS
+
+
+def slim_node(node: Json) -> Json:
+    return {k: v for k, v in node.items() if k in LIST_FIELDS}
+
+
+class MetadataStore:
+    """
+    Metadata nodes keyed by MAL ID, with when they were requested
+    """
+
+    def __init__(self, path: Path, ttl_days: float = METADATA_TTL_DAYS) -> None:
+        self.path = _expand_file(path)
+        self.ttl_days = ttl_days
+        self.data: dict[str, Any] = {}
+        if self.path.exists():
+            self.data = read_json(self.path)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path}, entries={len(self.data)})"
+
+    __str__ = __repr__
+
+    def get(self, mal_id: int) -> Json | None:
+        item = self.data.get(str(mal_id))
+        if item is None:
+            return None
+        node: Json = item["node"]
+        return node
+
+    def stale_ids(self, mal_ids: Iterable[int]) -> list[int]:
+        """
+        IDs which have no metadata, or metadata older than the TTL
+        """
+        cutoff = time.time() - self.ttl_days * 86400
+        stale: list[int] = []
+        for mal_id in mal_ids:
+            item = self.data.get(str(mal_id))
+            if item is None or item["fetched_at"] < cutoff:
+                stale.append(mal_id)
+        return stale
+
+    def update(self, nodes: Iterable[Json]) -> None:
+        now = int(time.time())
+        for node in nodes:
+            # list status is per-account, never store it here
+            self.data[str(node["id"])] = {
+                "fetched_at": now,
+                "node": {k: v for k, v in node.items() if k != "my_list_status"},
+            }
+
+    def save(self) -> None:
+        logger.debug(f"Saving {len(self.data)} entries to {self.path}")
+        atomic_write_text(self.path, serialize(self.data))
+
+    def join(self, node: Json) -> Json | None:
+        """
+        Combine a slim node from a list file with its metadata. Returns
+        None if there is no metadata for this entry
+        """
+        metadata = self.get(node["id"])
+        if metadata is None:
+            return None
+        return {**metadata, **node}
@@ -1,14 +1,16 @@
 import os
+import re
+import json
 import time
+import tempfile
 import warnings
 import datetime
-from typing import Any, cast
-from collections.abc import Callable
-from collections.abc import Generator, Sequence
+from pathlib import Path
+from typing import Any
+from collections.abc import Callable, Iterator
 from urllib.parse import urlparse, parse_qs
 
 import requests
-import backoff  # type: ignore[import]
 import simplejson
 
 from .list_type import ListType
@@ -16,64 +18,144 @@ from .list_type import ListType
 Json = Any
 
 from malexport.log import logger
+from malexport.rate_limit import RATE_LIMITER, MIN_REQUEST_WAIT_TIME
+from malexport.retry import retry_policy, parse_retry_after, should_retry
+from malexport.http_cache import RESPONSE_CACHE
+from malexport.metrics import METRICS
 
-REQUEST_WAIT_TIME: int = int(os.environ.get("MALEXPORT_REQUEST_WAIT_TIME", 10))
+# kept for compatibility, the rate limiter (see rate_limit.py) decides
+# how long to wait between requests, and never waits less than this
+REQUEST_WAIT_TIME: float = MIN_REQUEST_WAIT_TIME
 REQUEST_TIMEOUT: int = int(os.environ.get("MALEXPORT_REQUEST_TIMEOUT", 10))
 
 
-def fibo_backoff() -> Generator[float, None, None]:
-    """
-    Fibonacci backoff, with the first 7 elements consumed.
-    In other words, this starts at 13, 21, ....
-    """
-    fib = backoff.fibo()
-    for _ in range(7):
-        next(fib)
-    for n in fib:
-        yield float(n)
-
-
-def backoff_hdlr(details: Any) -> None:
-    warning_msg = "Backing off {wait:0.1f} seconds after {tries} tries with {args} {kwargs}".format(
-        **details
+def backoff_hdlr(url: str, wait: float, tries: int, error: Exception) -> None:
+    warnings.warn(
+        f"Backing off {wait:0.1f} seconds after {tries} tries with {url}: {error}"
     )
-    warnings.warn(warning_msg)
+    METRICS.record_retry(url, wait)
 
 
-@backoff.on_exception(
-    fibo_backoff,
-    cast(Sequence[type[Exception]], (requests.RequestException,)),
-    max_tries=3,
-    on_backoff=backoff_hdlr,
-)
 def safe_request(
     url: str,
     *,
     method: str = "GET",
     session: requests.Session | None = None,
     on_error: Callable[[requests.Response], Any] | None = None,
-    wait_time: int = REQUEST_WAIT_TIME,
+    wait_time: float | None = None,
     **kwargs: Any,
 ) -> requests.Response:
     """
-    Sleep for a while, make a request, and retry 3 times if the request fails
+    Wait for the rate limiter, make a request, and retry if the request fails
     Can supply an on_error function to do some custom behaviour if there's an HTTP error
+    Can supply a wait_time, to wait at least that many seconds after the previous
+    request to the same host, even if the rate limiter would allow it sooner
+
+    How many times/how long to wait before retrying depends on the endpoint (see retry.py).
+    Only timeouts/connection errors, 429s and 5xx errors are retried (and 401s if
+    on_error is supplied, since that may refresh the token). If the server sends a
+    Retry-After header, that is used instead of the backoff
+
+    If MALEXPORT_HTTP_CACHE is set, GET requests use the response cache (see http_cache.py)
     """
-    time.sleep(wait_time)
     sess: requests.Session
     if session is not None:
         sess = session
     else:
         sess = requests.Session()
+    policy = retry_policy(url)
+    tries = 0
+    while True:
+        tries += 1
+        try:
+            return _request(
+                url,
+                method=method,
+                session=sess,
+                on_error=on_error,
+                wait_time=wait_time,
+                **kwargs,
+            )
+        except requests.RequestException as e:
+            resp = e.response
+            if tries >= policy.tries or not should_retry(
+                resp, refreshed=on_error is not None
+            ):
+                raise
+            retry_after = parse_retry_after(resp)
+            if retry_after is not None:
+                # the rate limiter pauses every request to this host till then
+                backoff_hdlr(url, retry_after, tries, e)
+            else:
+                wait = policy.backoff(tries)
+                backoff_hdlr(url, wait, tries, e)
+                time.sleep(wait)
+
+
+def _request(
+    url: str,
+    *,
+    method: str,
+    session: requests.Session,
+    on_error: Callable[[requests.Response], Any] | None,
+    wait_time: float | None = None,
+    **kwargs: Any,
+) -> requests.Response:
+    cache_key: str | None = None
+    cached = None
+    if RESPONSE_CACHE is not None and method == "GET" and not kwargs.get("stream"):
+        cache_key = RESPONSE_CACHE.key(method, url, session, kwargs.get("headers"))
+        cached = RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            if RESPONSE_CACHE.is_fresh(cached):
+                logger.debug(f"Using cached response for {url}")
+                METRICS.record_request(
+                    url, status=cached.status_code, elapsed=0.0, source="cache"
+                )
+                return cached.to_response()
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **cached.validators}
+    waited = RATE_LIMITER.acquire(url, wait_time or 0.0)
     logger.info(f"Requesting {url}...")
     kwargs.setdefault("allow_redirects", True)
-    r = sess.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+    start = time.perf_counter()
+    try:
+        r = session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+    except requests.RequestException:
+        RATE_LIMITER.feedback(url, None)
+        METRICS.record_request(
+            url,
+            method=method,
+            status=None,
+            elapsed=time.perf_counter() - start,
+            waited=waited,
+        )
+        raise
+    RATE_LIMITER.feedback(url, r.status_code, parse_retry_after(r))
+    METRICS.record_request(
+        url,
+        method=method,
+        status=r.status_code,
+        elapsed=time.perf_counter() - start,
+        size=(
+            int(r.headers.get("Content-Length") or 0)
+            if kwargs.get("stream")
+            else len(r.content)
+        ),
+        waited=waited,
+    )
+    if RESPONSE_CACHE is not None and cache_key is not None:
+        if r.status_code == 304 and cached is not None:
+            logger.debug(f"{url} hasn't changed, using cached response")
+            RESPONSE_CACHE.touch(cached)
+            return cached.to_response()
+        if r.status_code == 200:
+            RESPONSE_CACHE.store(cache_key, r)
     try:
         r.raise_for_status()
     except requests.RequestException as e:
         if on_error is not None:
             on_error(r)  # do something, e.g. refresh a expired bearer token
-        raise e  # raise anyways, so this request retries
+        raise e  # raise anyways, so safe_request can retry
     return r
 
 
@@ -98,19 +180,142 @@ def default_encoder(o: Any) -> Any:
     raise TypeError(f"{o} of type {type(o)} is not serializable")
 
 
+# which library to use to read/write JSON, orjson if installed or the standard library
+JSON_BACKENDS = ("orjson", "json")
+JSON_BACKEND: str = os.environ.get("MALEXPORT_JSON_BACKEND", "orjson")
+
+_orjson: Any = None
+
+
+def set_json_backend(name: str) -> str:
+    """
+    Switch the JSON library, falling back to the standard library
+    if orjson isn't installed. Returns the backend being used
+    """
+    global _orjson
+    if name not in JSON_BACKENDS:
+        raise ValueError(
+            f"Unknown JSON backend {name}, expected one of {JSON_BACKENDS}"
+        )
+    _orjson = None
+    if name == "orjson":
+        try:
+            import orjson  # type: ignore[import]
+
+            _orjson = orjson
+        except ImportError:
+            pass
+    return json_backend()
+
+
+def json_backend() -> str:
+    return "orjson" if _orjson is not None else "json"
+
+
+set_json_backend(JSON_BACKEND)
+
+
+def parse_json(data: str | bytes) -> Any:
+    """
+    Decode JSON text. Both backends raise a json.JSONDecodeError on invalid data
+    """
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def read_json(path: str | Path) -> Any:
+    return parse_json(Path(path).read_bytes())
+
+
 def serialize(data: Any) -> str:
+    if _orjson is not None:
+        bdata: bytes = _orjson.dumps(data, default=default_encoder)
+        return bdata.decode("utf-8")
+    return simplejson.dumps(
+        data,
+        default=default_encoder,
+        namedtuple_as_object=True,
+    )
+
+
+def atomic_write_text(path: Path, data: str) -> None:
+    """
+    Write to a temporary file in the same directory, then rename it
+    over path, so the file is never left partially written
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
     try:
-        import orjson  # type: ignore[import]
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
 
-        bdata: bytes = orjson.dumps(data, default=default_encoder)
-        return bdata.decode("utf-8")
 
-    except ImportError:
-        return simplejson.dumps(
-            data,
-            default=default_encoder,
-            namedtuple_as_object=True,
-        )
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(path: Path, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Decode the elements of a top-level JSON array one at a time, reading
+    the file in chunks, so only the current element is held in memory
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill(size: int) -> None:
+            nonlocal buf, pos, eof
+            # drop what has already been decoded
+            buf = buf[pos:]
+            pos = 0
+            chunk = f.read(size)
+            eof = not chunk
+            buf += chunk
+
+        def skip_whitespace() -> str:
+            nonlocal pos
+            while True:
+                pos = WHITESPACE.match(buf, pos).end()  # type: ignore[union-attr]
+                if pos < len(buf) or eof:
+                    return buf[pos : pos + 1]
+                fill(chunk_size)
+
+        if skip_whitespace() != "[":
+            raise ValueError(f"{path} is not a JSON array")
+        pos += 1
+        if skip_whitespace() == "]":
+            return
+        while True:
+            skip_whitespace()
+            try:
+                el, end = decoder.raw_decode(buf, pos)
+                sep_pos = WHITESPACE.match(buf, end).end()  # type: ignore[union-attr]
+                sep = buf[sep_pos : sep_pos + 1]
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                sep = ""
+            # the element may have been cut off at the end of the buffer
+            # (e.g. a number), so only accept it if it's followed by , or ]
+            if sep not in (",", "]"):
+                if eof:
+                    raise ValueError(f"{path}: expected ',' or ']' after element")
+                # read at least as much as is buffered, so large elements aren't re-decoded many times
+                fill(max(chunk_size, len(buf) - pos))
+                continue
+            pos = sep_pos + 1
+            yield el
+            if sep == "]":
+                return
 
 
 def extract_query_value(url: str | None, param: str | None) -> str:
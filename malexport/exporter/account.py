@@ -8,7 +8,7 @@ from .forum import ForumManager
 from .export_downloader import ExportDownloader
 from .friends import FriendDownloader
 from .messages import MessageDownloader
-from .driver import Browser
+from .driver import Browser, DriverPool
 
 
 class Account:
@@ -30,6 +30,7 @@ class Account:
         self.friend_downloader: FriendDownloader | None = None
         self.message_manager: MessageDownloader | None = None
         self._shared_driver: Browser | None = None
+        self._driver_pool: DriverPool | None = None
 
     @property
     def shared_driver(self) -> Browser | None:
@@ -44,12 +45,28 @@ class Account:
             return
         self._shared_driver = driver
 
+    def _share_pool(self, manager: HistoryManager | MessageDownloader) -> None:
+        """
+        If the manager uses multiple workers, share one pool of browsers
+        between all of the managers
+        """
+        if manager.workers <= 1:
+            return
+        if self._driver_pool is None:
+            self._driver_pool = manager.pool
+        manager._pool = self._driver_pool
+
     def mal_api_authenticate(self) -> MalSession:
         """
         This authenticates the mal_session using the API
         If never done before, runs the OAuth flow. Else loads
         the access token from the config file
+
+        The session is shared by everything which uses the API, so they
+        use the same connection pool
         """
+        if self.mal_session is not None:
+            return self.mal_session
         client_info = self.localdir.load_or_prompt_mal_client_info()
         self.mal_session = MalSession(
             client_id=client_info["client_id"], localdir=self.localdir
@@ -67,20 +84,40 @@ class Account:
         """Alternate constructor to create an account from MAL username"""
         return Account(localdir=LocalDir.from_username(username))
 
-    def update_lists(self, only: ListType | None = None) -> None:
+    def update_lists(
+        self,
+        only: ListType | None = None,
+        concurrency: int | None = None,
+        incremental: bool | None = None,
+    ) -> None:
         """
         Uses the load.json endpoint to request anime/manga lists.
         Does not require any authentication
+        If concurrency is set, requests that many pages at the same time
+        If incremental is True, stops requesting once a page matches the saved list
         """
+        if concurrency is not None:
+            self.animelist.concurrency = max(1, concurrency)
+            self.mangalist.concurrency = max(1, concurrency)
+        if incremental is not None:
+            self.animelist.incremental = incremental
+            self.mangalist.incremental = incremental
         if only == ListType.ANIME or only is None:
             self.animelist.update_list()
         if only == ListType.MANGA or only is None:
             self.mangalist.update_list()
 
-    def update_api_lists(self, only: ListType | None = None) -> None:
+    def update_api_lists(
+        self,
+        only: ListType | None = None,
+        incremental: bool | None = None,
+        shared_metadata: bool | None = None,
+    ) -> None:
         """
         Uses MALs API to request anime/manga lists
         Requires authentication, but includes more data than load.json
+        If incremental is True, only requests entries which changed since the last update
+        If shared_metadata is True, metadata is stored in a store shared by all accounts
         """
         self.mal_api_authenticate()
         assert self.mal_session is not None
@@ -96,6 +133,12 @@ class Account:
                 localdir=self.localdir,
                 mal_session=self.mal_session,
             )
+        if incremental is not None:
+            self.animelist_api.incremental = incremental
+            self.mangalist_api.incremental = incremental
+        if shared_metadata is not None:
+            self.animelist_api.shared_metadata = shared_metadata
+            self.mangalist_api.shared_metadata = shared_metadata
         if only == ListType.ANIME or only is None:
             self.animelist_api.update_list()
         if only == ListType.MANGA or only is None:
@@ -121,12 +164,22 @@ class Account:
         count: int | None = None,
         driver_type: str = "chrome",
         use_merged_file: bool = False,
+        use_requests: bool = False,
+        workers: int | None = None,
+        prioritize: bool = False,
+        skip_unchanged: bool = False,
     ) -> None:
         """
         Uses selenium to download episode/chapter history one entry at a time.
 
         This takes quite a while, and requires authentication (MAL Username/Password)
         If count is specified, only requests the first 'count' IDs found in your history
+        If use_requests is True, selenium is only used to login, the history pages
+        are requested using the cookies from the browser
+        If workers is set, requests that many entries at the same time
+        If prioritize is True, entries likely to have new history are requested first
+        If skip_unchanged is True, entries whose list data hasn't changed since
+        their history was last requested are skipped
         """
         if self.anime_episode_history is None:
             self.anime_episode_history = HistoryManager(
@@ -134,6 +187,7 @@ class Account:
                 localdir=self.localdir,
                 driver_type=driver_type,
                 use_merged_file=use_merged_file,
+                use_requests=use_requests,
             )
         if self.manga_chapter_history is None:
             self.manga_chapter_history = HistoryManager(
@@ -141,11 +195,21 @@ class Account:
                 localdir=self.localdir,
                 driver_type=driver_type,
                 use_merged_file=use_merged_file,
+                use_requests=use_requests,
             )
         # if we have an authenticated driver already, use it
         if self.shared_driver is not None:
             self.anime_episode_history._driver = self.shared_driver
             self.manga_chapter_history._driver = self.shared_driver
+        for manager in (self.anime_episode_history, self.manga_chapter_history):
+            if workers is not None:
+                manager.workers = max(1, workers)
+            if prioritize:
+                manager.prioritize = True
+            if skip_unchanged:
+                manager.skip_unchanged = True
+            if not manager.use_requests:
+                self._share_pool(manager)
         if only == ListType.ANIME or only is None:
             self.anime_episode_history.update_history(count=count)
         if only == ListType.MANGA or only is None:
@@ -155,19 +219,26 @@ class Account:
         self.shared_driver = self.manga_chapter_history._driver
 
     def update_messages(
-        self, start_page: int = 1, thread_count: int | None = None
+        self,
+        start_page: int = 1,
+        thread_count: int | None = None,
+        workers: int | None = None,
     ) -> None:
         """
         Download/Update DMs for your account
+        If workers is set, downloads that many threads at the same time
         """
         if self.message_manager is None:
             self.message_manager = MessageDownloader(
                 self.localdir,
                 till_same_limit=thread_count,
             )
+        if workers is not None:
+            self.message_manager.workers = max(1, workers)
+        self._share_pool(self.message_manager)
         self.message_manager.update_messages(start_page=start_page)
 
-    def update_forum_posts(self) -> None:
+    def update_forum_posts(self, workers: int | None = None) -> None:
         """
         Uses the MAL API to download any forum posts which you've created/commented on
 
@@ -175,6 +246,8 @@ class Account:
         use any App Type other than Web, this doesn't use a Client Secret
 
         You can use http://localhost as the App Redirect URL
+
+        If workers is set, downloads that many forum topics at the same time
         """
         self.mal_api_authenticate()
         assert self.mal_session is not None
@@ -182,6 +255,8 @@ class Account:
             self.forum_manager = ForumManager(
                 localdir=self.localdir, mal_session=self.mal_session
             )
+        if workers is not None:
+            self.forum_manager.workers = max(1, workers)
         self.forum_manager.update_forum_index()
         self.forum_manager.update_changed_forum_posts()
 
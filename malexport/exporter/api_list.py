@@ -2,14 +2,52 @@
 Requests MAL Lists (animelist/mangalist) for a user, using MAL API
 """
 
+import os
 from pathlib import Path
 
+import requests
+
 from ..list_type import ListType
-from ..common import Json, serialize
+from ..common import Json, serialize, read_json
+from ..log import logger
+from ..urls import MAL_API_BASE_URL
 from ..paths import LocalDir
 from .mal_session import MalSession
+from .sync_state import SyncState
+from ..api_metadata import (
+    SHARED_METADATA,
+    MetadataStore,
+    metadata_path,
+    slim_node,
+)
+
+FIELDS = "id,title,main_picture,alternative_titles,start_date,end_date,synopsis,mean,rank,popularity,num_list_users,num_scoring_users,nsfw,created_at,updated_at,media_type,status,genres,my_list_status,num_episodes,start_season,broadcast,source,average_episode_duration,rating,pictures,background,related_anime,related_manga,recommendations,studios,statistics"
+
+BASE_URL = (
+    MAL_API_BASE_URL
+    + "/v2/users/{username}/{list_type}list?limit=100&offset=0&nsfw=true&fields="
+    + FIELDS
+)
+
+# when using shared metadata, only request the list status for each entry
+LIST_STATUS_URL = (
+    MAL_API_BASE_URL
+    + "/v2/users/{username}/{list_type}list?limit=1000&offset=0&nsfw=true&fields=my_list_status"
+)
+# metadata for a single entry
+DETAIL_URL = (
+    MAL_API_BASE_URL
+    + "/v2/{list_type}/{mal_id}?nsfw=true&fields="
+    + ",".join(f for f in FIELDS.split(",") if f != "my_list_status")
+)
+# if more than this many entries need metadata, request the entire
+# list with metadata instead of requesting each entry
+DETAIL_LIMIT = int(os.environ.get("MALEXPORT_API_METADATA_DETAIL_LIMIT", 50))
 
-BASE_URL = "https://api.myanimelist.net/v2/users/{username}/{list_type}list?limit=100&offset=0&nsfw=true&fields=id,title,main_picture,alternative_titles,start_date,end_date,synopsis,mean,rank,popularity,num_list_users,num_scoring_users,nsfw,created_at,updated_at,media_type,status,genres,my_list_status,num_episodes,start_season,broadcast,source,average_episode_duration,rating,pictures,background,related_anime,related_manga,recommendations,studios,statistics"
+# if set, only request entries which were updated since the list was last saved
+INCREMENTAL = bool(int(os.environ.get("MALEXPORT_API_LIST_INCREMENTAL", 0)))
+# when updating incrementally, most changes are in the first page, so use smaller pages
+INCREMENTAL_LIMIT = int(os.environ.get("MALEXPORT_API_LIST_INCREMENTAL_LIMIT", 25))
 
 
 class APIList:
@@ -18,11 +56,18 @@ class APIList:
     """
 
     def __init__(
-        self, list_type: ListType, localdir: LocalDir, mal_session: MalSession
+        self,
+        list_type: ListType,
+        localdir: LocalDir,
+        mal_session: MalSession,
+        incremental: bool = INCREMENTAL,
+        shared_metadata: bool = SHARED_METADATA,
     ) -> None:
         self.localdir = localdir
         self.list_type = list_type
         self.mal_session = mal_session
+        self.incremental = incremental
+        self.shared_metadata = shared_metadata
         self.mal_session.authenticate()
 
     @property
@@ -37,7 +82,31 @@ class APIList:
     def update_list(self) -> None:
         """
         Paginate through all the data from the MAL API
+
+        If incremental is set and the list has been saved before, only
+        requests entries which changed since then. A full update is still
+        done every MALEXPORT_FULL_SWEEP_DAYS days
+
+        If shared_metadata is set, only the list status is saved, see _update_list_shared
         """
+        sync_state = SyncState(self.localdir)
+        full_sweep = self.shared_metadata or not (
+            self.incremental
+            and self.list_path.exists()
+            and not sync_state.full_sweep_due(self.list_path.name)
+        )
+        if self.shared_metadata:
+            data = self._update_list_shared()
+        elif not full_sweep:
+            data = self._update_list_incremental()
+        else:
+            data = self._request_full_list()
+        encoded_data = serialize(data)
+        self.list_path.write_text(encoded_data)
+        if full_sweep:
+            sync_state.mark_full_sweep(self.list_path.name)
+
+    def _request_full_list(self) -> list[Json]:
         first_url = BASE_URL.format(
             list_type=self.list_type.value,
             username=self.localdir.username,
@@ -46,5 +115,89 @@ class APIList:
         for resp in self.mal_session.paginate_all_data(first_url):
             for entry in resp:
                 data.append(entry["node"])
-        encoded_data = serialize(data)
-        self.list_path.write_text(encoded_data)
+        return data
+
+    def _update_list_shared(self) -> list[Json]:
+        """
+        Request only the list status for each entry, and request metadata for
+        entries which aren't in the shared metadata store (or have expired)
+
+        Returns the list status nodes, to be saved in this accounts list file
+        """
+        store = MetadataStore(
+            metadata_path(self.localdir.application_base, self.list_type)
+        )
+        first_url = LIST_STATUS_URL.format(
+            list_type=self.list_type.value,
+            username=self.localdir.username,
+        )
+        data: list[Json] = []
+        for resp in self.mal_session.paginate_all_data(first_url):
+            for entry in resp:
+                data.append(slim_node(entry["node"]))
+        stale = store.stale_ids(node["id"] for node in data)
+        if len(stale) > DETAIL_LIMIT:
+            logger.info(
+                f"{len(stale)} {self.list_type.value} entries need metadata, requesting entire list"
+            )
+            full = self._request_full_list()
+            store.update(full)
+            data = [slim_node(node) for node in full]
+        else:
+            logger.info(
+                f"Requesting metadata for {len(stale)} {self.list_type.value} entries"
+            )
+            for mal_id in stale:
+                url = DETAIL_URL.format(list_type=self.list_type.value, mal_id=mal_id)
+                try:
+                    store.update([self.mal_session.safe_json_request(url)])
+                except requests.exceptions.HTTPError as e:
+                    # entry may have been removed from MAL
+                    logger.warning(f"Could not request metadata for {mal_id}: {e}")
+        store.save()
+        return data
+
+    def _update_list_incremental(self) -> list[Json]:
+        """
+        Request entries sorted by when they were last updated on your list, stopping
+        at the first one with the same updated_at as the saved list. Changed entries
+        are merged into the saved list
+
+        This can't tell if an entry was removed from your list, the periodic
+        full update removes those
+        """
+        saved: list[Json] = read_json(self.list_path)
+        saved_updated_at: dict[int, str | None] = {
+            node["id"]: (node.get("my_list_status") or {}).get("updated_at")
+            for node in saved
+        }
+        first_url = (
+            BASE_URL.format(
+                list_type=self.list_type.value,
+                username=self.localdir.username,
+            ).replace("limit=100", f"limit={INCREMENTAL_LIMIT}")
+            + "&sort=list_updated_at"
+        )
+        changed: dict[int, Json] = {}
+        pages = 0
+        # dont prefetch, the next page usually isn't needed
+        for resp in self.mal_session.paginate_all_data(first_url, prefetch=False):
+            pages += 1
+            reached_saved = False
+            for entry in resp:
+                node = entry["node"]
+                updated_at = (node.get("my_list_status") or {}).get("updated_at")
+                if node["id"] in saved_updated_at and (
+                    saved_updated_at[node["id"]] == updated_at
+                ):
+                    reached_saved = True
+                    break
+                changed[node["id"]] = node
+            if reached_saved:
+                break
+        logger.info(
+            f"Found {len(changed)} changed {self.list_type.value} entries in {pages} page(s)"
+        )
+        return list(changed.values()) + [
+            node for node in saved if node["id"] not in changed
+        ]
@@ -3,18 +3,24 @@ Selenium singleton and functionality to login to MAL using a chromedriver
 """
 
 import os
+import json
 import time
 import tempfile
+import queue
 import random
 import atexit
 from pathlib import Path
 from functools import lru_cache
-from typing import Any, Union
+from typing import Any, Union, TypeVar
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 
 import click
+import requests
 from selenium import webdriver as sel
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.webdriver import WebDriver as Firefox
 from selenium.webdriver.remote.webelement import WebElement
@@ -23,7 +29,10 @@ from selenium.webdriver.support import expected_conditions as EC  # type: ignore
 
 from ..paths import LocalDir, _expand_path
 from ..log import logger
-from ..common import REQUEST_WAIT_TIME
+from ..urls import MAL_BASE_URL
+from ..rate_limit import RATE_LIMITER, REQUEST_WAIT_TIME
+from ..metrics import METRICS
+from ..common import safe_request, atomic_write_text
 
 # environment variables to overwrite the location of the chromedriver
 # typically this just uses the 'chromedriver' binary,
@@ -39,6 +48,9 @@ TEMP_DOWNLOAD_DIR = tempfile.mkdtemp(
     dir=_expand_path(Path(TEMP_DOWNLOAD_BASE) / "malexport_driver_downloads")
 )
 
+# how many browsers to use when scraping pages in parallel
+DRIVER_POOL_SIZE = int(os.environ.get("MALEXPORT_DRIVER_POOL_SIZE", 1))
+
 # global so user can edit before a driver is created if they want
 CHROME_KWARGS: dict[str, Any] = {}
 
@@ -48,18 +60,32 @@ BrowserType = str
 Browser = Union[sel.Chrome, Firefox]
 
 
-@lru_cache(maxsize=12)
-def webdriver(browser_type: str) -> sel.Chrome | sel.Firefox:
+def _quit_quietly(driver: Browser) -> None:
+    try:
+        driver.quit()
+    except Exception:  # already quit, or browser crashed
+        pass
+
+
+def create_webdriver(
+    browser_type: str,
+    *,
+    download_dir: str = TEMP_DOWNLOAD_DIR,
+    headless: bool = HIDDEN_CHROMEDRIVER,
+) -> Browser:
+    """
+    Create a new browser, which saves downloads to download_dir
+    """
     bt = browser_type.casefold()
     assert bt in {"chrome", "firefox"}
     if bt == "chrome":
         options = sel.ChromeOptions()
-        if HIDDEN_CHROMEDRIVER:
+        if headless:
             options.add_argument("headless")  # type: ignore[no-untyped-call]
             options.add_argument("window-size=1920x1080")  # type: ignore[no-untyped-call]
             options.add_argument("disable-gpu")  # type: ignore[no-untyped-call]
         options.add_experimental_option(
-            "prefs", {"download.default_directory": str(TEMP_DOWNLOAD_DIR)}
+            "prefs", {"download.default_directory": str(download_dir)}
         )
         if CHROME_LOCATION is not None:
             options.binary_location = CHROME_LOCATION
@@ -68,7 +94,7 @@ def webdriver(browser_type: str) -> sel.Chrome | sel.Firefox:
             **CHROME_KWARGS,
         )
         # quit when python exits to avoid hanging browsers
-        atexit.register(lambda: driver.quit())  # type: ignore[no-any-return]
+        atexit.register(_quit_quietly, driver)
         return driver
     else:
         # mostly added to get around this bug https://github.com/SeleniumHQ/selenium/issues/10799
@@ -76,14 +102,28 @@ def webdriver(browser_type: str) -> sel.Chrome | sel.Firefox:
         service = Service(
             log_path=os.path.join(tempfile.gettempdir(), "geckodriver.log")
         )
+        ff_options = FirefoxOptions()
+        if headless:
+            ff_options.add_argument("-headless")  # type: ignore[no-untyped-call]
+        ff_options.set_preference("browser.download.folderList", 2)
+        ff_options.set_preference("browser.download.dir", str(download_dir))
         ff = Firefox(
             service=service,
+            options=ff_options,
         )
-        atexit.register(lambda: ff.quit())
+        atexit.register(_quit_quietly, ff)
         return ff
 
 
-LOGIN_PAGE = "https://myanimelist.net/login.php"
+@lru_cache(maxsize=12)
+def webdriver(browser_type: str) -> Browser:
+    return create_webdriver(browser_type)
+
+
+MAL_HOMEPAGE = f"{MAL_BASE_URL}/"
+LOGIN_PAGE = f"{MAL_BASE_URL}/login.php"
+# requires you to be logged in, redirects to the login page otherwise
+ACCOUNT_PAGE = f"{MAL_BASE_URL}/editprofile.php"
 
 LOGIN_ID = "loginUserName"
 PASSWORD_ID = "login-password"
@@ -103,17 +143,125 @@ def _wait_for_input_element(webdriver: Browser, id_selector: str) -> WebElement:
     return webdriver.find_element(By.ID, id_selector)
 
 
+def _add_cookies(webdriver: Browser, cookies: list[dict[str, Any]]) -> None:
+    # have to be on the domain to be able to set cookies for it
+    navigate(webdriver, MAL_HOMEPAGE)
+    for cookie in cookies:
+        webdriver.add_cookie(
+            {
+                k: cookie[k]
+                for k in ("name", "value", "path", "domain", "secure", "expiry")
+                if k in cookie
+            }
+        )
+
+
+def _create_session(
+    user_agent: str | None, cookies: list[dict[str, Any]]
+) -> requests.Session:
+    """
+    Create a requests.Session with the cookies/user agent from a browser
+    """
+    session = requests.Session()
+    # keep connections to MAL open across requests
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4)
+    session.mount("https://", adapter)
+    if user_agent:
+        session.headers.update({"User-Agent": user_agent})
+    for cookie in cookies:
+        session.cookies.set(
+            cookie["name"],
+            cookie["value"],
+            domain=cookie.get("domain"),
+            path=cookie.get("path", "/"),
+        )
+    return session
+
+
+def _user_agent(webdriver: Browser) -> str | None:
+    user_agent = webdriver.execute_script("return navigator.userAgent")  # type: ignore[no-untyped-call]
+    return user_agent if isinstance(user_agent, str) else None
+
+
+def save_cookies(webdriver: Browser, localdir: LocalDir) -> None:
+    """
+    Save the cookies/user agent from a logged in browser, so the next
+    run can skip logging in
+    """
+    data = {
+        "user_agent": _user_agent(webdriver),
+        "cookies": webdriver.get_cookies(),
+    }
+    logger.debug(f"Saving cookies to {localdir.cookie_path}")
+    # the temporary file is created by mkstemp, so it's only readable by this user
+    atomic_write_text(localdir.cookie_path, json.dumps(data))
+
+
+def load_cookies(localdir: LocalDir) -> dict[str, Any] | None:
+    """
+    Load the cookies saved by save_cookies, if they exist
+    """
+    if not localdir.cookie_path.exists():
+        return None
+    try:
+        data: dict[str, Any] = json.loads(localdir.cookie_path.read_text())
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data.get("cookies"), list):
+        return None
+    return data
+
+
+def _login_with_saved_cookies(webdriver: Browser, localdir: LocalDir) -> bool:
+    """
+    Add the saved cookies to the browser, and check if that logged us in
+    """
+    saved = load_cookies(localdir)
+    if saved is None:
+        return False
+    _add_cookies(webdriver, saved["cookies"])
+    navigate(webdriver, ACCOUNT_PAGE)
+    if "login.php" in webdriver.current_url:
+        logger.info("Saved login cookies have expired, logging in...")
+        webdriver.delete_all_cookies()
+        return False
+    logger.info("Logged in using saved cookies")
+    return True
+
+
+def session_from_saved_cookies(localdir: LocalDir) -> requests.Session | None:
+    """
+    Create a requests.Session using the saved cookies. Returns None
+    if there are no saved cookies or they have expired
+    """
+    saved = load_cookies(localdir)
+    if saved is None:
+        return None
+    session = _create_session(saved.get("user_agent"), saved["cookies"])
+    resp = safe_request(ACCOUNT_PAGE, session=session)
+    if "login.php" in resp.url:
+        logger.info("Saved login cookies have expired")
+        return None
+    logger.info("Using saved login cookies")
+    return session
+
+
 def driver_login(webdriver: Browser, localdir: LocalDir) -> None:
     """
     Login using the users MAL username and password
+
+    If cookies were saved from a previous login and they're still valid,
+    uses those instead
     """
     if hasattr(webdriver, "_malexport_logged_in"):
         return
+    if _login_with_saved_cookies(webdriver, localdir):
+        setattr(webdriver, "_malexport_logged_in", True)
+        return
     creds = localdir.load_or_prompt_credentials()
     logger.info(f"Logging into {creds['username']}...")
-    time.sleep(1)
-    webdriver.get(LOGIN_PAGE)
-    time.sleep(1)
+    navigate(webdriver, LOGIN_PAGE)
+    METRICS.sleep(1, "login")
     try:
         WebDriverWait(webdriver, 10).until(  # type: ignore[no-untyped-call]
             EC.element_to_be_clickable(  # type: ignore[no-untyped-call]
@@ -127,19 +275,19 @@ def driver_login(webdriver: Browser, localdir: LocalDir) -> None:
     )
     if len(opt_out) > 0:
         opt_out[0].click()
-        time.sleep(2)
+        METRICS.sleep(2, "login")
         buttons = webdriver.find_elements(By.TAG_NAME, "button")
         by_aria_label = [
             e for e in buttons if e.get_attribute("aria-label") == "Close success modal"
         ]
         if by_aria_label:
             by_aria_label[0].click()
-            time.sleep(1)
+            METRICS.sleep(1, "login")
         else:
             by_ok = [e for e in buttons if e.text == "OK"]
             if by_ok:
                 by_ok[0].click()
-                time.sleep(1)
+                METRICS.sleep(1, "login")
             else:
                 click.echo(
                     "WARNING: Could not find success modal after accepting terms",
@@ -147,9 +295,9 @@ def driver_login(webdriver: Browser, localdir: LocalDir) -> None:
                 )
 
     _wait_for_input_element(webdriver, LOGIN_ID).send_keys(creds["username"])
-    time.sleep(1)
+    METRICS.sleep(1, "login")
     _wait_for_input_element(webdriver, PASSWORD_ID).send_keys(creds["password"])
-    time.sleep(1)
+    METRICS.sleep(1, "login")
     # use script to login in case window is too small to be clickable
     webdriver.execute_script(f"""document.querySelector("{LOGIN_BUTTON_CSS}").click()""")  # type: ignore[no-untyped-call]
     # set marker value on this instance to confirm user has logged in
@@ -160,9 +308,144 @@ def driver_login(webdriver: Browser, localdir: LocalDir) -> None:
             default=True,
             show_default=False,
         )
+    try:
+        WebDriverWait(webdriver, 15).until(  # type: ignore[no-untyped-call]
+            lambda d: "login.php" not in d.current_url
+        )
+    except TimeoutException:
+        logger.warning("Still on the login page after logging in, not saving cookies")
+    else:
+        save_cookies(webdriver, localdir)
     setattr(webdriver, "_malexport_logged_in", True)
 
 
+def copy_login(from_driver: Browser, to_driver: Browser) -> None:
+    """
+    Copy the cookies from a logged in browser to another browser,
+    so it doesn't have to go through the login flow
+    """
+    _add_cookies(to_driver, from_driver.get_cookies())
+    setattr(to_driver, "_malexport_logged_in", True)
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class DriverPool:
+    """
+    A pool of logged in browsers, each with their own download directory
+
+    Work items are handed to whichever browser is free. Page loads still go
+    through navigate, so they all share the same rate limit
+
+    If logged_in is passed, it's called to get a browser which is already
+    logged in, and its cookies are copied to each browser in the pool
+    """
+
+    def __init__(
+        self,
+        size: int,
+        localdir: LocalDir,
+        browser_type: str = "chrome",
+        headless: bool = HIDDEN_CHROMEDRIVER,
+        logged_in: Callable[[], Browser] | None = None,
+    ) -> None:
+        self.size = max(1, size)
+        self.localdir = localdir
+        self.browser_type = browser_type
+        self.headless = headless
+        self.logged_in = logged_in
+        self.drivers: list[Browser] = []
+        self._free: queue.Queue[Browser] = queue.Queue()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(size={self.size}, browser_type={self.browser_type})"
+
+    __str__ = __repr__
+
+    def start(self) -> None:
+        """
+        Start the browsers, copying the cookies from the logged in browser
+        (or logging in with the first one) to the rest
+        """
+        if self.drivers:
+            return
+        source = self.logged_in() if self.logged_in is not None else None
+        logger.info(f"Starting {self.size} {self.browser_type} browser(s)...")
+        for _ in range(self.size):
+            download_dir = tempfile.mkdtemp(
+                dir=_expand_path(
+                    Path(TEMP_DOWNLOAD_BASE) / "malexport_driver_downloads"
+                )
+            )
+            driver = create_webdriver(
+                self.browser_type, download_dir=download_dir, headless=self.headless
+            )
+            if source is not None:
+                copy_login(source, driver)
+            elif not self.drivers:
+                # uses the saved cookies if they're still valid
+                driver_login(driver, self.localdir)
+            else:
+                copy_login(self.drivers[0], driver)
+            self.drivers.append(driver)
+            self._free.put(driver)
+
+    def map(self, func: Callable[[Browser, T], R], items: Iterable[T]) -> Iterator[R]:
+        """
+        Run func(browser, item) for each item, using a free browser from
+        the pool. Results are returned in the same order as items
+        """
+        self.start()
+
+        def _run(item: T) -> R:
+            driver = self._free.get()
+            try:
+                return func(driver, item)
+            finally:
+                self._free.put(driver)
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            yield from executor.map(_run, items)
+
+    def close(self) -> None:
+        for driver in self.drivers:
+            _quit_quietly(driver)
+        self.drivers.clear()
+        self._free = queue.Queue()
+
+
+def navigate(webdriver: Browser, url: str) -> None:
+    """
+    Wait for the rate limiter, then load the page in the browser
+    """
+    waited = RATE_LIMITER.acquire(url)
+    start = time.perf_counter()
+    webdriver.get(url)
+    elapsed = time.perf_counter() - start
+    title = webdriver.title.casefold()
+    status = 200
+    if "too many requests" in title:
+        status = 429
+    elif "500 internal server error" in title:
+        status = 500
+    RATE_LIMITER.feedback(url, status)
+    METRICS.record_request(
+        url, status=status, elapsed=elapsed, waited=waited, source="browser"
+    )
+
+
+def session_from_driver(webdriver: Browser) -> requests.Session:
+    """
+    Copies the cookies/user agent from an (authenticated) browser into a
+    requests.Session, so pages which don't require javascript can be
+    requested as plain HTTP instead of a full page load in the browser
+    """
+    return _create_session(_user_agent(webdriver), webdriver.get_cookies())
+
+
 # wait a random amount of time to be nice to MAL servers
+# page loads should use navigate instead, this is for waiting on downloads
 def wait() -> None:
-    time.sleep(REQUEST_WAIT_TIME + random.random() * 4 - 1)
+    METRICS.sleep(REQUEST_WAIT_TIME + random.random() * 4 - 1, "download")
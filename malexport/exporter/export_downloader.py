@@ -3,7 +3,6 @@ Exports your list as XML from MAL using Selenium
 """
 
 import os
-import time
 import shutil
 import gzip
 
@@ -12,15 +11,24 @@ from selenium.webdriver.common.by import By  # type: ignore[import]
 from selenium.webdriver.support import expected_conditions as EC  # type: ignore[import]
 from selenium.common.exceptions import TimeoutException, WebDriverException  # type: ignore[import]
 
-from .driver import webdriver, driver_login, wait, TEMP_DOWNLOAD_DIR, Browser
+from .driver import (
+    webdriver,
+    driver_login,
+    navigate,
+    wait,
+    TEMP_DOWNLOAD_DIR,
+    Browser,
+)
 from ..list_type import ListType
 from ..paths import LocalDir
 from ..log import logger
+from ..metrics import METRICS
+from ..urls import MAL_BASE_URL
 
 TRY_EXPORT_TIMES = int(os.environ.get("MALEXPORT_EXPORT_TRIES", 3))
 UNLINK_TEMP_GZ_FILES = bool(os.environ.get("MALEXPORT_UNLINK_TEMP_GZ_FILES", False))
 
-EXPORT_PAGE = "https://myanimelist.net/panel.php?go=export"
+EXPORT_PAGE = f"{MAL_BASE_URL}/panel.php?go=export"
 EXPORT_BUTTON_CSS = "input[value='Export My List']"
 DOWNLOAD_BUTTON = ".goodresult>a"
 
@@ -68,7 +76,7 @@ class ExportDownloader:
                 "Failed once, refreshing page (sometimes there's a 500 error...)"
             )
             self.driver.refresh()
-            time.sleep(2)
+            METRICS.sleep(2, "export")
         try:
             self.export_list(list_type)
         except (WebDriverException, RuntimeError) as e:
@@ -83,7 +91,7 @@ class ExportDownloader:
             # if user manually accepted/a file already present, skip retry
             if len(self._list_files(list_type=list_type)) > 0:
                 logger.info("Found downloaded file, skipping retry...")
-                time.sleep(1)
+                METRICS.sleep(1, "export")
                 return
             self.export_with_retry(list_type, times=times)  # recursive call
 
@@ -92,10 +100,10 @@ class ExportDownloader:
         Exports a particular list types' XML file, waits a while so that it can finish downloading
         The only difference between anime and manga is what is selected in the dialog
         """
-        time.sleep(1)
+        METRICS.sleep(1, "export")
         logger.info(f"Downloading {list_type.value} export")
         if self.driver.current_url != EXPORT_PAGE:
-            self.driver.get(EXPORT_PAGE)
+            navigate(self.driver, EXPORT_PAGE)
         export_button_selector = tuple([By.CSS_SELECTOR, EXPORT_BUTTON_CSS])
         WebDriverWait(self.driver, 15).until(  # type: ignore[no-untyped-call]
             EC.visibility_of_element_located(export_button_selector)  # type: ignore[no-untyped-call,arg-type]
@@ -103,15 +111,15 @@ class ExportDownloader:
         if list_type == ListType.MANGA:
             self.driver.execute_script("""$("#dialog select.inputtext").val(2)""")  # type: ignore[no-untyped-call]
         self.driver.find_element(By.CSS_SELECTOR, EXPORT_BUTTON_CSS).click()  # type: ignore[no-untyped-call]
-        time.sleep(0.25)
+        METRICS.sleep(0.25, "export")
         try:
             WebDriverWait(self.driver, 5).until(EC.alert_is_present())  # type: ignore[no-untyped-call]
         except TimeoutException:
             pass
         alert = self.driver.switch_to.alert
-        time.sleep(0.25)
+        METRICS.sleep(0.25, "export")
         alert.accept()  # type: ignore[no-untyped-call]
-        time.sleep(0.25)
+        METRICS.sleep(0.25, "export")
         download_button_selector = tuple([By.CSS_SELECTOR, DOWNLOAD_BUTTON])
         try:
             # hmm -- this page seems to be there sometimes, but not others?
@@ -157,7 +165,7 @@ class ExportDownloader:
             logger.info(
                 f"Waiting till anime/manga list export files exist, currently {os.listdir(TEMP_DOWNLOAD_DIR)}"
             )
-            time.sleep(0.5)
+            METRICS.sleep(0.5, "export")
 
         anime_files = self._list_files(list_type=ListType.ANIME)
         manga_files = self._list_files(list_type=ListType.MANGA)
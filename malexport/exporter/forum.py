@@ -2,21 +2,33 @@
 Uses MALs API to download forum posts
 """
 
+import os
 import json
+import time
 from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 
 from .mal_session import MalSession
+from ..log import logger
+from ..urls import MAL_API_BASE_URL
 from ..paths import LocalDir, _expand_path
-from ..common import Json, serialize
+from ..common import Json, serialize, atomic_write_text, read_json
 
 
 # one is created by, one is commented on, doesn't really matter which is which
 FORUM_BASES = [
-    "https://api.myanimelist.net/v2/forum/topics?user_name={mal_username}&limit=100",
-    "https://api.myanimelist.net/v2/forum/topics?topic_user_name={mal_username}&limit=100",
+    MAL_API_BASE_URL + "/v2/forum/topics?user_name={mal_username}&limit=100",
+    MAL_API_BASE_URL + "/v2/forum/topics?topic_user_name={mal_username}&limit=100",
 ]
 
-FORUM_POST = "https://api.myanimelist.net/v2/forum/topic/{forum_id}?limit=100"
+FORUM_POST = MAL_API_BASE_URL + "/v2/forum/topic/{forum_id}?limit=100"
+
+# when updating a topic that was already saved, re-request this many
+# saved posts, to make sure the new posts line up with the saved ones
+INCREMENTAL_OVERLAP = 10
+
+# how many forum topics to download at the same time
+FORUM_WORKERS = int(os.environ.get("MALEXPORT_FORUM_WORKERS", 1))
 
 
 class ForumManager:
@@ -24,9 +36,15 @@ class ForumManager:
     Download any forum posts which you've created/commented on
     """
 
-    def __init__(self, localdir: LocalDir, mal_session: MalSession) -> None:
+    def __init__(
+        self,
+        localdir: LocalDir,
+        mal_session: MalSession,
+        workers: int = FORUM_WORKERS,
+    ) -> None:
         self.localdir = localdir
         self.mal_session = mal_session
+        self.workers = max(1, workers)
         self.mal_session.authenticate()
         self.forum_index_path = (
             _expand_path(self.localdir.data_dir / "forum") / "index.json"
@@ -47,7 +65,7 @@ class ForumManager:
         Assuming the forum index exists, load the JSON file
         """
         assert self.forum_index_path.exists(), "Forum index doesn't exist!"
-        return json.loads(self.forum_index_path.read_text())
+        return read_json(self.forum_index_path)
 
     def update_forum_index(self) -> None:
         """
@@ -60,16 +78,28 @@ class ForumManager:
 
     def update_changed_forum_posts(self) -> None:
         """
-        Load the forum index, and call .update_if_changed on each forum post
+        Load the forum index, and download any forum posts which have changed
+
+        The topics are downloaded by a pool of workers, the API rate limit
+        is shared between all of them
         """
-        for forum_post in self.load_forum_index():
-            forum = ForumPost(
+        forums = [
+            ForumPost(
                 localdir=self.localdir,
                 mal_session=self.mal_session,
                 forum_id=int(forum_post["id"]),
                 last_post_created_at=str(forum_post["last_post_created_at"]),
             )
-            forum.update_if_changed()
+            for forum_post in self.load_forum_index()
+        ]
+        changed = [forum for forum in forums if forum.forum_post_has_changed()]
+        logger.info(
+            f"{len(changed)} of {len(forums)} forum topics have changed, downloading with {self.workers} worker(s)..."
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # call result so any exceptions are raised here
+            for _ in executor.map(lambda forum: forum.update_if_changed(), changed):
+                pass
 
 
 class ForumPost:
@@ -98,7 +128,7 @@ class ForumPost:
         (downloaded in the forum index)
         """
         if self.forum_path.exists():
-            data = json.loads(self.forum_path.read_text())
+            data = read_json(self.forum_path)
             if "last_post_created_at" in data:
                 # if these aren't the same, the data has changed, should update
                 return str(data["last_post_created_at"]) != self.last_post_created_at
@@ -109,15 +139,25 @@ class ForumPost:
             # doesn't exist, need to download
             return True
 
-    def download_forum_post(self) -> Json:
+    def load_saved_forum_post(self) -> Json | None:
         """
-        For a particular forum post, paginate through all the posts
+        Load the previously saved data for this forum post, if it exists
         """
-        responses = list(
-            self.mal_session.paginate_all_data(
-                FORUM_POST.format(forum_id=self.forum_id)
-            )
-        )
+        if not self.forum_path.exists():
+            return None
+        try:
+            return read_json(self.forum_path)
+        except json.JSONDecodeError:
+            return None
+
+    def download_forum_post(self, offset: int = 0) -> Json:
+        """
+        For a particular forum post, paginate through all the posts, starting at offset
+        """
+        url = FORUM_POST.format(forum_id=self.forum_id)
+        if offset > 0:
+            url += f"&offset={offset}"
+        responses = list(self.mal_session.paginate_all_data(url))
         assert len(responses) > 0, f"No data returned for {self.forum_id}!"
         # need to attach all 'posts' to the response
         data = responses[0]
@@ -125,13 +165,52 @@ class ForumPost:
             data["posts"].extend(resp["posts"])
         # save when this was last updated from the forum index
         data["last_post_created_at"] = self.last_post_created_at
+        data["post_count"] = len(data["posts"])
+        return data
+
+    def download_new_posts(self, saved: Json) -> Json | None:
+        """
+        Only request the pages after the posts which are already saved, and merge
+        the new posts into the saved data
+
+        Returns None if the new posts don't line up with the saved ones
+        (e.g. if posts were deleted), in which case the whole topic should be downloaded
+        """
+        saved_posts = saved.get("posts", [])
+        post_count = int(saved.get("post_count", len(saved_posts)))
+        offset = max(0, post_count - INCREMENTAL_OVERLAP)
+        if offset == 0:
+            return None
+        data = self.download_forum_post(offset=offset)
+        saved_ids = {post["id"] for post in saved_posts}
+        overlap = data["posts"][:INCREMENTAL_OVERLAP]
+        if not any(post["id"] in saved_ids for post in overlap):
+            logger.debug(
+                f"New posts for forum topic {self.forum_id} don't line up with saved posts, downloading entire topic"
+            )
+            return None
+        data["posts"] = saved_posts + [
+            post for post in data["posts"] if post["id"] not in saved_ids
+        ]
+        data["post_count"] = len(data["posts"])
         return data
 
     def update_if_changed(self) -> None:
         """
         If the forum post has to be updated, update it
+
+        If the forum post was saved previously, this only requests the new posts
         """
         if not self.forum_post_has_changed():
             return
-        data_json = json.dumps(self.download_forum_post())
-        self.forum_path.write_text(data_json)
+        started = time.perf_counter()
+        data: Json | None = None
+        saved = self.load_saved_forum_post()
+        if saved is not None:
+            data = self.download_new_posts(saved)
+        if data is None:
+            data = self.download_forum_post()
+        atomic_write_text(self.forum_path, serialize(data))
+        logger.info(
+            f"Downloaded forum topic {self.forum_id} ({len(data['posts'])} posts) in {time.perf_counter() - started:.1f}s"
+        )
@@ -3,6 +3,7 @@ import requests
 from ..paths import LocalDir, _expand_file
 from ..common import safe_request_json, Json, serialize
 from ..log import logger
+from ..urls import JIKAN_BASE_URL
 
 
 class FriendDownloader:
@@ -17,7 +18,7 @@ class FriendDownloader:
 
     def friend_page_url(self, page: int) -> str:
         assert page >= 1
-        return f"https://api.jikan.moe/v4/users/{self.localdir.username}/friends?page={page}"
+        return f"{JIKAN_BASE_URL}/v4/users/{self.localdir.username}/friends?page={page}"
 
     def download_friend_index(self) -> list[Json]:
         page = 1
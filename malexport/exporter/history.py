@@ -7,15 +7,17 @@ this info isn't accessible from the API
 
 import os
 import re
-import json
-import time
+import html
 import atexit
 from itertools import islice
 from pathlib import Path
 from typing import Any
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+import more_itertools
 from lxml import html as ht  # type: ignore[import]
 from selenium.webdriver.support.ui import WebDriverWait  # type: ignore[import]
 from selenium.webdriver.common.by import By  # type: ignore[import]
@@ -23,15 +25,37 @@ from selenium.webdriver.support import expected_conditions as EC  # type: ignore
 
 from ..list_type import ListType
 from .mal_list import MalList
-from .driver import webdriver, driver_login, wait, Browser
+from .driver import (
+    webdriver,
+    driver_login,
+    navigate,
+    session_from_driver,
+    session_from_saved_cookies,
+    Browser,
+    DriverPool,
+    DRIVER_POOL_SIZE,
+    HIDDEN_CHROMEDRIVER,
+)
 from .export_downloader import ExportDownloader
+from .journal import HistoryJournal
+from .merged_history import MergedHistory
+from .history_priority import (
+    load_signals,
+    prioritize,
+    EntrySignals,
+    EntryFingerprints,
+)
 from ..log import logger
+from ..urls import MAL_BASE_URL
 from ..paths import LocalDir, _expand_path
-from ..common import Json, extract_query_value, serialize
-from ..parse.xml import parse_xml
+from ..common import Json, extract_query_value, serialize, safe_request, read_json
+from ..parse.xml import iter_xml
 
 
-HISTORY_URL = "https://myanimelist.net/ajaxtb.php?keepThis=true&detailed{list_type_letter}id={entry_id}&TB_iframe=true&height=420&width=390"
+HISTORY_URL = (
+    MAL_BASE_URL
+    + "/ajaxtb.php?keepThis=true&detailed{list_type_letter}id={entry_id}&TB_iframe=true&height=420&width=390"
+)
 
 
 def history_url(list_type: ListType, entry_id: int) -> str:
@@ -47,6 +71,22 @@ def history_url(list_type: ListType, entry_id: int) -> str:
 # are the same as the previous then stop requesting
 TILL_SAME_LIMIT = int(os.environ.get("MALEXPORT_EPISODE_LIMIT", 5))
 
+# save the fingerprints after this many entries are requested, so
+# they aren't lost if the crawl is interrupted
+FINGERPRINT_SAVE_EVERY = 25
+
+# if set, only use the browser to login, and request the history
+# pages with the authenticated cookies using requests
+USE_REQUESTS = bool(int(os.environ.get("MALEXPORT_HISTORY_USE_REQUESTS", 0)))
+
+# if set, request entries which are likely to have changed first, instead
+# of walking the list in the order it was last updated
+PRIORITIZE = bool(int(os.environ.get("MALEXPORT_HISTORY_PRIORITIZE", 0)))
+
+# if set, skip requesting entries whose list data (episode count, status,
+# rewatch count, updated_at) hasn't changed since their history was requested
+SKIP_UNCHANGED = bool(int(os.environ.get("MALEXPORT_HISTORY_SKIP_UNCHANGED", 0)))
+
 EPISODE_COL_REGEX = re.compile(
     r"Ep (\d+), watched on (\d+)\/(\d+)\/(\d+) at (\d+):(\d+)"
 )
@@ -96,6 +136,10 @@ class HistoryManager:
         driver_type: str = "chrome",
         till_same_limit: int = TILL_SAME_LIMIT,
         use_merged_file: bool = False,
+        use_requests: bool = USE_REQUESTS,
+        workers: int = DRIVER_POOL_SIZE,
+        prioritize: bool = PRIORITIZE,
+        skip_unchanged: bool = SKIP_UNCHANGED,
     ) -> None:
         self.list_type = list_type
         self.localdir = localdir
@@ -104,7 +148,23 @@ class HistoryManager:
         # stop requesting
         self.till_same_limit = till_same_limit
         self.use_merged_file = use_merged_file
-        self.merged_data: dict[str, Any] | None = None
+        self.prioritize = prioritize
+        self.skip_unchanged = skip_unchanged
+        # signals from the downloaded list data, loaded when updating
+        self.signals: dict[int, EntrySignals] = {}
+        # when the oldest list data used for the signals was downloaded
+        self._signals_as_of: float = 0.0
+        # fingerprints recorded since they were last saved
+        self._unsaved_fingerprints = 0
+        # IDs from the recent history page, which are always requested
+        # since the list data may be older than the history page
+        self._recent_ids: set[int] = set()
+        self.fingerprints = EntryFingerprints(
+            self.localdir.data_dir
+            / "history"
+            / f"{self.list_type.value}_fingerprints.json"
+        )
+        self.merged: MergedHistory | None = None
 
         self.history_path: Path
         if self.use_merged_file:
@@ -113,10 +173,7 @@ class HistoryManager:
                 self.localdir.data_dir / f"{self.list_type.value}_history.json",
                 is_dir=False,
             )
-            if self.history_path.exists():
-                self.merged_data = json.loads(self.history_path.read_text())
-            else:
-                self.merged_data = {}
+            self.merged = MergedHistory(self.history_path)
             _register_atexit(self.history_path, self)
         else:
             logger.debug("Using individual history files...")
@@ -127,6 +184,12 @@ class HistoryManager:
         # a list of IDs already requested by this instance, to avoid
         # duplicates across strategies
         self.already_requested: set[int] = set()
+        # whether entries restored from the journal had changed when they were requested
+        self._replayed_changes: dict[int, bool] = {}
+        self.journal = HistoryJournal(
+            self.localdir.data_dir / "history" / f"{self.list_type.value}_journal.jsonl"
+        )
+        self._replay_journal()
 
         self.container_id = (
             "chapdetails" if self.list_type == ListType.MANGA else "epdetails"
@@ -134,6 +197,11 @@ class HistoryManager:
         self.idprefix = "chaprow" if self.list_type == ListType.MANGA else "eprow"
         self.driver_type = driver_type
         self._driver: Browser | None = None
+        self.use_requests = use_requests
+        self._session: requests.Session | None = None
+        # how many entries to request at the same time
+        self.workers = max(1, workers)
+        self._pool: DriverPool | None = None
 
     @property
     def driver(self) -> Browser:
@@ -141,10 +209,61 @@ class HistoryManager:
             self._driver = webdriver(self.driver_type)
         return self._driver
 
+    @property
+    def pool(self) -> DriverPool:
+        """
+        A pool of logged in browsers, used to request entries in parallel
+        """
+        if self._pool is None:
+            self._pool = DriverPool(
+                self.workers,
+                localdir=self.localdir,
+                browser_type=self.driver_type,
+                headless=HIDDEN_CHROMEDRIVER,
+                logged_in=self._logged_in_driver,
+            )
+        return self._pool
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        A requests.Session with the saved login cookies, or the cookies
+        from the authenticated browser if those have expired
+        """
+        if self._session is None:
+            self._session = session_from_saved_cookies(self.localdir)
+        if self._session is None:
+            self.authenticate()
+            self._session = session_from_driver(self.driver)
+        return self._session
+
     def authenticate(self) -> None:
         """Logs in to MAL using your MAL username/password"""
         driver_login(webdriver=self.driver, localdir=self.localdir)
 
+    def _logged_in_driver(self) -> Browser:
+        """The main browser, logged in, to copy cookies from to the pool"""
+        self.authenticate()
+        return self.driver
+
+    def _request_element_html(self, url: str, element_id: str) -> str:
+        """
+        Request a page using the authenticated session, and return the
+        inner HTML for the element with element_id, like innerHTML in the browser
+        """
+        resp = safe_request(url, session=self.session)
+        el = ht.fromstring(resp.text).find(f'.//*[@id="{element_id}"]')
+        if el is None:
+            if "login.php" in resp.url:
+                raise RuntimeError(
+                    f"Redirected to login while requesting {url}, session may have expired"
+                )
+            raise RuntimeError(f"Could not find element with id {element_id} in {url}")
+        # the text before the first child, and each child (which includes its tail)
+        return html.escape(el.text or "", quote=False) + "".join(
+            ht.tostring(child, encoding="unicode") for child in el
+        )
+
     def entry_path(self, entry_id: int) -> Path:
         """Location of the JSON file for this type/ID"""
         if self.use_merged_file:
@@ -152,33 +271,113 @@ class HistoryManager:
         else:
             return self.history_path / f"{entry_id}.json"
 
+    def _replay_journal(self) -> None:
+        """
+        Restore any entries requested by a previous crawl which was interrupted
+        before the data was saved. Recently requested entries aren't requested again
+        """
+        restored = 0
+        for entry in self.journal.replay():
+            self.save_data(entry.entry_id, entry.data)
+            restored += 1
+            if entry.recent:
+                self.already_requested.add(entry.entry_id)
+                self._replayed_changes[entry.entry_id] = entry.changed
+        if restored > 0:
+            logger.info(
+                f"Restored {restored} {self.list_type.value} entries from {self.journal.path}, skipping {len(self._replayed_changes)} recently requested entries"
+            )
+
+    def _already_requested(self, entry_id: int) -> bool:
+        """
+        If this was restored from the journal, return whether it had changed
+        the first time it was seen, so the till-same-limit behaves the same as
+        it would have if the crawl wasn't interrupted
+        """
+        logger.debug(f"{entry_id} has already been requested, skipping...")
+        return self._replayed_changes.pop(entry_id, False)
+
     def has_data(self, entry_id: int) -> bool:
+        if entry_id in self.already_requested:
+            return True
         if self.use_merged_file:
-            assert self.merged_data is not None
-            return str(entry_id) in self.merged_data
+            assert self.merged is not None
+            return str(entry_id) in self.merged.data
         else:
             return self.entry_path(entry_id).exists()
 
+    def history_count(self, entry_id: int) -> int | None:
+        """
+        The number of episodes/chapters saved for this entry, None if nothing is saved
+        """
+        data: Json | None = None
+        if self.use_merged_file:
+            assert self.merged is not None
+            data = self.merged.data.get(str(entry_id))
+        else:
+            p = self.entry_path(entry_id)
+            if p.exists():
+                data = read_json(p)
+        if data is None:
+            return None
+        return len(data.get("episodes", []))
+
+    def _load_signals(self, mal_list: MalList, export_file: Path) -> None:
+        """
+        Load signals for each entry from the list data that's been downloaded
+        """
+        api_list_path = self.localdir.data_dir / f"{self.list_type.value}list_api.json"
+        self.signals = load_signals(
+            self.list_type,
+            history_count=self.history_count,
+            mal_list=mal_list.load_list() if mal_list.list_path.exists() else None,
+            api_list_path=api_list_path,
+            xml_path=export_file,
+        )
+        # if any source is older than when an entry was last requested, its values
+        # could be out of date and hide a change, so use the oldest one
+        self._signals_as_of = min(
+            (
+                p.stat().st_mtime
+                for p in (mal_list.list_path, api_list_path, export_file)
+                if p.exists()
+            ),
+            default=0.0,
+        )
+
+    def _unchanged(self, entry_id: int) -> bool:
+        """
+        Whether the list data for this entry is the same as when its history
+        was last requested, in which case it doesn't need to be requested
+        """
+        if (
+            not self.skip_unchanged
+            or entry_id not in self.signals
+            or entry_id in self._recent_ids
+        ):
+            return False
+        if self.fingerprints.unchanged(self.signals[entry_id], self._signals_as_of):
+            logger.debug(
+                f"{self.list_type.value} {entry_id} list data hasn't changed, skipping..."
+            )
+            return True
+        return False
+
     def save_data(self, entry_id: int, new_data: Json) -> bool:
         """
         return True if data changed, False otherwise
         """
         if self.use_merged_file:
             logger.debug(f"Saving {entry_id} data to merged JSON...")
-            assert self.merged_data is not None
-            key = str(entry_id)
-            has_new_data = True
-            if key in self.merged_data:
-                old_data = self.merged_data[str(entry_id)]
-                has_new_data = old_data != new_data
-            self.merged_data[str(entry_id)] = new_data
-            return has_new_data
+            assert self.merged is not None
+            # only appends to the log if the data changed
+            return self.merged.update(str(entry_id), new_data)
         else:
             has_new_data = True
             p = self.entry_path(entry_id)
             logger.debug(f"Saving {entry_id} to {p}...")
             if p.exists():
-                old_data = json.loads(p.read_text())
+                old_data = read_json(p)
                 # if these aren't the same, the data has changed,
                 # we should keep searching for new episode information
                 has_new_data = old_data != new_data
@@ -188,13 +387,8 @@ class HistoryManager:
             return has_new_data
 
     def _save_merged_file(self) -> None:
-        data = serialize(self.merged_data)
-        assert self.merged_data is not None
-        total_eps = sum(len(v.get("episodes", [])) for v in self.merged_data.values())
-        logger.debug(
-            f"Writing merged JSON file: {self.history_path}, total {'episode' if self.list_type == ListType.ANIME else 'chapter'} count: {total_eps}"
-        )
-        self.history_path.write_text(data)
+        assert self.merged is not None
+        self.merged.save()
 
     def _extract_details(self, html_details: str) -> Json:
         """
@@ -205,7 +399,8 @@ class HistoryManager:
         since its possible for you to mark episodes multiple times, e.g. if you're
         rewatching entries
         """
-        x = ht.fromstring(html_details)
+        # wrap in a div, so the header is found even if it's the only element
+        x = ht.fragment_fromstring(html_details, create_parent="div")
         # parse the header
         header = x.xpath('.//div[contains(text(), "Details")]')
         assert isinstance(header, list)
@@ -236,15 +431,15 @@ class HistoryManager:
         and grabs IDs for any items which were recently watched/read
         """
         logger.info(f"Downloading recent user {self.list_type.value} history")
-        time.sleep(1)
         mal_username = self.localdir.load_or_prompt_credentials()["username"]
-        history_url = (
-            f"https://myanimelist.net/history/{mal_username}/{self.list_type.value}"
-        )
-        self.driver.get(history_url)
-        wait()
-        content_div = self.driver.find_element(By.CSS_SELECTOR, "div#content")
-        content_div_html = content_div.get_attribute("innerHTML")
+        history_url = f"{MAL_BASE_URL}/history/{mal_username}/{self.list_type.value}"
+        content_div_html: str | None
+        if self.use_requests:
+            content_div_html = self._request_element_html(history_url, "content")
+        else:
+            navigate(self.driver, history_url)
+            content_div = self.driver.find_element(By.CSS_SELECTOR, "div#content")
+            content_div_html = content_div.get_attribute("innerHTML")
         assert isinstance(content_div_html, str)
         x = ht.fromstring(content_div_html)
         found_ids: list[int] = []
@@ -259,17 +454,25 @@ class HistoryManager:
                 found_ids.append(new_id)
         return found_ids
 
-    def download_history_for_entry(self, entry_id: int) -> Json:
+    def download_history_for_entry(
+        self, entry_id: int, driver: Browser | None = None
+    ) -> Json:
         """
         Download the information for a particular type/ID
+        If driver is not supplied, uses the main browser
         """
-        time.sleep(1)
         url: str = history_url(self.list_type, entry_id)
         logger.info(f"Requesting history data for {self.list_type.value} {entry_id}")
-        self.driver.get(url)
-        wait()
+        if self.use_requests:
+            # safe_request already waits between requests
+            return self._extract_details(
+                self._request_element_html(url, self.container_id)
+            )
+        if driver is None:
+            driver = self.driver
+        navigate(driver, url)
         # sanity check to make sure data is present on the page
-        WebDriverWait(self.driver, 10).until(  # type: ignore[no-untyped-call]
+        WebDriverWait(driver, 10).until(  # type: ignore[no-untyped-call]
             EC.text_to_be_present_in_element(  # type: ignore[no-untyped-call]
                 (
                     By.ID,
@@ -278,7 +481,7 @@ class HistoryManager:
                 "Details",
             )
         )
-        details = self.driver.find_element(By.ID, self.container_id)
+        details = driver.find_element(By.ID, self.container_id)
         assert (
             details is not None
         ), f"Couldn't find details (header) div for {self.list_type.value} {entry_id} {url}"
@@ -294,18 +497,81 @@ class HistoryManager:
         If data was the same as last time, it returns False
         """
         if entry_id in self.already_requested:
-            logger.debug(f"{entry_id} has already been requested, skipping...")
+            return self._already_requested(entry_id)
+        if self._unchanged(entry_id):
             return False
         new_data = self.download_history_for_entry(entry_id)
+        return self._save_requested(entry_id, new_data)
+
+    def _save_requested(self, entry_id: int, new_data: Json) -> bool:
         self.already_requested.add(entry_id)
-        # if using merged file, save every 10 requests
-        if (
-            self.use_merged_file is True
-            and len(self.already_requested) > 0
-            and len(self.already_requested) % 10 == 0
-        ):
-            self._save_merged_file()
-        return self.save_data(entry_id, new_data)
+        changed = self.save_data(entry_id, new_data)
+        self.journal.record(entry_id, changed, new_data)
+        if self.skip_unchanged and entry_id in self.signals:
+            self.fingerprints.record(self.signals[entry_id])
+            self._unsaved_fingerprints += 1
+            if self._unsaved_fingerprints >= FINGERPRINT_SAVE_EVERY:
+                self._save_fingerprints()
+        return changed
+
+    def _save_fingerprints(self) -> None:
+        self.fingerprints.save()
+        self._unsaved_fingerprints = 0
+
+    def _download_many(self, entry_ids: list[int]) -> Iterator[Json]:
+        """
+        Download multiple entries at the same time, returning the
+        data in the same order as entry_ids
+        """
+        if self.use_requests:
+            # make sure session is created before starting threads
+            assert self.session is not None
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                yield from executor.map(self.download_history_for_entry, entry_ids)
+        else:
+            yield from self.pool.map(
+                lambda driver, entry_id: self.download_history_for_entry(
+                    entry_id, driver=driver
+                ),
+                entry_ids,
+            )
+
+    def update_entries_data(self, entry_ids: Iterable[int]) -> list[tuple[int, bool]]:
+        """
+        Like update_entry_data, but for multiple entries. If workers is more
+        than 1, the entries are requested in parallel
+
+        Returns (entry_id, changed) for each entry, in the same order
+        """
+        results: list[tuple[int, bool]] = []
+        for chunk in more_itertools.chunked(entry_ids, self.workers):
+            if self.workers <= 1:
+                results.extend(
+                    (entry_id, self.update_entry_data(entry_id)) for entry_id in chunk
+                )
+                continue
+            to_request = list(
+                dict.fromkeys(
+                    e
+                    for e in chunk
+                    if e not in self.already_requested and not self._unchanged(e)
+                )
+            )
+            downloaded = dict(zip(to_request, self._download_many(to_request)))
+            for entry_id in chunk:
+                if entry_id in downloaded:
+                    results.append(
+                        (
+                            entry_id,
+                            self._save_requested(entry_id, downloaded.pop(entry_id)),
+                        )
+                    )
+                elif entry_id in self.already_requested:
+                    results.append((entry_id, self._already_requested(entry_id)))
+                else:
+                    # skipped since the list data hadn't changed
+                    results.append((entry_id, False))
+        return results
 
     def update_history(self, count: int | None = None) -> None:
         """
@@ -318,7 +584,12 @@ class HistoryManager:
               items that have been watched in the last 3 weeks
         If count is specified, only requests the first 'count' entries
         """
-        self.authenticate()
+        if self.use_requests:
+            logger.info("Using authenticated cookies to request history pages...")
+            # only opens the browser if the saved cookies have expired
+            assert self.session is not None
+        else:
+            self.authenticate()
 
         m = MalList(self.list_type, localdir=self.localdir)
         exp = ExportDownloader(localdir=self.localdir)
@@ -327,60 +598,74 @@ class HistoryManager:
             if self.list_type == ListType.ANIME
             else exp.mangalist_path
         )
-        mal_id: int
+        if self.prioritize or self.skip_unchanged:
+            self._load_signals(m, export_file)
         logger.info("Requesting any items which don't exist in history...")
         updated = False
         if m.list_path.exists():
             updated = True
             mlist = m.load_list()
-            for entry_data in mlist:
-                mal_id = entry_data[f"{self.list_type.value}_id"]
-                # If data doesn't exist for an item, request it
-                # this doesn't impact the other strategies and will likely run when
-                # you first add an item or when this is first run and is caching your entire list
-                if not self.has_data(mal_id):
-                    self.update_entry_data(mal_id)
+            list_ids: list[int] = [
+                entry_data[f"{self.list_type.value}_id"] for entry_data in mlist
+            ]
+            # If data doesn't exist for an item, request it
+            # this doesn't impact the other strategies and will likely run when
+            # you first add an item or when this is first run and is caching your entire list
+            self.update_entries_data(
+                [mal_id for mal_id in list_ids if not self.has_data(mal_id)]
+            )
 
             logger.info("Requesting items till we hit some amount of unchanged data...")
             # request some amount till we hit unchanged data
+            # if using multiple workers, requests that many at a time
+            walk_ids = list_ids
+            if self.prioritize:
+                logger.info("Ranking entries by how likely they are to have changed...")
+                walk_ids = prioritize(self.signals, list_ids)
             till = int(self.till_same_limit)
-            for entry_data in mlist:
+            for chunk in more_itertools.chunked(walk_ids, self.workers):
                 if till <= 0:
                     break
                 logger.info(f"Requesting {till} more entries...")
-                mal_id = entry_data[f"{self.list_type.value}_id"]
-                if self.update_entry_data(mal_id):
-                    logger.debug(
-                        f"{self.list_type.value} {mal_id} had new data, resetting..."
-                    )
-                    till = int(self.till_same_limit)
-                else:
-                    logger.debug(
-                        f"{self.list_type.value} {mal_id} matched old data, decrementing..."
-                    )
-                    till -= 1
+                for mal_id, changed in self.update_entries_data(chunk):
+                    if changed:
+                        logger.debug(
+                            f"{self.list_type.value} {mal_id} had new data, resetting..."
+                        )
+                        till = int(self.till_same_limit)
+                    else:
+                        logger.debug(
+                            f"{self.list_type.value} {mal_id} matched old data, decrementing..."
+                        )
+                        till -= 1
 
         if export_file.exists():
             updated = True
             # use the XML file if that exists
-            for el in parse_xml(str(export_file)).entries:
-                if not self.has_data(el.id):
-                    self.update_entry_data(el.id)
+            self.update_entries_data(
+                [el.id for el in iter_xml(export_file) if not self.has_data(el.id)]
+            )
         if not updated:
             raise RuntimeError(
                 f"Neither {m.list_path} (lists) or {export_file} (export) exist, need one to update history"
             )
 
-        recent_history: Iterable[int] = iter(self.download_recent_user_history())
+        recent_ids = self.download_recent_user_history()
+        self._recent_ids.update(recent_ids)
+        recent_history: Iterable[int] = iter(recent_ids)
         if count is not None:
             logger.info(f"Requesting {count} first items from user history")
             recent_history = islice(recent_history, count)
         else:
             logger.info("Requesting all items from user history")
         # use selenium to go to users' history and update things watched within the last few weeks
-        for mal_id in recent_history:
-            self.update_entry_data(mal_id)
-        self._save_merged_file()
+        self.update_entries_data(recent_history)
+        if self.use_merged_file:
+            self._save_merged_file()
+        if self.skip_unchanged:
+            self._save_fingerprints()
+        # everything has been saved, nothing to resume next time
+        self.journal.clear()
 
 
 REGISTERED: set[Path] = set()
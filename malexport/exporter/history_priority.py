@@ -0,0 +1,268 @@
+"""
+Ranks entries by how likely their history is to have changed since it was
+last requested, using the list data which has already been downloaded
+
+This lets update_history spend its requests on the entries you're currently
+watching/reading or have updated recently, instead of walking the list in order,
+and skip entries whose list data hasn't changed since their history was requested
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import NamedTuple, Any
+from collections.abc import Iterable, Callable
+from datetime import datetime
+
+from ..common import Json, serialize, atomic_write_text, read_json
+from ..list_type import ListType
+from ..log import logger
+from ..parse.xml import iter_xml, AnimeXML
+from ..paths import _expand_file
+
+# entries updated within this many days get the largest recency boost,
+# which decays as the update gets older
+RECENCY_DAYS = float(os.environ.get("MALEXPORT_HISTORY_RECENCY_DAYS", 14))
+
+IN_PROGRESS_SCORE = 30.0
+RECENCY_SCORE = 50.0
+GAP_SCORE = 20.0
+MISSING_SCORE = 100.0
+
+
+class EntrySignals(NamedTuple):
+    entry_id: int
+    # currently watching/reading
+    in_progress: bool = False
+    # epoch time the list entry was last updated
+    updated_at: int | None = None
+    # episodes watched/chapters read
+    progress: int | None = None
+    # number of history rows saved for this entry, None if nothing is saved
+    history_count: int | None = None
+    # the list status, as described by the source
+    status: str | None = None
+    rewatching: bool | None = None
+    rewatch_count: int | None = None
+
+    @property
+    def fingerprint(self) -> list[Any]:
+        """
+        The parts of the list entry which change when history is added
+        """
+        return [
+            self.progress,
+            self.status,
+            self.rewatching,
+            self.rewatch_count,
+            self.updated_at,
+        ]
+
+    @property
+    def score(self) -> float:
+        """
+        Higher means the entry is more likely to have new history
+        """
+        if self.history_count is None:
+            return MISSING_SCORE
+        score = 0.0
+        if self.in_progress:
+            score += IN_PROGRESS_SCORE
+        if self.updated_at is not None:
+            age_days = max(0.0, (time.time() - self.updated_at) / 86400)
+            score += RECENCY_SCORE * RECENCY_DAYS / (RECENCY_DAYS + age_days)
+        if self.progress is not None and self.progress > self.history_count:
+            # some entries never have history for every episode (e.g. if you
+            # set the episode count directly), so this doesn't outweigh recency
+            score += GAP_SCORE
+        return score
+
+    def merge(self, other: "EntrySignals") -> "EntrySignals":
+        """
+        Combine signals from two sources, preferring values from this one
+        """
+        return EntrySignals(
+            entry_id=self.entry_id,
+            in_progress=self.in_progress or other.in_progress,
+            **{
+                field: (
+                    getattr(self, field)
+                    if getattr(self, field) is not None
+                    else getattr(other, field)
+                )
+                for field in self._fields
+                if field not in ("entry_id", "in_progress")
+            },
+        )
+
+
+def _signals_from_mal_list(
+    list_type: ListType, mlist: list[Json]
+) -> Iterable[EntrySignals]:
+    progress_key = (
+        "num_watched_episodes" if list_type == ListType.ANIME else "num_read_chapters"
+    )
+    for el in mlist:
+        updated_at = el.get("updated_at")
+        rewatching = el.get(
+            "is_rewatching" if list_type == ListType.ANIME else "is_rereading"
+        )
+        yield EntrySignals(
+            entry_id=int(el[f"{list_type.value}_id"]),
+            in_progress=el.get("status") == 1,
+            updated_at=int(updated_at) if isinstance(updated_at, int) else None,
+            progress=el.get(progress_key),
+            status=str(el["status"]) if "status" in el else None,
+            rewatching=bool(rewatching) if rewatching is not None else None,
+        )
+
+
+def _signals_from_api_list(
+    list_type: ListType, api_list_path: Path
+) -> Iterable[EntrySignals]:
+    progress_key = (
+        "num_episodes_watched" if list_type == ListType.ANIME else "num_chapters_read"
+    )
+    in_progress_status = "watching" if list_type == ListType.ANIME else "reading"
+    rewatching_key, rewatch_count_key = (
+        ("is_rewatching", "num_times_rewatched")
+        if list_type == ListType.ANIME
+        else ("is_rereading", "num_times_reread")
+    )
+    for node in read_json(api_list_path):
+        list_status = node.get("my_list_status") or {}
+        updated_at: int | None = None
+        if "updated_at" in list_status:
+            updated_at = int(
+                datetime.fromisoformat(list_status["updated_at"]).timestamp()
+            )
+        yield EntrySignals(
+            entry_id=int(node["id"]),
+            in_progress=list_status.get("status") == in_progress_status,
+            updated_at=updated_at,
+            progress=list_status.get(progress_key),
+            status=list_status.get("status"),
+            rewatching=list_status.get(rewatching_key),
+            rewatch_count=list_status.get(rewatch_count_key),
+        )
+
+
+def _signals_from_xml(list_type: ListType, xml_path: Path) -> Iterable[EntrySignals]:
+    in_progress_status = "Watching" if list_type == ListType.ANIME else "Reading"
+    for el in iter_xml(xml_path):
+        if isinstance(el, AnimeXML):
+            progress, rewatching, rewatch_count = (
+                el.watched_episodes,
+                el.rewatching,
+                el.times_watched,
+            )
+        else:
+            progress, rewatching, rewatch_count = (
+                el.read_chapters,
+                el.rereading,
+                el.times_read,
+            )
+        yield EntrySignals(
+            entry_id=el.id,
+            in_progress=el.status == in_progress_status,
+            progress=progress,
+            status=el.status,
+            rewatching=rewatching,
+            rewatch_count=rewatch_count,
+        )
+
+
+def load_signals(
+    list_type: ListType,
+    *,
+    history_count: Callable[[int], int | None],
+    mal_list: list[Json] | None = None,
+    api_list_path: Path | None = None,
+    xml_path: Path | None = None,
+) -> dict[int, EntrySignals]:
+    """
+    Combine signals from any of the sources which have been downloaded
+
+    history_count is called with each ID to get the number of saved history rows
+    """
+    signals: dict[int, EntrySignals] = {}
+    sources: list[Iterable[EntrySignals]] = []
+    # the API list has the most accurate updated_at, so its preferred
+    if api_list_path is not None and api_list_path.exists():
+        sources.append(_signals_from_api_list(list_type, api_list_path))
+    if mal_list is not None:
+        sources.append(_signals_from_mal_list(list_type, mal_list))
+    if xml_path is not None and xml_path.exists():
+        sources.append(_signals_from_xml(list_type, xml_path))
+    for source in sources:
+        for sig in source:
+            if sig.entry_id in signals:
+                signals[sig.entry_id] = signals[sig.entry_id].merge(sig)
+            else:
+                signals[sig.entry_id] = sig
+    for entry_id, sig in signals.items():
+        signals[entry_id] = sig._replace(history_count=history_count(entry_id))
+    return signals
+
+
+def prioritize(signals: dict[int, EntrySignals], entry_ids: Iterable[int]) -> list[int]:
+    """
+    Sort entry_ids by score, highest first. IDs without any signals are kept
+    at the end, in the order they were given
+    """
+    ids = list(dict.fromkeys(entry_ids))
+    order = {entry_id: i for i, entry_id in enumerate(ids)}
+    ranked = sorted(
+        ids,
+        key=lambda entry_id: (
+            -(signals[entry_id].score if entry_id in signals else -1.0),
+            order[entry_id],
+        ),
+    )
+    if ranked:
+        top = ", ".join(
+            f"{entry_id} ({signals[entry_id].score:.1f})"
+            for entry_id in ranked[:5]
+            if entry_id in signals
+        )
+        logger.debug(f"Highest priority entries: {top}")
+    return ranked
+
+
+class EntryFingerprints:
+    """
+    Saves the fingerprint of each entry when its history is requested. If the
+    list data has been updated since then and the fingerprint is the same,
+    the history can't have changed, so there's no need to request it again
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = _expand_file(path)
+        self.data: dict[str, Any] = {}
+        if self.path.exists():
+            self.data = read_json(self.path)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path}, entries={len(self.data)})"
+
+    __str__ = __repr__
+
+    def unchanged(self, signals: EntrySignals, as_of: float) -> bool:
+        """
+        as_of is when the list data the signals came from was downloaded. If
+        that was before the history was last requested, the list data could
+        be out of date, so this can't tell whether it changed
+        """
+        saved = self.data.get(str(signals.entry_id))
+        if saved is None or saved["at"] >= as_of:
+            return False
+        return bool(saved["fingerprint"] == signals.fingerprint)
+
+    def record(self, signals: EntrySignals) -> None:
+        self.data[str(signals.entry_id)] = {
+            "fingerprint": signals.fingerprint,
+            "at": int(time.time()),
+        }
+
+    def save(self) -> None:
+        atomic_write_text(self.path, serialize(self.data))
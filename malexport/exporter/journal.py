@@ -0,0 +1,99 @@
+"""
+An append-only journal of the history entries requested during a crawl
+
+If the crawl is interrupted (browser crash, captcha, Ctrl-C), the next run
+replays the journal to restore any data that wasn't saved yet, and skips
+entries which were requested recently
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+from typing import NamedTuple, TextIO
+from collections.abc import Iterator
+
+from ..common import Json, serialize, parse_json
+from ..log import logger
+from ..paths import _expand_file
+
+# entries in the journal older than this (in seconds) are still restored,
+# but are requested again since they may be out of date
+JOURNAL_MAX_AGE = int(os.environ.get("MALEXPORT_JOURNAL_MAX_AGE", 60 * 60 * 24))
+
+
+class JournalEntry(NamedTuple):
+    entry_id: int
+    at: int
+    changed: bool
+    data: Json
+
+    @property
+    def recent(self) -> bool:
+        return time.time() - self.at < JOURNAL_MAX_AGE
+
+
+class HistoryJournal:
+    """
+    Records each entry once its been requested, one JSON object per line
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = _expand_file(path)
+        self._file: TextIO | None = None
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path})"
+
+    __str__ = __repr__
+
+    def replay(self) -> Iterator[JournalEntry]:
+        """
+        Read the entries from a previous (interrupted) crawl
+        """
+        if not self.path.exists():
+            return
+        with self.path.open() as f:
+            for line in f:
+                try:
+                    blob = parse_json(line)
+                except json.JSONDecodeError:
+                    # probably a partially written last line
+                    logger.debug(f"Skipping malformed line in {self.path}")
+                    continue
+                yield JournalEntry(
+                    entry_id=int(blob["id"]),
+                    at=int(blob["at"]),
+                    changed=bool(blob["changed"]),
+                    data=blob["data"],
+                )
+
+    def record(self, entry_id: int, changed: bool, data: Json) -> None:
+        """
+        Append an entry, flushing it to disk immediately
+        """
+        if self._file is None:
+            self._file = self.path.open("a")
+        self._file.write(
+            serialize(
+                {
+                    "id": entry_id,
+                    "at": int(time.time()),
+                    "changed": changed,
+                    "data": data,
+                }
+            )
+        )
+        self._file.write("\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def clear(self) -> None:
+        """
+        Remove the journal, once the crawl has finished and the data is saved
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path.exists():
+            self.path.unlink()
@@ -9,15 +9,21 @@ mechanism that works on modern MAL lists
 import os
 import json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
 from ..list_type import ListType
-from ..common import Json, safe_request_json, logger, serialize
+from ..common import Json, safe_request_json, logger, serialize, read_json
 from ..paths import LocalDir
+from ..urls import MAL_BASE_URL
+from .sync_state import SyncState
 
 # this is order=5, which requests items that were edited by you recently
-BASE_URL = "https://myanimelist.net/{list_type}list/{username}/load.json?status=7&order=5&offset={offset}"
+BASE_URL = (
+    MAL_BASE_URL
+    + "/{list_type}list/{username}/load.json?status=7&order=5&offset={offset}"
+)
 
 LIST_USER_AGENT = os.environ.get(
     "MALEXPORT_LIST_USER_AGENT",
@@ -27,6 +33,33 @@ LIST_USER_AGENT = os.environ.get(
 
 OFFSET_CHUNK = 300
 
+# how many offset pages to request at the same time
+LIST_CONCURRENCY = int(os.environ.get("MALEXPORT_LIST_CONCURRENCY", 1))
+
+# if set, stop requesting once a page matches the saved list
+INCREMENTAL = bool(int(os.environ.get("MALEXPORT_LIST_INCREMENTAL", 0)))
+
+# the fields which change when you edit an entry on your list
+USER_FIELDS = (
+    "status",
+    "score",
+    "tags",
+    "is_rewatching",
+    "is_rereading",
+    "num_watched_episodes",
+    "num_read_chapters",
+    "num_read_volumes",
+    "start_date_string",
+    "finish_date_string",
+    "priority_string",
+    "storage_string",
+    "days_string",
+)
+
+# how many entries at the end of a page have to match the
+# saved list to assume everything after them is unchanged
+MATCH_ENTRIES = 10
+
 
 def handle_unauthorized(r: requests.Response) -> None:
     if r.status_code in [400, 403]:
@@ -47,9 +80,17 @@ class MalList:
     Requests/Updates the load.json endpoint for a particular user and list type
     """
 
-    def __init__(self, list_type: ListType, localdir: LocalDir):
+    def __init__(
+        self,
+        list_type: ListType,
+        localdir: LocalDir,
+        concurrency: int = LIST_CONCURRENCY,
+        incremental: bool = INCREMENTAL,
+    ):
         self.list_type = list_type
         self.localdir = localdir
+        self.concurrency = max(1, concurrency)
+        self.incremental = incremental
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(list_type={self.list_type}, localdir={self.localdir})"
@@ -78,32 +119,105 @@ class MalList:
         """
         if self.list_path.exists():
             try:
-                return list(json.loads(self.list_path.read_text()))
+                return list(read_json(self.list_path))
             except json.JSONDecodeError:
                 pass
         raise FileNotFoundError(f"No file found at {self.list_type.value}")
 
+    def _id(self, entry: Json) -> int:
+        return int(entry[f"{self.list_type.value}_id"])
+
+    def _matches_saved(
+        self, page: list[Json], saved_index: dict[int, int], saved: list[Json]
+    ) -> bool:
+        """
+        Whether the last few entries on this page are the same as the saved list,
+        in the same order. Since the list is ordered by when you last edited an entry,
+        everything after these is unchanged as well
+        """
+        tail = page[-MATCH_ENTRIES:]
+        if len(tail) == 0:
+            return False
+        positions: list[int] = []
+        for entry in tail:
+            pos = saved_index.get(self._id(entry))
+            if pos is None:
+                return False
+            if any(entry.get(f) != saved[pos].get(f) for f in USER_FIELDS):
+                return False
+            positions.append(pos)
+        return positions == list(range(positions[0], positions[0] + len(positions)))
+
     def update_list(self) -> None:
         """
         Paginate through all the data till you hit a chunk of data which has
         less than OFFSET_CHUNK (300) items
+
+        If concurrency is more than 1, requests that many offsets at the same time
+        (still limited by the rate limiter), and discards anything past the first short page
+
+        If incremental is set, this stops once the end of a page matches the
+        saved list, and adds the rest of the saved list after the new data. A full
+        update is still done every MALEXPORT_FULL_SWEEP_DAYS days
         """
+        sync_state = SyncState(self.localdir)
+        saved: list[Json] | None = None
+        if (
+            self.incremental
+            and self.list_path.exists()
+            and not sync_state.full_sweep_due(self.list_path.name)
+        ):
+            saved = self.load_list()
+        saved_index = (
+            {self._id(e): i for i, e in enumerate(saved)} if saved is not None else {}
+        )
+        full_sweep = True
         list_data: list[Json] = []
         # overwrite the list with new data
         offset = 0
         session = requests.Session()
         session.headers.update({"User-Agent": LIST_USER_AGENT})
-        while True:
-            url = self.offset_url(offset)
-            new_data = safe_request_json(
-                url, session=session, on_error=handle_unauthorized
-            )
-            list_data.extend(new_data)
-            if len(new_data) < OFFSET_CHUNK:
-                logger.info(
-                    f"After {offset // OFFSET_CHUNK} pages, only received {len(new_data)} (typical pages have {OFFSET_CHUNK}), stopping..."
+
+        def _request_page(page_offset: int) -> list[Json]:
+            return list(
+                safe_request_json(
+                    self.offset_url(page_offset),
+                    session=session,
+                    on_error=handle_unauthorized,
                 )
-                break
-            offset += OFFSET_CHUNK
+            )
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                offsets = [offset + i * OFFSET_CHUNK for i in range(self.concurrency)]
+                # map returns the results in the same order as the offsets
+                pages = list(executor.map(_request_page, offsets))
+                done = False
+                for page_offset, new_data in zip(offsets, pages):
+                    list_data.extend(new_data)
+                    if len(new_data) < OFFSET_CHUNK:
+                        logger.info(
+                            f"After {page_offset // OFFSET_CHUNK} pages, only received {len(new_data)} (typical pages have {OFFSET_CHUNK}), stopping..."
+                        )
+                        done = True
+                        break
+                    if saved is not None and self._matches_saved(
+                        new_data, saved_index, saved
+                    ):
+                        fetched_ids = {self._id(e) for e in list_data}
+                        logger.info(
+                            f"Page {page_offset // OFFSET_CHUNK} matches the saved list, keeping the remaining {len(saved) - len(fetched_ids & saved_index.keys())} saved entries"
+                        )
+                        list_data.extend(
+                            e for e in saved if self._id(e) not in fetched_ids
+                        )
+                        full_sweep = False
+                        done = True
+                        break
+                if done:
+                    break
+                offset += OFFSET_CHUNK * self.concurrency
         encoded_data = serialize(list_data)
         self.list_path.write_text(encoded_data)
+        if full_sweep:
+            sync_state.mark_full_sweep(self.list_path.name)
@@ -6,7 +6,9 @@ import os
 import re
 import json
 import base64
+import threading
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor, Future
 from urllib.parse import urlencode, urlparse, parse_qs
 from typing import Any, cast
 from collections.abc import Iterator
@@ -16,6 +18,7 @@ import click
 
 from ..common import safe_request
 from ..log import logger
+from ..urls import MAL_BASE_URL
 from ..paths import LocalDir
 
 
@@ -32,7 +35,10 @@ def _create_pkce_verifier() -> str:
 MALEXPORT_REDIRECT_URI = os.environ.get("MALEXPORT_REDIRECT_URI", "http://localhost")
 MALEXPORT_STATE = "malexport"
 
-LOGIN_BASE = "https://myanimelist.net/v1"
+LOGIN_BASE = f"{MAL_BASE_URL}/v1"
+
+# max amount of connections to keep open to the API
+POOL_SIZE = int(os.environ.get("MALEXPORT_API_POOL_SIZE", 10))
 
 
 class MalSession:
@@ -45,6 +51,12 @@ class MalSession:
         self.client_id = client_id
         self.localdir = localdir
         self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE
+        )
+        self.session.mount("https://", adapter)
+        # so multiple threads dont refresh the token at the same time
+        self._refresh_lock = threading.Lock()
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(username={self.localdir.username}, client_id={self.client_id})"
@@ -128,7 +140,23 @@ class MalSession:
         self.localdir.refresh_info.write_text(refresh_req.text)
         return refresh_info
 
-    def refresh_token(self) -> None:
+    def refresh_token(self, failed_authorization: str | None = None) -> None:
+        """
+        If failed_authorization (the Authorization header of the request which
+        got a 401) is given and no longer matches the session, another thread
+        already refreshed the token while this one was waiting, so this doesn't
+        refresh it again
+        """
+        with self._refresh_lock:
+            if (
+                failed_authorization is not None
+                and self.session.headers.get("Authorization") != failed_authorization
+            ):
+                logger.debug("Token was already refreshed, skipping")
+                return
+            self._refresh_token()
+
+    def _refresh_token(self) -> None:
         old_refresh_info = json.loads(self.localdir.refresh_info.read_text())
         refresh_req = self.session.post(
             LOGIN_BASE + "/oauth2/token",
@@ -155,20 +183,38 @@ class MalSession:
         """
         if req.status_code == 401:
             logger.info("Refreshing token...")
-            self.refresh_token()
+            self.refresh_token(req.request.headers.get("Authorization"))
 
-    def paginate_all_data(self, url: str) -> Iterator[Any]:
+    def paginate_all_data(self, url: str, prefetch: bool = True) -> Iterator[Any]:
         """
         Generic function that works with any MAL url which supports pagination
         Supply limit elsewhere since it may vary per request
-        """
-        while True:
-            resp = self.safe_json_request(url)
-            yield resp["data"]
-            if "paging" in resp and "next" in resp["paging"]:
-                url = resp["paging"]["next"]
-            else:
-                break
+
+        If prefetch is True, the next page is requested in the background
+        while the caller is processing the current page
+        """
+        if not prefetch:
+            while True:
+                resp = self.safe_json_request(url)
+                yield resp["data"]
+                if "paging" in resp and "next" in resp["paging"]:
+                    url = resp["paging"]["next"]
+                else:
+                    break
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future: Future[dict[str, Any]] | None = executor.submit(
+                self.safe_json_request, url
+            )
+            while future is not None:
+                resp = future.result()
+                future = None
+                if "paging" in resp and "next" in resp["paging"]:
+                    future = executor.submit(
+                        self.safe_json_request, resp["paging"]["next"]
+                    )
+                yield resp["data"]
 
     def safe_request(self, url: str, **kwargs: Any) -> requests.Response:
         """
@@ -179,7 +225,6 @@ class MalSession:
             url,
             session=self.session,
             on_error=self.refresh_token_if_expired,
-            wait_time=1,
             **kwargs,
         )
         return r
@@ -0,0 +1,112 @@
+"""
+Storage for the merged history file (e.g. anime_history.json)
+
+Instead of rewriting the entire file whenever an entry changes, changed
+entries are appended to a log next to it, which is periodically compacted
+back into the merged file in a background thread
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, TextIO
+
+from ..common import Json, serialize, atomic_write_text
+from ..log import logger
+from ..parse.history import load_merged_history, merged_history_logs
+
+# once the log has this many lines, compact it into the merged file
+COMPACT_AFTER = int(os.environ.get("MALEXPORT_HISTORY_COMPACT_AFTER", 500))
+
+
+class MergedHistory:
+    """
+    The merged history data, with changes appended to a log
+    """
+
+    def __init__(self, path: Path, compact_after: int = COMPACT_AFTER) -> None:
+        self.path = path
+        self.compacting_log_path, self.log_path = merged_history_logs(path)
+        self.compact_after = compact_after
+        self.data: dict[str, Any] = load_merged_history(self.path)
+        self._log: TextIO | None = None
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._compactor: threading.Thread | None = None
+        if self.compacting_log_path.exists() or self.log_path.exists():
+            # left over from a previous run, everything is already loaded
+            # into data so just write it to the merged file
+            self._compact()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path}, entries={len(self.data)})"
+
+    __str__ = __repr__
+
+    @property
+    def dirty(self) -> bool:
+        """If there are changes which haven't been compacted into the merged file"""
+        return self._log_lines > 0
+
+    def update(self, key: str, new_data: Json) -> bool:
+        """
+        return True if data changed, False otherwise
+        """
+        with self._lock:
+            if key in self.data and self.data[key] == new_data:
+                return False
+            self.data[key] = new_data
+            if self._log is None:
+                self._log = self.log_path.open("a")
+            self._log.write(serialize({"id": key, "data": new_data}))
+            self._log.write("\n")
+            self._log.flush()
+            self._log_lines += 1
+            if self._log_lines >= self.compact_after and not self._compacting:
+                self._compactor = threading.Thread(target=self._compact, daemon=True)
+                self._compactor.start()
+        return True
+
+    @property
+    def _compacting(self) -> bool:
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def _compact(self) -> None:
+        """
+        Write the current data to the merged file. New changes are
+        appended to a new log while this is running
+        """
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if self.log_path.exists():
+                if self.compacting_log_path.exists():
+                    # combine with the log from a previous compaction which failed
+                    with self.compacting_log_path.open("a") as f:
+                        f.write(self.log_path.read_text())
+                    self.log_path.unlink()
+                else:
+                    self.log_path.rename(self.compacting_log_path)
+            self._log_lines = 0
+            # values are replaced and never modified, so a shallow copy is enough
+            snapshot = dict(self.data)
+        total_eps = sum(len(v.get("episodes", [])) for v in snapshot.values())
+        logger.debug(
+            f"Compacting merged history into {self.path}, {len(snapshot)} entries, {total_eps} total episodes/chapters"
+        )
+        atomic_write_text(self.path, serialize(snapshot))
+        self.compacting_log_path.unlink(missing_ok=True)
+
+    def save(self) -> None:
+        """
+        Wait for any running compaction, and then compact if there are
+        changes which aren't in the merged file. Does nothing if nothing changed
+        """
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        if self.dirty or self.compacting_log_path.exists():
+            self._compact()
+        else:
+            logger.debug(f"No changes to write to {self.path}")
@@ -7,7 +7,6 @@ this info isn't accessible from the API
 
 import os
 import json
-import time
 from pathlib import Path
 from typing import Any
 from collections.abc import Iterator
@@ -17,10 +16,19 @@ import more_itertools
 from lxml import html as ht, etree  # type: ignore[import]
 from selenium.webdriver.common.by import By  # type: ignore[import]
 
-from .driver import webdriver, driver_login, wait
+from .driver import (
+    webdriver,
+    driver_login,
+    navigate,
+    Browser,
+    DriverPool,
+    DRIVER_POOL_SIZE,
+    HIDDEN_CHROMEDRIVER,
+)
 from ..log import logger
+from ..urls import MAL_BASE_URL
 from ..paths import LocalDir, _expand_path
-from ..common import Json, extract_query_value, serialize
+from ..common import Json, extract_query_value, serialize, atomic_write_text, read_json
 
 
 # if we hit these many recently updated entries which
@@ -41,6 +49,7 @@ class MessageDownloader:
         localdir: LocalDir,
         driver_type: str = "chrome",
         till_same_limit: int | None = None,
+        workers: int = DRIVER_POOL_SIZE,
     ) -> None:
         self.localdir = localdir
         # if we request this many items and there is no difference
@@ -48,15 +57,62 @@ class MessageDownloader:
         # stop requesting
         self.till_same_limit: int = int(till_same_limit or TILL_SAME_LIMIT)
         self.message_base_path: Path = _expand_path(self.localdir.data_dir / "messages")
-        self.msg_to_thread: dict[int, int] = {}
+        # message IDs -> thread IDs, saved across runs so known messages
+        # dont have to be resolved in the browser again
+        self.thread_index_path: Path = self.message_base_path / "index.json"
+        self.msg_to_thread: dict[int, int] = self.load_thread_index()
+        # threads requested by this instance, to avoid duplicates
+        self.requested_threads: set[int] = set()
 
         self.driver_type = driver_type
         self.driver = webdriver(self.driver_type)
+        # how many threads to download at the same time
+        self.workers = max(1, workers)
+        self._pool: DriverPool | None = None
+
+    @property
+    def pool(self) -> DriverPool:
+        """
+        A pool of logged in browsers, used to download threads in parallel
+        """
+        if self._pool is None:
+            self._pool = DriverPool(
+                self.workers,
+                localdir=self.localdir,
+                browser_type=self.driver_type,
+                headless=HIDDEN_CHROMEDRIVER,
+                logged_in=self._logged_in_driver,
+            )
+        return self._pool
 
     def authenticate(self) -> None:
         """Logs in to MAL using your MAL username/password"""
         driver_login(webdriver=self.driver, localdir=self.localdir)
 
+    def _logged_in_driver(self) -> Browser:
+        """The main browser, logged in, to copy cookies from to the pool"""
+        self.authenticate()
+        return self.driver
+
+    def load_thread_index(self) -> dict[int, int]:
+        """
+        Load the saved message ID -> thread ID mapping, if it exists
+        """
+        if not self.thread_index_path.exists():
+            return {}
+        try:
+            data = read_json(self.thread_index_path)
+        except json.JSONDecodeError:
+            logger.warning(f"Could not parse {self.thread_index_path}, ignoring...")
+            return {}
+        return {int(k): int(v) for k, v in data.items()}
+
+    def save_thread_index(self) -> None:
+        atomic_write_text(
+            self.thread_index_path,
+            serialize({str(k): v for k, v in self.msg_to_thread.items()}),
+        )
+
     def entry_path(self, thread_id: int) -> Path:
         """Location of the JSON file for this thread"""
         return self.message_base_path / f"{thread_id}.json"
@@ -105,11 +161,11 @@ class MessageDownloader:
         logger.info(
             f"Downloading page {page} of your {'sent ' if sent else ''}messages"
         )
-        time.sleep(1)
         offset = (page - 1) * 20
-        message_url = f"https://myanimelist.net/mymessages.php?go={'sent' if sent else ''}&show={offset}"
-        self.driver.get(message_url)
-        wait()
+        message_url = (
+            f"{MAL_BASE_URL}/mymessages.php?go={'sent' if sent else ''}&show={offset}"
+        )
+        navigate(self.driver, message_url)
         # extract id=349234 from each message URL
         return [
             int(str(extract_query_value(a.get_attribute("href"), "id")))
@@ -135,47 +191,94 @@ class MessageDownloader:
                 return
             page += 1
 
-    def _resolve_message_to_thread_id(self, message_id: int, sent: bool) -> int:
+    def _resolve_message_to_thread_id(
+        self, message_id: int, sent: bool, driver: Browser | None = None
+    ) -> int:
         """
         goes to a message ID page and clicks the 'view message history' button
         returns the thread ID this corresponds to
+        If driver is not supplied, uses the main browser
         """
-        time.sleep(1)
+        if driver is None:
+            driver = self.driver
         url: str = (
-            f"https://myanimelist.net/mymessages.php?go=read&id={message_id}{'&f=1' if sent else ''}"
+            f"{MAL_BASE_URL}/mymessages.php?go=read&id={message_id}{'&f=1' if sent else ''}"
         )
         logger.debug(f"Resolving message ID {message_id} to thread...")
         logger.debug(f"Navigating to '{url}'")
-        self.driver.get(url)
-        wait()
-        thread_link = self.driver.find_element(
-            By.PARTIAL_LINK_TEXT, "View Message History"
-        )
+        navigate(driver, url)
+        thread_link = driver.find_element(By.PARTIAL_LINK_TEXT, "View Message History")
         thread_url = thread_link.get_attribute("href")
         logger.debug(f"Thread URL is {thread_url}")
         assert thread_url is not None, "Could not find thread URL"
-        self.driver.get(thread_url)
-        wait()
+        navigate(driver, thread_url)
         return int(str(extract_query_value(thread_url, "threadid")))
 
-    def update_thread_data(self, thread_id: int) -> bool:
+    def _thread_page_data(self, driver: Browser | None = None) -> Json:
+        """
+        Extract the thread data from the thread page the browser is on
+        """
+        if driver is None:
+            driver = self.driver
+        thread_content = driver.find_element(By.ID, "content")
+        assert thread_content is not None, "Could not find thread div with ID 'content'"
+        return self._extract_details(thread_content.get_attribute("innerHTML"))
+
+    def _download_message_thread(
+        self, driver: Browser, message: tuple[bool, int]
+    ) -> tuple[int, Json]:
+        sent, message_id = message
+        thread_id = self._resolve_message_to_thread_id(
+            message_id, sent=sent, driver=driver
+        )
+        return thread_id, self._thread_page_data(driver)
+
+    def _is_saved(self, message_id: int) -> bool:
+        """
+        If this message was already resolved to a thread, and that thread was saved
+        """
+        thread_id = self.msg_to_thread.get(message_id)
+        return thread_id is not None and self.entry_path(thread_id).exists()
+
+    def _prefetch_threads(
+        self, messages: list[tuple[bool, int]]
+    ) -> dict[int, tuple[int, Json]]:
+        """
+        If using multiple workers, download the threads for any unsaved messages
+        in parallel. Returns message ID -> (thread ID, thread data)
+        """
+        if self.workers <= 1:
+            return {}
+        unsaved = [(sent, mid) for sent, mid in messages if not self._is_saved(mid)]
+        if not unsaved:
+            return {}
+        return {
+            mid: result
+            for (_, mid), result in zip(
+                unsaved, self.pool.map(self._download_message_thread, unsaved)
+            )
+        }
+
+    def update_thread_data(self, thread_id: int, new_data: Json | None = None) -> bool:
         """
         This returns a bool which signifies if data was changed
         If any data was changed/this is new, this returns True
         If data was the same as last time, it returns False
+
+        If new_data is not supplied, extracts it from the page the main browser is on
         """
-        if thread_id in self.msg_to_thread.values():
+        if thread_id in self.requested_threads:
             logger.debug(f"thread {thread_id} has already been requested, skipping...")
             return False
+        self.requested_threads.add(thread_id)
         p = self.entry_path(thread_id)
-        # at this point, we're already on the thread page
-        thread_content = self.driver.find_element(By.ID, "content")
-        assert thread_content is not None, "Could not find thread div with ID 'content'"
-        new_data = self._extract_details(thread_content.get_attribute("innerHTML"))
+        if new_data is None:
+            # at this point, we're already on the thread page
+            new_data = self._thread_page_data()
         # assume this is new data
         has_new_data = True
         if p.exists():
-            old_data = json.loads(p.read_text())
+            old_data = read_json(p)
             # if these aren't the same, the data has changed,
             # we should keep searching for more threads
             has_new_data = old_data != new_data
@@ -194,25 +297,54 @@ class MessageDownloader:
         )
         till = int(till_base)
 
-        for sent, message_id in self.iter_message_ids(start_page=start_page):
-            if till <= 0:
-                break
-            # resolve message ID to thread, which is what we download
-            thread_id: int = self._resolve_message_to_thread_id(message_id, sent=sent)
-            logger.info(f"msg {message_id} -> thread {thread_id}")
-            # keep track of if this is a new thread, so we can decrement the 'till same' counter
-            new_thread_id: bool = thread_id not in self.msg_to_thread.values()
-            if self.update_thread_data(thread_id):
-                logger.debug(
-                    f"msg id {message_id}, thread {thread_id} had new data, resetting..."
-                )
-                till = int(till_base)
-            else:
-                if new_thread_id:
-                    logger.debug(
-                        f"msg id {message_id} thread {thread_id} matched old data, decrementing..."
-                    )
-                    till -= 1
-            logger.info(f"requesting {till} more threads...")
-            # save thread id so subsequent iterations dont repeat
-            self.msg_to_thread[message_id] = thread_id
+        try:
+            # if using multiple workers, download threads for that many messages at a time
+            for chunk in more_itertools.chunked(
+                self.iter_message_ids(start_page=start_page), self.workers
+            ):
+                if till <= 0:
+                    break
+                prefetched = self._prefetch_threads(chunk)
+                for sent, message_id in chunk:
+                    if till <= 0:
+                        break
+                    thread_id: int
+                    changed: bool
+                    if self._is_saved(message_id):
+                        # this message was already saved as part of this thread, so it
+                        # hasn't changed. any new messages in the thread would have new IDs
+                        thread_id = self.msg_to_thread[message_id]
+                        logger.info(f"msg {message_id} -> thread {thread_id} (saved)")
+                        # keep track of if this is a new thread, so we can decrement the 'till same' counter
+                        new_thread_id = thread_id not in self.requested_threads
+                        self.requested_threads.add(thread_id)
+                        changed = False
+                    elif message_id in prefetched:
+                        thread_id, thread_data = prefetched[message_id]
+                        logger.info(f"msg {message_id} -> thread {thread_id}")
+                        new_thread_id = thread_id not in self.requested_threads
+                        changed = self.update_thread_data(thread_id, thread_data)
+                    else:
+                        # resolve message ID to thread, which is what we download
+                        thread_id = self._resolve_message_to_thread_id(
+                            message_id, sent=sent
+                        )
+                        logger.info(f"msg {message_id} -> thread {thread_id}")
+                        new_thread_id = thread_id not in self.requested_threads
+                        changed = self.update_thread_data(thread_id)
+                    if changed:
+                        logger.debug(
+                            f"msg id {message_id}, thread {thread_id} had new data, resetting..."
+                        )
+                        till = int(till_base)
+                    else:
+                        if new_thread_id:
+                            logger.debug(
+                                f"msg id {message_id} thread {thread_id} matched old data, decrementing..."
+                            )
+                            till -= 1
+                    logger.info(f"requesting {till} more threads...")
+                    # save thread id so subsequent iterations/runs dont repeat
+                    self.msg_to_thread[message_id] = thread_id
+        finally:
+            self.save_thread_index()
@@ -0,0 +1,51 @@
+"""
+Keeps track of when each list was last fully updated, so incremental
+updates can periodically fall back to a full update. That catches anything
+an incremental update can't see, like entries removed from your list
+"""
+
+import os
+import json
+import time
+from typing import Any
+
+from ..common import serialize, atomic_write_text, read_json
+from ..log import logger
+from ..paths import LocalDir
+
+# do a full update if the last one was more than this many days ago
+FULL_SWEEP_DAYS = float(os.environ.get("MALEXPORT_FULL_SWEEP_DAYS", 7))
+
+
+class SyncState:
+    def __init__(self, localdir: LocalDir, full_sweep_days: float = FULL_SWEEP_DAYS):
+        self.localdir = localdir
+        self.path = self.localdir.data_dir / "sync_state.json"
+        self.full_sweep_days = full_sweep_days
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path})"
+
+    __str__ = __repr__
+
+    def _load(self) -> dict[str, Any]:
+        if self.path.exists():
+            try:
+                return dict(read_json(self.path))
+            except json.JSONDecodeError:
+                logger.warning(f"Could not parse {self.path}, ignoring")
+        return {}
+
+    def full_sweep_due(self, key: str) -> bool:
+        """
+        Whether the list saved to key hasn't had a full update recently
+        """
+        last = self._load().get(key, {}).get("full_sweep_at")
+        if last is None:
+            return True
+        return bool(time.time() - last > self.full_sweep_days * 86400)
+
+    def mark_full_sweep(self, key: str) -> None:
+        data = self._load()
+        data.setdefault(key, {})["full_sweep_at"] = int(time.time())
+        atomic_write_text(self.path, serialize(data))
@@ -0,0 +1,247 @@
+"""
+An optional on-disk cache for GET requests made with safe_request
+
+Responses are keyed by the URL and the identity making the request (the
+Authorization header and cookies), so different accounts never share entries.
+A cached response is used without a request while it's younger than the TTL
+for that endpoint. After that, if the server sent an ETag/Last-Modified
+header, the request is made conditionally and a 304 reuses the cached body
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .log import logger
+from .paths import cache_dir, _expand_path
+
+HTTP_CACHE = bool(int(os.environ.get("MALEXPORT_HTTP_CACHE", 0)))
+HTTP_CACHE_DIR = os.environ.get(
+    "MALEXPORT_HTTP_CACHE_DIR", os.path.join(cache_dir, "malexport", "http")
+)
+# once the cache is larger than this, the least recently used responses are removed
+HTTP_CACHE_MAX_MB = float(os.environ.get("MALEXPORT_HTTP_CACHE_MAX_MB", 200))
+
+# how long (in seconds) a response can be used without revalidating it, by
+# matching the host and path. The first matching pattern is used. A TTL of 0 means
+# the response is always revalidated, which only helps if the server sends an ETag
+DEFAULT_TTLS: list[tuple[str, int]] = [
+    (r"api\.jikan\.moe/", 60 * 60 * 24),
+    (r"api\.myanimelist\.net/v2/(anime|manga)/\d+", 60 * 60 * 24),
+    # the list of topics. the topic pages themselves are always revalidated, since
+    # they're only requested once the index shows they've changed, and
+    # saving a stale page would mark the topic as up to date
+    (r"api\.myanimelist\.net/v2/forum/topics\?", 60 * 60),
+    (r".*", 0),
+]
+
+
+def _parse_ttls(spec: str) -> list[tuple[str, int]]:
+    """
+    Parse MALEXPORT_HTTP_CACHE_TTLS, like 'api.jikan.moe/=3600,myanimelist.net/=0'
+    These are matched before the defaults
+    """
+    ttls: list[tuple[str, int]] = []
+    for part in spec.split(","):
+        if part.strip():
+            pattern, _, seconds = part.strip().rpartition("=")
+            ttls.append((re.escape(pattern), int(seconds)))
+    return ttls
+
+
+TTLS = _parse_ttls(os.environ.get("MALEXPORT_HTTP_CACHE_TTLS", "")) + DEFAULT_TTLS
+
+
+class CachedResponse(NamedTuple):
+    key: str
+    url: str
+    status_code: int
+    headers: dict[str, str]
+    stored_at: float
+    body_path: Path
+
+    @property
+    def validators(self) -> dict[str, str]:
+        """Headers to make a conditional request for this response"""
+        headers: dict[str, str] = {}
+        if "ETag" in self.headers:
+            headers["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return headers
+
+    def to_response(self) -> requests.Response:
+        resp = requests.Response()
+        resp.status_code = self.status_code
+        resp._content = self.body_path.read_bytes()
+        resp.headers = CaseInsensitiveDict(self.headers)
+        resp.url = self.url
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        return resp
+
+
+def _identity(session: requests.Session, headers: Any) -> str:
+    auth = (headers or {}).get("Authorization") or session.headers.get(
+        "Authorization", ""
+    )
+    cookies = sorted(f"{c.name}={c.value}" for c in session.cookies)
+    return hashlib.sha256(f"{auth!r}{cookies}".encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        cache_dir: str | Path = HTTP_CACHE_DIR,
+        max_mb: float = HTTP_CACHE_MAX_MB,
+        ttls: list[tuple[str, int]] = TTLS,
+    ) -> None:
+        self.cache_dir = _expand_path(cache_dir)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(cache_dir={self.cache_dir})"
+
+    __str__ = __repr__
+
+    def ttl(self, url: str) -> int:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def key(
+        self, method: str, url: str, session: requests.Session, headers: Any
+    ) -> str:
+        return hashlib.sha256(
+            f"{method} {url} {_identity(session, headers)}".encode()
+        ).hexdigest()
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def get(self, key: str) -> CachedResponse | None:
+        meta_path, body_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not body_path.exists():
+            return None
+        # mark as recently used, for eviction
+        os.utime(body_path)
+        return CachedResponse(
+            key=key,
+            url=meta["url"],
+            status_code=meta["status_code"],
+            headers=meta["headers"],
+            stored_at=meta["stored_at"],
+            body_path=body_path,
+        )
+
+    def is_fresh(self, cached: CachedResponse) -> bool:
+        return time.time() - cached.stored_at < self.ttl(cached.url)
+
+    def store(self, key: str, resp: requests.Response) -> None:
+        """
+        Save a successful response, unless the server asked not to, or
+        it could never be used (always revalidated, but it has no ETag/Last-Modified)
+        """
+        if "no-store" in resp.headers.get("Cache-Control", ""):
+            return
+        if self.ttl(resp.url) <= 0 and not (
+            "ETag" in resp.headers or "Last-Modified" in resp.headers
+        ):
+            return
+        meta_path, body_path = self._paths(key)
+        body = resp.content
+        self._write(body_path, body)
+        self._write(
+            meta_path,
+            json.dumps(
+                {
+                    "url": resp.url,
+                    "status_code": resp.status_code,
+                    "headers": dict(resp.headers),
+                    "stored_at": time.time(),
+                }
+            ).encode(),
+        )
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += len(body)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def touch(self, cached: CachedResponse) -> None:
+        """
+        The server responded with 304, so the cached response is fresh again
+        """
+        meta_path, _ = self._paths(cached.key)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, json.JSONDecodeError):
+            return
+        meta["stored_at"] = time.time()
+        self._write(meta_path, json.dumps(meta).encode())
+
+    def _write(self, path: Path, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _disk_usage(self) -> int:
+        return sum(p.stat().st_size for p in self.cache_dir.glob("*.body"))
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used responses till the
+        cache is under 90% of the maximum size
+        """
+        with self._lock:
+            bodies = sorted(
+                ((p, p.stat()) for p in self.cache_dir.glob("*.body")),
+                key=lambda ps: ps[1].st_mtime,
+            )
+            size = sum(st.st_size for _, st in bodies)
+            target = int(self.max_bytes * 0.9)
+            removed = 0
+            for body_path, st in bodies:
+                if size <= target:
+                    break
+                body_path.with_suffix(".json").unlink(missing_ok=True)
+                body_path.unlink(missing_ok=True)
+                size -= st.st_size
+                removed += 1
+            self._size = size
+        logger.debug(f"Evicted {removed} responses from {self.cache_dir}")
+
+    def clear(self) -> None:
+        with self._lock:
+            for p in self.cache_dir.iterdir():
+                if p.suffix in (".json", ".body"):
+                    p.unlink(missing_ok=True)
+            self._size = 0
+
+
+RESPONSE_CACHE: ResponseCache | None = ResponseCache() if HTTP_CACHE else None
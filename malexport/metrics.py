@@ -0,0 +1,305 @@
+"""
+Records every request (made with safe_request, or a page load in the browser)
+and any time spent sleeping, so a slow run can be attributed to MAL latency,
+retries, the rate limiter or our own waits
+
+The update commands save a JSON summary to data_dir/metrics/{command}.json, and if
+MALEXPORT_METRICS_TEXTFILE_DIR is set, a Prometheus textfile (for node_exporter's
+textfile collector) to that directory
+"""
+
+import os
+import re
+import time
+import threading
+from pathlib import Path
+from typing import Any, NamedTuple
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from .log import logger
+from .paths import _expand_file, _expand_path
+
+Json = Any
+
+TEXTFILE_DIR: str | None = os.environ.get("MALEXPORT_METRICS_TEXTFILE_DIR")
+
+# replace IDs/usernames in paths, so requests are grouped by endpoint
+ENDPOINT_PATTERNS: list[tuple[re.Pattern[str], str]] = [
+    (re.compile(r"/(anime|manga)list/[^/]+/"), r"/\1list/{user}/"),
+    (re.compile(r"/(users|history|profile)/[^/]+"), r"/\1/{user}"),
+    (re.compile(r"/\d+(?=/|$)"), "/{id}"),
+]
+
+
+def endpoint(url: str) -> str:
+    """
+    The host and path for a URL, with IDs and usernames removed
+    """
+    parts = urlsplit(url)
+    host = parts.netloc.casefold()
+    if host.startswith("www."):
+        host = host[len("www.") :]
+    path = parts.path
+    for pattern, repl in ENDPOINT_PATTERNS:
+        path = pattern.sub(repl, path)
+    return host + path
+
+
+class RequestRecord(NamedTuple):
+    endpoint: str
+    method: str
+    # None if the request failed without a response, or for browser page loads
+    status: int | None
+    # seconds waiting for the response
+    elapsed: float
+    size: int
+    # seconds the rate limiter waited before this request
+    waited: float
+    # requests, browser or cache
+    source: str
+
+    @property
+    def failed(self) -> bool:
+        if self.source == "browser":
+            return self.status is not None and self.status >= 400
+        return self.status is None or self.status >= 400
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class MetricsRecorder:
+    """
+    Collects request records, retries and sleeps. This is process-wide, the
+    update commands call start before running and save once they're done
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.requests: list[RequestRecord] = []
+            # endpoint -> retries, and seconds waited before retrying
+            self.retries: Counter[str] = Counter()
+            self.retry_wait: defaultdict[str, float] = defaultdict(float)
+            # reason -> seconds slept
+            self.sleeps: defaultdict[str, float] = defaultdict(float)
+
+    def record_request(
+        self,
+        url: str,
+        *,
+        method: str = "GET",
+        status: int | None,
+        elapsed: float,
+        size: int = 0,
+        waited: float = 0.0,
+        source: str = "requests",
+    ) -> None:
+        record = RequestRecord(
+            endpoint=endpoint(url),
+            method=method,
+            status=status,
+            elapsed=elapsed,
+            size=size,
+            waited=waited,
+            source=source,
+        )
+        with self._lock:
+            self.requests.append(record)
+
+    def record_retry(self, url: str, wait: float) -> None:
+        with self._lock:
+            self.retries[endpoint(url)] += 1
+            self.retry_wait[endpoint(url)] += wait
+
+    def sleep(self, seconds: float, reason: str) -> None:
+        """
+        time.sleep, recording why we waited
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.sleeps[reason] += seconds
+        time.sleep(seconds)
+
+    def summary(self) -> Json:
+        with self._lock:
+            requests = list(self.requests)
+            retries = Counter(self.retries)
+            retry_wait = dict(self.retry_wait)
+            sleeps = dict(self.sleeps)
+        by_endpoint: defaultdict[str, list[RequestRecord]] = defaultdict(list)
+        for r in requests:
+            by_endpoint[r.endpoint].append(r)
+        endpoints: dict[str, Any] = {}
+        for name, records in sorted(by_endpoint.items()):
+            latencies = [r.elapsed for r in records if r.source != "cache"]
+            endpoints[name] = {
+                "requests": len(records),
+                "errors": sum(r.failed for r in records),
+                "cached": sum(r.source == "cache" for r in records),
+                "status": dict(
+                    Counter(str(r.status) for r in records if r.status is not None)
+                ),
+                "bytes": sum(r.size for r in records),
+                "latency": {
+                    "total": round(sum(latencies), 3),
+                    "mean": (
+                        round(sum(latencies) / len(latencies), 3) if latencies else 0.0
+                    ),
+                    "p50": round(_percentile(latencies, 0.5), 3),
+                    "p95": round(_percentile(latencies, 0.95), 3),
+                    "max": round(max(latencies, default=0.0), 3),
+                },
+                "rate_limit_wait": round(sum(r.waited for r in records), 3),
+                "retries": retries.get(name, 0),
+                "retry_wait": round(retry_wait.get(name, 0.0), 3),
+            }
+        finished_at = time.time()
+        return {
+            "started_at": int(self.started_at),
+            "finished_at": int(finished_at),
+            "duration": round(finished_at - self.started_at, 3),
+            "requests": len(requests),
+            "errors": sum(r.failed for r in requests),
+            "bytes": sum(r.size for r in requests),
+            "request_time": round(sum(r.elapsed for r in requests), 3),
+            "rate_limit_wait": round(sum(r.waited for r in requests), 3),
+            "retries": sum(retries.values()),
+            "retry_wait": round(sum(retry_wait.values()), 3),
+            "sleeps": {k: round(v, 3) for k, v in sorted(sleeps.items())},
+            "endpoints": endpoints,
+        }
+
+    def save(
+        self,
+        path: Path,
+        *,
+        command: str,
+        username: str,
+        success: bool = True,
+        textfile_dir: str | None = TEXTFILE_DIR,
+    ) -> Json:
+        """
+        Write the JSON summary to path, and a Prometheus textfile if textfile_dir is set
+        """
+        # common imports this module, for safe_request
+        from .common import serialize, atomic_write_text
+
+        summary = self.summary()
+        summary.update({"command": command, "username": username, "success": success})
+        atomic_write_text(_expand_file(path), serialize(summary))
+        logger.info(
+            f"{command}: {summary['requests']} requests ({summary['errors']} errors) in {summary['duration']:.1f}s, "
+            f"{summary['request_time']:.1f}s waiting on responses, {summary['rate_limit_wait']:.1f}s rate limited, "
+            f"{summary['retry_wait']:.1f}s backing off, {sum(summary['sleeps'].values()):.1f}s sleeping"
+        )
+        if textfile_dir is not None:
+            textfile = (
+                _expand_path(textfile_dir) / f"malexport_{command}_{username}.prom"
+            )
+            atomic_write_text(textfile, prometheus_text(summary))
+        return summary
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text(summary: Json) -> str:
+    """
+    Convert a summary to the Prometheus text exposition format
+
+    Each file is replaced by the next run, so these are all gauges
+    describing the last run, not counters
+    """
+    base = {"command": summary["command"], "username": summary["username"]}
+    metrics: dict[str, tuple[str, str, list[tuple[dict[str, str], float]]]] = {
+        "malexport_run_duration_seconds": ("gauge", "how long the run took", []),
+        "malexport_run_finished_timestamp_seconds": (
+            "gauge",
+            "when the run finished",
+            [],
+        ),
+        "malexport_run_success": (
+            "gauge",
+            "1 if the run finished without an error",
+            [],
+        ),
+        "malexport_requests": (
+            "gauge",
+            "requests in the last run, by endpoint/status",
+            [],
+        ),
+        "malexport_request_seconds": (
+            "gauge",
+            "seconds waiting on responses in the last run",
+            [],
+        ),
+        "malexport_request_bytes": ("gauge", "bytes received in the last run", []),
+        "malexport_rate_limit_wait_seconds": (
+            "gauge",
+            "seconds the rate limiter waited before requests in the last run",
+            [],
+        ),
+        "malexport_retries": (
+            "gauge",
+            "requests which were retried in the last run",
+            [],
+        ),
+        "malexport_retry_wait_seconds": (
+            "gauge",
+            "seconds waited before retrying requests in the last run",
+            [],
+        ),
+        "malexport_sleep_seconds": ("gauge", "other seconds slept in the last run", []),
+    }
+
+    def add(name: str, value: float, **labels: str) -> None:
+        metrics[name][2].append(({**base, **labels}, value))
+
+    add("malexport_run_duration_seconds", summary["duration"])
+    add("malexport_run_finished_timestamp_seconds", summary["finished_at"])
+    add("malexport_run_success", 1 if summary["success"] else 0)
+    for name, data in summary["endpoints"].items():
+        for status, count in data["status"].items():
+            add("malexport_requests", count, endpoint=name, status=status)
+        no_status = data["requests"] - sum(data["status"].values())
+        if no_status > 0:
+            add("malexport_requests", no_status, endpoint=name, status="none")
+        add("malexport_request_seconds", data["latency"]["total"], endpoint=name)
+        add("malexport_request_bytes", data["bytes"], endpoint=name)
+        add(
+            "malexport_rate_limit_wait_seconds",
+            data["rate_limit_wait"],
+            endpoint=name,
+        )
+        add("malexport_retries", data["retries"], endpoint=name)
+        add("malexport_retry_wait_seconds", data["retry_wait"], endpoint=name)
+    for reason, seconds in summary["sleeps"].items():
+        add("malexport_sleep_seconds", seconds, reason=reason)
+
+    lines: list[str] = []
+    for name, (kind, help_text, samples) in metrics.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(**labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# global, shared by everything in this process
+METRICS = MetricsRecorder()
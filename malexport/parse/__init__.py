@@ -1,4 +1,4 @@
-from .xml import parse_xml
+from .xml import parse_xml, iter_xml
 from .mal_list import parse_file as parse_list
 from .forum import iter_forum_posts
 from .history import iter_user_history
@@ -10,6 +10,7 @@ from .messages import iter_user_threads
 
 __all__ = [
     "parse_xml",
+    "iter_xml",
     "parse_list",
     "iter_forum_posts",
     "iter_user_history",
@@ -1,13 +1,14 @@
-import json
 from typing import NamedTuple, TypeVar, Any
 from collections.abc import Iterator
 from datetime import date, datetime
 
 from .common import parse_date_safe
 from ..list_type import ListType
-from ..common import Json
+from ..common import Json, iter_json_array
 from ..paths import PathIsh, _expand_file
 from .mal_list import IdInfo, Season
+from ..api_metadata import MetadataStore, metadata_path, is_slim
+from ..log import logger
 
 T = TypeVar("T")
 
@@ -72,7 +73,33 @@ class Entry(NamedTuple):
         )
 
 
-def iter_api_list(json_file: PathIsh, list_type: ListType) -> Iterator[Entry]:
-    data = json.loads(_expand_file(json_file).read_text())
+def iter_api_list(
+    json_file: PathIsh, list_type: ListType, metadata_file: PathIsh | None = None
+) -> Iterator[Entry]:
+    """
+    If the list file only has the list status for each entry (when using
+    MALEXPORT_SHARED_API_METADATA), the metadata is joined from metadata_file,
+    which defaults to the shared metadata store in the data directory. Entries
+    without metadata are skipped
+    """
+    json_path = _expand_file(json_file)
+    data = iter_json_array(json_path)
+    store: MetadataStore | None = None
+    missing = 0
     for el in data:
+        if is_slim(el):
+            if store is None:
+                store = MetadataStore(
+                    _expand_file(metadata_file)
+                    if metadata_file is not None
+                    # the list file is in application_base/username
+                    else metadata_path(json_path.parent.parent, list_type)
+                )
+            joined = store.join(el)
+            if joined is None:
+                missing += 1
+                continue
+            el = joined
         yield Entry._parse(el, list_type)
+    if missing > 0:
+        logger.warning(f"No metadata found for {missing} entries in {json_path}")
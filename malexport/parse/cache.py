@@ -0,0 +1,213 @@
+"""
+An optional on-disk cache for the results of combine
+
+Each account's results are pickled to one file in MALEXPORT_PARSE_CACHE_DIR,
+along with a fingerprint of every file combine reads (the path, size and
+modification time, or a hash of the contents if MALEXPORT_PARSE_CACHE_HASH is set).
+If none of those files have changed, the results are loaded from the pickle
+instead of parsing everything again
+"""
+
+import os
+import gc
+import pickle
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any
+from collections.abc import Iterator
+from contextlib import contextmanager
+from importlib.metadata import version, PackageNotFoundError
+
+from ..log import logger
+from ..list_type import ListType
+from ..paths import cache_dir, _expand_path
+from ..api_metadata import metadata_path
+from .history import merged_history_logs
+
+PARSE_CACHE = bool(int(os.environ.get("MALEXPORT_PARSE_CACHE", 0)))
+PARSE_CACHE_DIR = os.environ.get(
+    "MALEXPORT_PARSE_CACHE_DIR", os.path.join(cache_dir, "malexport", "combine")
+)
+# once the cache is larger than this, the least recently used results are removed
+PARSE_CACHE_MAX_MB = float(os.environ.get("MALEXPORT_PARSE_CACHE_MAX_MB", 100))
+# compare files by a hash of their contents instead of the modification time
+PARSE_CACHE_HASH = bool(int(os.environ.get("MALEXPORT_PARSE_CACHE_HASH", 0)))
+
+# bump this if the parsed types change, so old pickles aren't used
+CACHE_VERSION = 1
+
+Fingerprint = tuple[Any, ...]
+
+
+def _package_version() -> str:
+    try:
+        return version("malexport")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def _source_files(data_dir: Path) -> list[Path]:
+    """
+    The files combine reads, whether or not they exist
+    """
+    files = [data_dir / "manual_history.yaml"]
+    for list_type in ListType:
+        name = list_type.value
+        merged_history_file = data_dir / f"{name}_history.json"
+        files.extend(
+            [
+                data_dir / f"{name}list.xml",
+                data_dir / f"{name}list.json",
+                data_dir / f"{name}list_api.json",
+                # if the API list only has list statuses, this has the metadata
+                metadata_path(data_dir.parent, list_type),
+                merged_history_file,
+                *merged_history_logs(merged_history_file),
+            ]
+        )
+        history_dir = data_dir / "history" / name
+        if history_dir.exists():
+            files.extend(sorted(history_dir.glob("*.json")))
+    return files
+
+
+def _hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(data_dir: Path, hash_contents: bool = PARSE_CACHE_HASH) -> Fingerprint:
+    """
+    Describes the current state of the files combine reads,
+    if this changes the cached results are out of date
+    """
+    parts: list[Any] = [CACHE_VERSION, _package_version()]
+    for path in _source_files(data_dir):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            parts.append((str(path), None))
+            continue
+        if hash_contents:
+            parts.append((str(path), st.st_size, _hash_file(path)))
+        else:
+            parts.append((str(path), st.st_size, st.st_mtime_ns))
+    return tuple(parts)
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    The results are lots of small objects, which would trigger the garbage
+    collector many times while they're loaded without freeing anything
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class ParseCache:
+    def __init__(
+        self,
+        cache_dir: str | Path = PARSE_CACHE_DIR,
+        max_mb: float = PARSE_CACHE_MAX_MB,
+        hash_contents: bool = PARSE_CACHE_HASH,
+    ) -> None:
+        self.cache_dir = _expand_path(cache_dir)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hash_contents = hash_contents
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(cache_dir={self.cache_dir})"
+
+    __str__ = __repr__
+
+    def path(self, username: str, data_dir: Path) -> Path:
+        key = hashlib.sha256(f"{username} {data_dir.absolute()}".encode()).hexdigest()
+        return self.cache_dir / f"{key}.pickle"
+
+    def get(self, username: str, data_dir: Path) -> tuple[Fingerprint, Any | None]:
+        """
+        Returns the current fingerprint for data_dir, and the
+        cached results if they were saved with the same fingerprint
+        """
+        current = fingerprint(data_dir, self.hash_contents)
+        path = self.path(username, data_dir)
+        try:
+            with path.open("rb") as f:
+                # the fingerprint is pickled first, so the results
+                # don't have to be loaded if they're out of date
+                if pickle.load(f) != current:
+                    logger.debug(f"{path} is out of date")
+                    return current, None
+                with _gc_paused():
+                    data = pickle.load(f)
+        except FileNotFoundError:
+            return current, None
+        except Exception as e:
+            # e.g. the types changed since this was saved
+            logger.debug(f"Couldn't load {path}: {e}")
+            path.unlink(missing_ok=True)
+            return current, None
+        # mark as recently used, for eviction
+        os.utime(path)
+        logger.debug(f"Loaded combined data from {path}")
+        return current, data
+
+    def store(
+        self, username: str, data_dir: Path, current: Fingerprint, data: Any
+    ) -> None:
+        path = self.path(username, data_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(current, f, protocol=pickle.HIGHEST_PROTOCOL)
+                with _gc_paused():
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        logger.debug(f"Saved combined data to {path}")
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used results till the
+        cache is under the maximum size
+        """
+        with self._lock:
+            pickles = sorted(
+                ((p, p.stat()) for p in self.cache_dir.glob("*.pickle")),
+                key=lambda ps: ps[1].st_mtime,
+            )
+            size = sum(st.st_size for _, st in pickles)
+            removed = 0
+            # always keep the most recent, even if it's larger than the maximum
+            for path, st in pickles[:-1]:
+                if size <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                size -= st.st_size
+                removed += 1
+        if removed > 0:
+            logger.debug(f"Evicted {removed} results from {self.cache_dir}")
+
+    def invalidate(self, username: str, data_dir: Path) -> None:
+        self.path(username, data_dir).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            for p in self.cache_dir.glob("*.pickle"):
+                p.unlink(missing_ok=True)
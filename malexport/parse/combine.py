@@ -19,7 +19,8 @@ from .mal_list import (
     parse_file as parse_user_history,
 )
 from .api_list import iter_api_list, Entry
-from .xml import AnimeXML, MangaXML, parse_xml
+from .xml import AnimeXML, MangaXML, iter_xml
+from .cache import ParseCache, PARSE_CACHE
 
 
 T = TypeVar("T")
@@ -124,13 +125,53 @@ class MangaData(NamedTuple):
 CombineResults = tuple[list[AnimeData], list[MangaData]]
 
 
-def combine(username: str, data_dir: Path | None = None) -> CombineResults:
+def combine(
+    username: str, data_dir: Path | None = None, use_cache: bool | None = None
+) -> CombineResults:
+    """
+    If use_cache is True (defaults to MALEXPORT_PARSE_CACHE), the results are
+    saved to/loaded from the parse cache, and only parsed again if the source
+    files have changed
+    """
     if data_dir is None:
         acc = LocalDir.from_username(username)
         data_dir = acc.data_dir
 
     assert data_dir is not None
 
+    if use_cache is None:
+        use_cache = PARSE_CACHE
+
+    results: CombineResults | None = None
+    if use_cache:
+        cache = ParseCache()
+        current, results = cache.get(username, data_dir)
+        if results is None:
+            results = _combine(username, data_dir)
+            cache.store(username, data_dir, current, results)
+    else:
+        results = _combine(username, data_dir)
+
+    anime_combined, manga_combined = results
+
+    # e.g. if you had MALEXPORT_COMBINE_FILTER_TAGS="no source,no raws"
+    # anything which has those tags would be removed
+    # from the results here
+    if FILTER_TAGS in os.environ:
+        filter_by_tags: list[str] = os.environ[FILTER_TAGS].split(",")
+
+        # if this entry has any tags which are in the filter list
+        def filter_func(e: AnimeData | MangaData) -> bool:
+            tags: set[str] = set(e.tags_list)
+            return not any(t in filter_by_tags for t in tags)
+
+        anime_combined = list(filter(filter_func, anime_combined))
+        manga_combined = list(filter(filter_func, manga_combined))
+
+    return anime_combined, manga_combined
+
+
+def _combine(username: str, data_dir: Path) -> CombineResults:
     # read history
     history = list(iter_history_from_dir(data_dir))
     anime_history: dict[int, History] = {}
@@ -183,11 +224,11 @@ def combine(username: str, data_dir: Path | None = None) -> CombineResults:
     # xml exports should always exist
     animelist_xml_data: dict[int, AnimeXML] = {
         el.id: el  # type: ignore[union-attr,misc]
-        for el in parse_xml(str(data_dir / "animelist.xml")).entries
+        for el in iter_xml(data_dir / "animelist.xml")
     }
     mangalist_xml_data: dict[int, MangaXML] = {
         el.id: el  # type: ignore[union-attr,misc]
-        for el in parse_xml(str(data_dir / "mangalist.xml")).entries
+        for el in iter_xml(data_dir / "mangalist.xml")
     }
 
     # list using the API
@@ -268,21 +309,4 @@ def combine(username: str, data_dir: Path | None = None) -> CombineResults:
     # if len(manga_history) > 0:
     #    logger.warning(f"manga_history entries left over: {len(manga_history)}")
 
-    anime_combined = list(anime_combined_data.values())
-    manga_combined = list(manga_combined_data.values())
-
-    # e.g. if you had MALEXPORT_COMBINE_FILTER_TAGS="no source,no raws"
-    # anything which has those tags would be removed
-    # from the results here
-    if FILTER_TAGS in os.environ:
-        filter_by_tags: list[str] = os.environ[FILTER_TAGS].split(",")
-
-        # if this entry has any tags which are in the filter list
-        def filter_func(e: AnimeData | MangaData) -> bool:
-            tags: set[str] = set(e.tags_list)
-            return not any(t in filter_by_tags for t in tags)
-
-        anime_combined = list(filter(filter_func, anime_combined))
-        manga_combined = list(filter(filter_func, manga_combined))
-
-    return anime_combined, manga_combined
+    return list(anime_combined_data.values()), list(manga_combined_data.values())
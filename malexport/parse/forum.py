@@ -1,11 +1,11 @@
 import os
-import json
 import glob
 from datetime import datetime
 from typing import NamedTuple
 from collections.abc import Iterator
 
 from ..paths import LocalDir
+from ..common import read_json
 
 
 class Post(NamedTuple):
@@ -29,8 +29,7 @@ def _extract_posts_by_user(forum_path: str, username: str) -> Iterator[Post]:
     forum_id, _ = os.path.splitext(os.path.basename(forum_path))
     if not forum_id.isnumeric():  # not a valid post, probably index.json
         return
-    with open(forum_path) as f:
-        data = json.load(f)
+    data = read_json(forum_path)
     for post in data["posts"]:
         if username.casefold() == post["created_by"]["name"].casefold():
             yield Post(
@@ -1,10 +1,10 @@
 from typing import NamedTuple
 from collections.abc import Iterator
 from datetime import datetime
-import json
 
 from ..paths import LocalDir
 from ..log import logger
+from ..common import read_json
 
 
 class Friend(NamedTuple):
@@ -21,7 +21,7 @@ def iter_friends(username: str) -> Iterator[Friend]:
     if not friends_path.exists():
         logger.debug(f"{friends_path} doesn't exist, returning empty iterator")
         return
-    for blob in json.loads(friends_path.read_text()):
+    for blob in read_json(friends_path):
         user = blob["user"]
         yield Friend(
             url=user["url"],
@@ -6,6 +6,7 @@ from collections.abc import Iterator
 
 from ..paths import LocalDir
 from ..list_type import ListType
+from ..common import parse_json, read_json
 
 
 class HistoryEntry(NamedTuple):
@@ -39,13 +40,45 @@ def iter_history_from_dir(data_dir: Path) -> Iterator[History]:
         yield from parse_history_dir(data_dir / "history" / _type, _type)
 
 
+def merged_history_logs(merged_history_file: Path) -> list[Path]:
+    """
+    The logs which are appended to while updating the merged history file,
+    in the order they should be applied. The first is only present if the
+    log was being compacted into the merged file when malexport exited
+    """
+    return [
+        merged_history_file.with_suffix(".compacting.jsonl"),
+        merged_history_file.with_suffix(".jsonl"),
+    ]
+
+
+def load_merged_history(merged_history_file: Path) -> dict[str, Any]:
+    """
+    Load the merged history file, applying any changes from the logs
+    which haven't been compacted into it yet
+    """
+    merged_data: dict[str, Any] = {}
+    if merged_history_file.exists():
+        merged_data = read_json(merged_history_file)
+    for log_path in merged_history_logs(merged_history_file):
+        if not log_path.exists():
+            continue
+        with log_path.open() as f:
+            for line in f:
+                try:
+                    blob = parse_json(line)
+                except json.JSONDecodeError:
+                    # partially written last line
+                    continue
+                merged_data[str(blob["id"])] = blob["data"]
+    return merged_data
+
+
 def _parse_merged_history(
     merged_history_file: Path, list_type: str | ListType
 ) -> Iterator[History]:
     lt: str = list_type.value.lower() if isinstance(list_type, ListType) else list_type
-    if not merged_history_file.exists():
-        return
-    merged_data = json.loads(merged_history_file.read_text())
+    merged_data = load_merged_history(merged_history_file)
     for key, data in merged_data.items():
         title, entries = _parse_history_data(data)
         if len(entries) == 0:
@@ -68,7 +101,7 @@ def parse_history_dir(
         assert (
             history_path.stem.isnumeric()
         ), f"Expected history JSON file, found {history_path}"
-        data = json.loads(history_path.read_text())
+        data = read_json(history_path)
         title, entries = _parse_history_data(data)
         # only return items which have at least one history entry
         if len(entries) == 0:
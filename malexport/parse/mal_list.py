@@ -1,11 +1,11 @@
-import json
+from pathlib import Path
 from typing import NamedTuple, Union, Optional, TypeVar
 from collections.abc import Iterator
 from datetime import date
 
 from .common import strtobool, parse_short_date
 from ..list_type import ListType
-from ..common import Json
+from ..common import Json, iter_json_array
 from ..paths import PathIsh, _expand_file
 
 T = TypeVar("T")
@@ -214,8 +214,7 @@ Entry = Union[AnimeEntry, MangaEntry]
 
 
 def iter_user_list(json_file: str, list_type: ListType) -> Iterator[Entry]:
-    with open(json_file) as f:
-        data = json.load(f)
+    data = iter_json_array(Path(json_file))
     if list_type == ListType.ANIME:
         for el in data:
             yield AnimeEntry._parse(el)
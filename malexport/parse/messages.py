@@ -1,10 +1,10 @@
-import json
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import NamedTuple, Any
 from collections.abc import Iterator
 
 from ..paths import LocalDir
+from ..common import read_json
 
 
 class Message(NamedTuple):
@@ -27,6 +27,8 @@ def iter_user_threads(username: str) -> Iterator[Thread]:
     localdir = LocalDir.from_username(username)
     msg_dir = localdir.data_dir / "messages"
     for file in msg_dir.glob("*.json"):
+        if not file.stem.isnumeric():  # not a thread, probably index.json
+            continue
         yield _parse_thread(file)
 
 
@@ -35,7 +37,7 @@ def _parse_thread(thread_file: Path) -> Thread:
     assert (
         thread_id.isnumeric()
     ), f"Expected thread JSON file where name includes ID, found {thread_file}"
-    data = json.loads(thread_file.read_text())
+    data = read_json(thread_file)
     messages = _parse_messages(data["messages"])
     return Thread(
         thread_id=int(thread_id), messages=list(messages), subject=data["subject"]
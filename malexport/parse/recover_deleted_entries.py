@@ -1,5 +1,4 @@
 import sys
-import json
 import logging
 from typing import NamedTuple
 from collections.abc import Callable
@@ -11,6 +10,7 @@ from git.cmd import Git  # type: ignore[import]
 from .combine import combine, CombineResults, AnimeData, MangaData
 from ..paths import mal_id_cache_dir
 from ..log import logger as mlog
+from ..common import read_json
 
 repo_dir = Path(mal_id_cache_dir)
 
@@ -75,8 +75,8 @@ class Approved(NamedTuple):
         cls.create_if_doesnt_exist()
         anime_file = repo_dir / "cache" / "anime_cache.json"
         manga_file = repo_dir / "cache" / "manga_cache.json"
-        anime = json.loads(anime_file.read_text())
-        manga = json.loads(manga_file.read_text())
+        anime = read_json(anime_file)
+        manga = read_json(manga_file)
         return Approved(
             anime=set(anime["sfw"] + anime["nsfw"]),
             manga=set(manga["sfw"] + manga["nsfw"]),
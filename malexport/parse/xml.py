@@ -1,5 +1,6 @@
 from typing import NamedTuple, Union, Any
 from datetime import date
+from collections.abc import Iterator, Callable
 
 
 import lxml.etree as ET  # type: ignore[import]
@@ -14,6 +15,81 @@ XMLElement = Any
 Info = dict[str, Union[int, str]]
 
 
+# tag -> (field, converter) for the children of each <anime>/<manga> element
+FieldTable = dict[str, tuple[str, Callable[[Any], Any]]]
+
+
+def _text(text: str | None) -> str | None:
+    return text
+
+
+def _decode(el: XMLElement, fields: FieldTable) -> dict[str, Any]:
+    """
+    Convert the children of an element to keyword arguments, walking them once
+    instead of calling find for each field
+    """
+    data: dict[str, Any] = {}
+    for child in el:
+        field = fields.get(child.tag)
+        if field is not None:
+            name, convert = field
+            data[name] = convert(child.text)
+    return data
+
+
+ANIME_FIELDS: FieldTable = {
+    "series_animedb_id": ("anime_id", int),
+    "series_title": ("title", _text),
+    "series_type": ("media_type", _text),
+    "series_episodes": ("episodes", int),
+    "my_id": ("my_id", int),
+    "my_watched_episodes": ("watched_episodes", int),
+    "my_start_date": ("start_date", parse_date_safe),
+    "my_finish_date": ("finish_date", parse_date_safe),
+    "my_rated": ("rated", _text),
+    "my_score": ("score", int),
+    "my_storage": ("storage", _text),
+    "my_storage_value": ("storage_value", float),
+    "my_status": ("status", _text),
+    "my_comments": ("comments", _text),
+    "my_times_watched": ("times_watched", int),
+    "my_rewatch_value": ("rewatch_value", _text),
+    "my_priority": ("priority", _text),
+    "my_tags": ("tags", _text),
+    "my_rewatching": ("rewatching", strtobool),
+    "my_rewatching_ep": ("rewatching_ep", int),
+    "my_discuss": ("discuss", strtobool),
+    "my_sns": ("sns", _text),
+    "update_on_import": ("update_on_import", strtobool),
+}
+
+MANGA_FIELDS: FieldTable = {
+    "manga_mangadb_id": ("manga_id", int),
+    "manga_title": ("title", _text),
+    "manga_volumes": ("volumes", int),
+    "manga_chapters": ("chapters", int),
+    "my_id": ("my_id", int),
+    "my_read_volumes": ("read_volumes", int),
+    "my_read_chapters": ("read_chapters", int),
+    "my_start_date": ("start_date", parse_date_safe),
+    "my_finish_date": ("finish_date", parse_date_safe),
+    "my_scanalation_group": ("scanlation_group", _text),
+    "my_score": ("score", int),
+    "my_storage": ("storage", _text),
+    "my_retail_volumes": ("retail_volumes", int),
+    "my_status": ("status", _text),
+    "my_comments": ("comments", _text),
+    "my_times_read": ("times_read", int),
+    "my_tags": ("tags", _text),
+    "my_priority": ("priority", _text),
+    "my_reread_value": ("reread_value", _text),
+    "my_rereading": ("rereading", strtobool),
+    "my_discuss": ("discuss", strtobool),
+    "my_sns": ("sns", _text),
+    "update_on_import": ("update_on_import", strtobool),
+}
+
+
 # TODO: some of these are None if the text is empty, not sure how to mark those
 class AnimeXML(NamedTuple):
     anime_id: int
@@ -46,31 +122,7 @@ class AnimeXML(NamedTuple):
 
     @classmethod
     def _parse(cls, anime_el: XMLElement) -> "AnimeXML":
-        return cls(
-            anime_id=int(anime_el.find("series_animedb_id").text),
-            title=anime_el.find("series_title").text,
-            media_type=anime_el.find("series_type").text,
-            episodes=int(anime_el.find("series_episodes").text),
-            my_id=int(anime_el.find("my_id").text),
-            watched_episodes=int(anime_el.find("my_watched_episodes").text),
-            start_date=parse_date_safe(anime_el.find("my_start_date").text),
-            finish_date=parse_date_safe(anime_el.find("my_finish_date").text),
-            rated=anime_el.find("my_rated").text,
-            score=int(anime_el.find("my_score").text),
-            storage=anime_el.find("my_storage").text,
-            storage_value=float(anime_el.find("my_storage_value").text),
-            status=anime_el.find("my_status").text,
-            comments=anime_el.find("my_comments").text,
-            times_watched=int(anime_el.find("my_times_watched").text),
-            rewatch_value=anime_el.find("my_rewatch_value").text,
-            priority=anime_el.find("my_priority").text,
-            tags=anime_el.find("my_tags").text,
-            rewatching=strtobool(anime_el.find("my_rewatching").text),
-            rewatching_ep=int(anime_el.find("my_rewatching_ep").text),
-            discuss=strtobool(anime_el.find("my_discuss").text),
-            sns=anime_el.find("my_sns").text,
-            update_on_import=strtobool(anime_el.find("update_on_import").text),
-        )
+        return cls(**_decode(anime_el, ANIME_FIELDS))
 
 
 class MangaXML(NamedTuple):
@@ -104,31 +156,7 @@ class MangaXML(NamedTuple):
 
     @classmethod
     def _parse(cls, manga_el: XMLElement) -> "MangaXML":
-        return cls(
-            manga_id=int(manga_el.find("manga_mangadb_id").text),
-            title=manga_el.find("manga_title").text,
-            volumes=int(manga_el.find("manga_volumes").text),
-            chapters=int(manga_el.find("manga_chapters").text),
-            my_id=int(manga_el.find("my_id").text),
-            read_volumes=int(manga_el.find("my_read_volumes").text),
-            read_chapters=int(manga_el.find("my_read_chapters").text),
-            start_date=parse_date_safe(manga_el.find("my_start_date").text),
-            finish_date=parse_date_safe(manga_el.find("my_finish_date").text),
-            scanlation_group=manga_el.find("my_scanalation_group").text,
-            score=int(manga_el.find("my_score").text),
-            storage=manga_el.find("my_storage").text,
-            retail_volumes=int(manga_el.find("my_retail_volumes").text),
-            status=manga_el.find("my_status").text,
-            comments=manga_el.find("my_comments").text,
-            times_read=int(manga_el.find("my_times_read").text),
-            tags=manga_el.find("my_tags").text,
-            priority=manga_el.find("my_priority").text,
-            reread_value=manga_el.find("my_reread_value").text,
-            rereading=strtobool(manga_el.find("my_rereading").text),
-            discuss=strtobool(manga_el.find("my_discuss").text),
-            sns=manga_el.find("my_sns").text,
-            update_on_import=strtobool(manga_el.find("update_on_import").text),
-        )
+        return cls(**_decode(manga_el, MANGA_FIELDS))
 
 
 Entry = Union[AnimeXML, MangaXML]
@@ -151,21 +179,49 @@ class XMLExport(NamedTuple):
 
     @classmethod
     def parse(cls, xml_file: str) -> "XMLExport":
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        info = cls._parse_info(root.find("myinfo"))
-        export_type = int(info["user_export_type"])
-        list_type: ListType
+        info: Info = {}
         entries: list[Entry] = []
-        if export_type == 1:
-            list_type = ListType.ANIME
-            entries = [AnimeXML._parse(el) for el in root.findall("anime")]
-        else:
-            list_type = ListType.MANGA
-            entries = [MangaXML._parse(el) for el in root.findall("manga")]
-
+        for el in _iterparse(xml_file):
+            if el.tag == "myinfo":
+                info = cls._parse_info(el)
+            else:
+                entries.append(_parse_entry(el))
+        list_type = (
+            ListType.ANIME if int(info["user_export_type"]) == 1 else ListType.MANGA
+        )
         return cls(info=info, entries=entries, list_type=list_type.value.lower())
 
 
+def _parse_entry(el: XMLElement) -> Entry:
+    if el.tag == "anime":
+        return AnimeXML._parse(el)
+    return MangaXML._parse(el)
+
+
+def _iterparse(xml_file: str) -> Iterator[XMLElement]:
+    """
+    Yields the <myinfo>, <anime> and <manga> elements as they're parsed,
+    freeing each one once the caller is done with it, so the whole
+    tree is never kept in memory
+    """
+    for _, el in ET.iterparse(
+        xml_file, events=("end",), tag=("myinfo", "anime", "manga")
+    ):
+        yield el
+        el.clear(keep_tail=True)
+        # remove references from the root to elements we've already processed
+        while el.getprevious() is not None:
+            del el.getparent()[0]
+
+
+def iter_xml(xml_file: PathIsh) -> Iterator[Entry]:
+    """
+    Parse the entries from an XML export one at a time
+    """
+    for el in _iterparse(str(_expand_file(xml_file))):
+        if el.tag != "myinfo":
+            yield _parse_entry(el)
+
+
 def parse_xml(xml_file: PathIsh) -> XMLExport:
     return XMLExport.parse(str(_expand_file(xml_file)))
@@ -92,6 +92,12 @@ class LocalDir:
             / f"{self.username}_credentials.yaml"
         )
 
+        # To save the cookies from the last time the browser logged in
+        self.cookie_path: Path = (
+            _expand_path(self.config_base / "accounts")
+            / f"{self.username}_cookies.json"
+        )
+
         # Base directory to store all data
         self.data_dir = _expand_path(self.application_base / self.username)
 
@@ -0,0 +1,258 @@
+"""
+A process-wide rate limiter, which keeps a separate budget for each host
+
+This is used for requests made with safe_request and for page loads in
+the selenium browser, so that everything which talks to a particular
+host shares the same budget
+"""
+
+import os
+import time
+import random
+import threading
+from urllib.parse import urlparse
+
+from .log import logger
+from .urls import MAL_API_BASE_URL, JIKAN_BASE_URL
+
+# how long to wait between requests to myanimelist.net when starting
+REQUEST_WAIT_TIME: int = int(os.environ.get("MALEXPORT_REQUEST_WAIT_TIME", 10))
+# the shortest/longest the adaptive wait time can become
+MIN_REQUEST_WAIT_TIME: float = float(
+    os.environ.get("MALEXPORT_MIN_REQUEST_WAIT_TIME", min(3, REQUEST_WAIT_TIME))
+)
+MAX_REQUEST_WAIT_TIME: float = float(
+    os.environ.get("MALEXPORT_MAX_REQUEST_WAIT_TIME", max(120, REQUEST_WAIT_TIME))
+)
+
+# multiply the interval by these when responses are healthy/unhealthy
+SPEEDUP_FACTOR = 0.9
+SLOWDOWN_FACTOR = 2.0
+
+# after this many failures in a row, pause all requests to the host
+BREAKER_THRESHOLD = int(os.environ.get("MALEXPORT_BREAKER_THRESHOLD", 3))
+# how long to pause for, this doubles each time the host fails again after resuming
+BREAKER_COOLDOWN = float(os.environ.get("MALEXPORT_BREAKER_COOLDOWN", 60))
+BREAKER_MAX_COOLDOWN = float(os.environ.get("MALEXPORT_BREAKER_MAX_COOLDOWN", 900))
+# if the request checking whether the host recovered doesn't finish in this
+# long (e.g. the browser crashed), let another request check
+PROBE_TIMEOUT = 120.0
+
+
+class HostBudget:
+    """
+    A token bucket for one host. The interval between requests slowly shrinks
+    while responses are healthy, and grows when the server responds with 429/5xx errors
+
+    Since this is a bucket and not a sleep before each request, the time already
+    spent waiting on a response counts towards the interval
+
+    This is also a circuit breaker for the host. If the server sends a Retry-After
+    header, or after BREAKER_THRESHOLD failures in a row, every request to the host
+    waits. Once the pause is over, one request is let through to check if the host
+    has recovered, and the rest wait for it. If that succeeds, requests resume at the
+    (slowed down) interval, which shrinks again as responses are healthy
+    """
+
+    def __init__(
+        self,
+        host: str,
+        *,
+        interval: float,
+        min_interval: float,
+        max_interval: float,
+        burst: int = 1,
+        jitter: float = 0.0,
+    ) -> None:
+        self.host = host
+        self.interval = float(interval)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.burst = burst
+        self.jitter = jitter
+        self._tokens: float = float(burst)
+        self._updated = time.monotonic()
+        # when the last request was let through, for per-request minimum intervals
+        self._last_acquired: float | None = None
+        self._lock = threading.Lock()
+        # circuit breaker state
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.paused_until = 0.0
+        self.tripped = False
+        self._probe_started: float | None = None
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(host={self.host}, interval={self.interval:.2f})"
+        )
+
+    __str__ = __repr__
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.interval > 0:
+            self._tokens = min(
+                float(self.burst),
+                self._tokens + (now - self._updated) / self.interval,
+            )
+        else:
+            self._tokens = float(self.burst)
+        self._updated = now
+
+    def _wait_for_breaker(self) -> float:
+        """
+        Wait while requests to this host are paused. Returns how long this slept
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    pause = self.paused_until - now
+                elif not self.tripped:
+                    return waited
+                elif (
+                    self._probe_started is None
+                    or now - self._probe_started > PROBE_TIMEOUT
+                ):
+                    # this request checks if the host has recovered
+                    self._probe_started = now
+                    logger.info(f"Checking if {self.host} has recovered...")
+                    return waited
+                else:
+                    # wait for the request checking the host
+                    pause = 0.25
+            time.sleep(pause)
+            waited += pause
+
+    def acquire(self, min_interval: float = 0.0) -> float:
+        """
+        Reserve a token, sleeping till it's available. Returns how long this slept
+
+        If min_interval is given, this also waits till at least that long
+        after the previous request to this host
+        """
+        breaker_wait = self._wait_for_breaker()
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait_for = 0.0 if self._tokens >= 0 else -self._tokens * self.interval
+            if min_interval > 0 and self._last_acquired is not None:
+                wait_for = max(
+                    wait_for, self._last_acquired + min_interval - self._updated
+                )
+            self._last_acquired = self._updated + wait_for
+        if self.jitter > 0:
+            wait_for += random.random() * self.jitter
+        if wait_for > 0:
+            logger.debug(f"Waiting {wait_for:.1f}s before requesting {self.host}")
+            time.sleep(wait_for)
+        return breaker_wait + wait_for
+
+    def feedback(self, status: int | None, retry_after: float | None = None) -> None:
+        """
+        Adjust the interval based on the response status. None means the
+        request failed without receiving a response
+
+        If the server sent a Retry-After header, all requests to the host wait that long
+        """
+        with self._lock:
+            now = time.monotonic()
+            if status is None or status == 429 or status >= 500:
+                self.interval = min(
+                    self.max_interval,
+                    max(self.interval, self.min_interval, 1.0) * SLOWDOWN_FACTOR,
+                )
+                logger.warning(
+                    f"Received {status or 'no response'} from {self.host}, waiting {self.interval:.1f}s between requests"
+                )
+                self.failures += 1
+                if retry_after is not None and retry_after > 0:
+                    logger.warning(
+                        f"{self.host} asked us to wait {retry_after:.1f}s, pausing requests"
+                    )
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                if self._probe_started is not None:
+                    # failed while checking if the host recovered, pause for longer
+                    self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+                    self._trip(now)
+                elif not self.tripped and self.failures >= BREAKER_THRESHOLD:
+                    self._trip(now)
+            else:
+                if status < 400:
+                    self.interval = max(
+                        self.min_interval, self.interval * SPEEDUP_FACTOR
+                    )
+                # the host is responding, even if it was an error for this request
+                self.failures = 0
+                if self.tripped and self._probe_started is not None:
+                    logger.info(
+                        f"{self.host} has recovered, resuming with {self.interval:.1f}s between requests"
+                    )
+                    self.tripped = False
+                    self._probe_started = None
+                    self.cooldown = BREAKER_COOLDOWN
+
+    def _trip(self, now: float) -> None:
+        logger.warning(
+            f"{self.failures} failed requests to {self.host}, pausing all requests for {self.cooldown:.0f}s"
+        )
+        self.tripped = True
+        self._probe_started = None
+        self.paused_until = max(self.paused_until, now + self.cooldown)
+        # dont burst once the pause is over
+        self._tokens = min(self._tokens, 0.0)
+        self._updated = now
+
+
+def _host(url: str) -> str:
+    host = urlparse(url).netloc.casefold()
+    if host.startswith("www."):
+        host = host[len("www.") :]
+    return host
+
+
+class RateLimiter:
+    """
+    Keeps track of one HostBudget per host, creating them as needed
+    """
+
+    def __init__(self) -> None:
+        self.budgets: dict[str, HostBudget] = {}
+        self._lock = threading.Lock()
+
+    def _create_budget(self, host: str) -> HostBudget:
+        if host == _host(MAL_API_BASE_URL):
+            return HostBudget(host, interval=1, min_interval=0.5, max_interval=60)
+        elif host == _host(JIKAN_BASE_URL):
+            # jikan allows 60 requests per minute
+            return HostBudget(host, interval=1, min_interval=1, max_interval=60)
+        else:
+            # myanimelist.net, and anything else
+            return HostBudget(
+                host,
+                interval=REQUEST_WAIT_TIME,
+                min_interval=MIN_REQUEST_WAIT_TIME,
+                max_interval=MAX_REQUEST_WAIT_TIME,
+                jitter=2.0 if REQUEST_WAIT_TIME > 0 else 0.0,
+            )
+
+    def budget(self, url: str) -> HostBudget:
+        host = _host(url)
+        with self._lock:
+            if host not in self.budgets:
+                self.budgets[host] = self._create_budget(host)
+            return self.budgets[host]
+
+    def acquire(self, url: str, min_interval: float = 0.0) -> float:
+        return self.budget(url).acquire(min_interval)
+
+    def feedback(
+        self, url: str, status: int | None, retry_after: float | None = None
+    ) -> None:
+        self.budget(url).feedback(status, retry_after)
+
+
+# global, shared by everything in this process
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,133 @@
+"""
+When and how long safe_request waits before retrying a failed request
+
+Each endpoint has a policy (how many tries, and the backoff between them).
+If the server sends a Retry-After header, that is used instead of the backoff,
+and the whole host is paused for that long (see rate_limit.HostBudget)
+"""
+
+import os
+import re
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple
+
+import requests
+
+from .urls import MAL_API_BASE_URL, JIKAN_BASE_URL
+
+# statuses which mean the server is overloaded/rate limiting us
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# never wait longer than this, even if the server asks us to
+RETRY_AFTER_MAX = float(os.environ.get("MALEXPORT_RETRY_AFTER_MAX", 600))
+
+# the backoff grows by this each try, like a fibonacci sequence
+GROWTH = 1.618
+
+
+class RetryPolicy(NamedTuple):
+    # total attempts, including the first one
+    tries: int
+    # seconds to wait after the first failure
+    base: float
+    # the most to wait between tries
+    max_wait: float
+
+    def backoff(self, attempt: int) -> float:
+        """
+        How long to wait after this many failed attempts, with some jitter
+        so workers which failed at the same time don't retry at the same time
+        """
+        wait = min(self.max_wait, self.base * GROWTH ** (attempt - 1))
+        return wait * random.uniform(0.8, 1.0)
+
+
+# matched against the URL, the first matching pattern is used
+DEFAULT_POLICIES: list[tuple[str, RetryPolicy]] = [
+    # the API responds quickly and recovers quickly
+    (re.escape(MAL_API_BASE_URL), RetryPolicy(tries=5, base=2, max_wait=60)),
+    # jikan is rate limited to 60 requests/minute
+    (re.escape(JIKAN_BASE_URL), RetryPolicy(tries=4, base=4, max_wait=60)),
+    (
+        r"/(anime|manga)list/[^/]+/load\.json",
+        RetryPolicy(tries=4, base=13, max_wait=120),
+    ),
+    # myanimelist.net, and anything else
+    (r".*", RetryPolicy(tries=3, base=13, max_wait=120)),
+]
+
+
+def _parse_policies(spec: str) -> list[tuple[str, RetryPolicy]]:
+    """
+    Parse MALEXPORT_RETRY_POLICIES, like 'api.jikan.moe=5:2:30,load.json=3:20:120'
+    (tries:base:max_wait). These are matched before the defaults
+    """
+    policies: list[tuple[str, RetryPolicy]] = []
+    for part in spec.split(","):
+        if part.strip():
+            pattern, _, values = part.strip().rpartition("=")
+            tries, base, max_wait = values.split(":")
+            policies.append(
+                (
+                    re.escape(pattern),
+                    RetryPolicy(
+                        tries=int(tries), base=float(base), max_wait=float(max_wait)
+                    ),
+                )
+            )
+    return policies
+
+
+POLICIES = [
+    (re.compile(pattern), policy)
+    for pattern, policy in _parse_policies(
+        os.environ.get("MALEXPORT_RETRY_POLICIES", "")
+    )
+    + DEFAULT_POLICIES
+]
+
+
+def retry_policy(url: str) -> RetryPolicy:
+    for pattern, policy in POLICIES:
+        if pattern.search(url):
+            return policy
+    return DEFAULT_POLICIES[-1][1]
+
+
+def parse_retry_after(resp: requests.Response | None) -> float | None:
+    """
+    The Retry-After header, which is either seconds or a HTTP date
+    """
+    if resp is None:
+        return None
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    seconds: float
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(tz=timezone.utc)).total_seconds()
+    return max(0.0, min(RETRY_AFTER_MAX, seconds))
+
+
+def should_retry(resp: requests.Response | None, *, refreshed: bool) -> bool:
+    """
+    Whether a failed request should be retried. Requests which failed without a
+    response (timeouts, connection errors) are retried. A 401 is retried if an
+    error handler ran which may have refreshed the token
+    """
+    if resp is None:
+        return True
+    if resp.status_code == 401:
+        return refreshed
+    return resp.status_code in RETRY_STATUSES
@@ -0,0 +1,18 @@
+"""
+Base URLs for the sites malexport requests
+
+These can be changed to point at a local server instead, like the
+one in malexport/utils/fake_mal.py, to benchmark the exporters offline
+"""
+
+import os
+
+MAL_BASE_URL = os.environ.get(
+    "MALEXPORT_MAL_BASE_URL", "https://myanimelist.net"
+).rstrip("/")
+MAL_API_BASE_URL = os.environ.get(
+    "MALEXPORT_MAL_API_BASE_URL", "https://api.myanimelist.net"
+).rstrip("/")
+JIKAN_BASE_URL = os.environ.get(
+    "MALEXPORT_JIKAN_BASE_URL", "https://api.jikan.moe"
+).rstrip("/")
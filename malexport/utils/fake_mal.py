@@ -0,0 +1,1133 @@
+"""
+A local stand-in for myanimelist.net, the MAL API and Jikan, which serves
+synthetic (or previously downloaded) data, to benchmark the exporters offline
+
+This serves the load.json pages, API v2 list/forum pagination, Jikan friend
+pages, the ajaxtb.php history popups, the history page, message pages, the
+login page and the export panel. Responses can be delayed, and errors
+(500s, and 429s with a Retry-After header) can be injected
+
+Point malexport at it with the base URL environment variables, e.g.:
+
+    python3 -m malexport.utils.fake_mal --port 8765
+    MALEXPORT_MAL_BASE_URL=http://127.0.0.1:8765 \\
+    MALEXPORT_MAL_API_BASE_URL=http://127.0.0.1:8765 \\
+    MALEXPORT_JIKAN_BASE_URL=http://127.0.0.1:8765 \\
+        malexport update lists -u fake
+
+Since the rate limiter keeps a budget for each host, run one server per site
+(on different ports) to keep those separate. See scripts/bench_exporters.py
+"""
+
+import re
+import json
+import gzip
+import time
+import random
+import threading
+from pathlib import Path
+from datetime import date, datetime, timezone
+from functools import cached_property
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, NamedTuple
+from collections import Counter
+from collections.abc import Callable
+from urllib.parse import urlsplit, parse_qs
+from xml.sax.saxutils import escape
+
+import click
+
+from ..list_type import ListType
+from ..log import logger
+
+Json = Any
+
+# all synthetic timestamps are before this, so the data is the same on every run
+BASE_TIME = 1_650_000_000
+
+# page sizes, the same as MAL/Jikan
+LOAD_JSON_CHUNK = 300
+FRIEND_CHUNK = 100
+MESSAGE_CHUNK = 20
+
+SESSION_COOKIE = "MALSESSIONID"
+
+
+class FakeConfig(NamedTuple):
+    anime_count: int = 1000
+    manga_count: int = 300
+    # the most history rows (episodes/chapters) for one entry
+    max_history: int = 24
+    # how many entries show up on the recent history page
+    recent_history: int = 10
+    forum_topics: int = 25
+    max_posts: int = 250
+    friends: int = 250
+    messages: int = 60
+    # seconds to wait before each response, and a random amount up to jitter on top
+    latency: float = 0.0
+    jitter: float = 0.0
+    # chance that a request fails with a 500, or a 429 with a Retry-After header
+    error_rate: float = 0.0
+    retry_after: int = 1
+    seed: int = 0
+    # a malexport data directory for a user, whose saved files are served instead
+    recorded_dir: Path | None = None
+
+
+ANIME_STATUSES = [1, 2, 3, 4, 6]
+STATUS_WEIGHTS = [15, 50, 8, 7, 20]
+
+API_STATUS = {
+    ListType.ANIME: {
+        1: "watching",
+        2: "completed",
+        3: "on_hold",
+        4: "dropped",
+        6: "plan_to_watch",
+    },
+    ListType.MANGA: {
+        1: "reading",
+        2: "completed",
+        3: "on_hold",
+        4: "dropped",
+        6: "plan_to_read",
+    },
+}
+
+XML_STATUS = {
+    ListType.ANIME: {
+        1: "Watching",
+        2: "Completed",
+        3: "On-Hold",
+        4: "Dropped",
+        6: "Plan to Watch",
+    },
+    ListType.MANGA: {
+        1: "Reading",
+        2: "Completed",
+        3: "On-Hold",
+        4: "Dropped",
+        6: "Plan to Read",
+    },
+}
+
+
+class FakeEntry(NamedTuple):
+    list_type: ListType
+    id: int
+    title: str
+    status: int
+    score: int
+    # episodes, or chapters
+    total: int
+    volumes: int
+    progress: int
+    progress_volumes: int
+    rewatching: bool
+    times_rewatched: int
+    start_date: date | None
+    finish_date: date | None
+    updated_at: int
+    airing_status: int
+    # (episode/chapter, epoch time), most recent first
+    history: list[tuple[int, int]]
+
+
+def _entry(config: FakeConfig, list_type: ListType, index: int) -> FakeEntry:
+    """
+    Create the entry at this position on the list (sorted by when it was last updated)
+    Each entry has its own random generator, so they can be created in any order
+    """
+    mal_id = 1 + index * 7
+    rng = random.Random(f"{config.seed}:{list_type.value}:{mal_id}")
+    status = rng.choices(ANIME_STATUSES, weights=STATUS_WEIGHTS)[0]
+    total = rng.choice([1, 12, 13, 24, 26, 50, 0])
+    if list_type == ListType.MANGA:
+        total *= 4
+    volumes = total // 10 if list_type == ListType.MANGA else 0
+    if status == 2:
+        progress = total or rng.randint(1, 30)
+    elif status == 6:
+        progress = 0
+    else:
+        progress = rng.randint(0, max(total, 30) - 1) if total != 1 else 0
+    updated_at = BASE_TIME - index * 5000 - rng.randint(0, 4000)
+    start_date: date | None = None
+    finish_date: date | None = None
+    if progress > 0:
+        start_date = datetime.fromtimestamp(
+            updated_at - progress * 86400, tz=timezone.utc
+        ).date()
+    if status == 2:
+        finish_date = datetime.fromtimestamp(updated_at, tz=timezone.utc).date()
+    rows = min(progress, config.max_history)
+    history = [
+        (progress - i, updated_at - i * rng.randint(600, 86400)) for i in range(rows)
+    ]
+    return FakeEntry(
+        list_type=list_type,
+        id=mal_id,
+        title=f"Fake {list_type.value.title()} {mal_id}",
+        status=status,
+        score=rng.randint(0, 10) if status != 6 else 0,
+        total=total,
+        volumes=volumes,
+        progress=progress,
+        progress_volumes=progress // 10 if list_type == ListType.MANGA else 0,
+        rewatching=status == 1 and rng.random() < 0.05,
+        times_rewatched=rng.choice([0, 0, 0, 0, 1, 2]),
+        start_date=start_date,
+        finish_date=finish_date,
+        updated_at=updated_at,
+        airing_status=rng.choice([1, 2, 2, 2, 3]),
+        history=history,
+    )
+
+
+def _short_date(d: date | None) -> str | None:
+    return d.strftime("%d-%m-%y") if d is not None else None
+
+
+def _iso_time(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def load_json_entry(entry: FakeEntry) -> Json:
+    """
+    An entry like the ones on the load.json pages
+    """
+    data: dict[str, Any] = {
+        "status": entry.status,
+        "score": entry.score,
+        "tags": "",
+        "start_date_string": _short_date(entry.start_date),
+        "finish_date_string": _short_date(entry.finish_date),
+        "days_string": None,
+        "priority_string": "Low",
+        "is_added_to_list": True,
+        "genres": [{"id": 1, "name": "Action"}],
+        "demographics": [],
+        "updated_at": entry.updated_at,
+    }
+    if entry.list_type == ListType.ANIME:
+        data.update(
+            {
+                "is_rewatching": int(entry.rewatching),
+                "num_watched_episodes": entry.progress,
+                "anime_title": entry.title,
+                "anime_num_episodes": entry.total,
+                "anime_airing_status": entry.airing_status,
+                "anime_id": entry.id,
+                "anime_studios": [{"id": 1, "name": "Fake Studio"}],
+                "anime_licensors": None,
+                "anime_season": {"year": 2020, "season": "spring"},
+                "has_episode_video": False,
+                "has_promotion_video": False,
+                "has_video": False,
+                "video_url": f"/anime/{entry.id}/_/video",
+                "anime_url": f"/anime/{entry.id}/_",
+                "anime_image_path": "",
+                "anime_media_type_string": "TV",
+                "anime_mpaa_rating_string": "PG-13",
+                "anime_start_date_string": "03-04-20",
+                "anime_end_date_string": "19-06-20",
+                "storage_string": "",
+            }
+        )
+    else:
+        data.update(
+            {
+                "is_rereading": int(entry.rewatching),
+                "num_read_chapters": entry.progress,
+                "num_read_volumes": entry.progress_volumes,
+                "manga_title": entry.title,
+                "manga_num_chapters": entry.total,
+                "manga_num_volumes": entry.volumes,
+                "manga_publishing_status": entry.airing_status,
+                "manga_id": entry.id,
+                "manga_magazines": [{"id": 1, "name": "Fake Magazine"}],
+                "manga_url": f"/manga/{entry.id}/_",
+                "manga_image_path": "",
+                "manga_media_type_string": "Manga",
+                "manga_start_date_string": "03-04-18",
+                "manga_end_date_string": None,
+                "retail_string": "",
+            }
+        )
+    return data
+
+
+def api_node(entry: FakeEntry, *, list_status: bool = True) -> Json:
+    """
+    A node like the ones from the MAL API list/detail endpoints
+    """
+    node: dict[str, Any] = {
+        "id": entry.id,
+        "title": entry.title,
+        "main_picture": {
+            "medium": f"https://cdn.myanimelist.net/images/{entry.id}.jpg",
+            "large": f"https://cdn.myanimelist.net/images/{entry.id}l.jpg",
+        },
+        "alternative_titles": {"synonyms": [], "en": entry.title, "ja": ""},
+        "start_date": "2020-04-03",
+        "synopsis": f"Synopsis for {entry.title}. " * 20,
+        "mean": 7.5,
+        "rank": entry.id,
+        "popularity": entry.id,
+        "num_list_users": 100_000 - entry.id,
+        "num_scoring_users": 50_000 - entry.id,
+        "nsfw": "white",
+        "created_at": _iso_time(BASE_TIME - 10**8),
+        "updated_at": _iso_time(BASE_TIME - 10**6),
+        "media_type": "tv" if entry.list_type == ListType.ANIME else "manga",
+        "status": "finished_airing",
+        "genres": [{"id": 1, "name": "Action"}],
+        "background": "",
+        "related_anime": [],
+        "related_manga": [],
+        "recommendations": [],
+        "pictures": [],
+    }
+    if entry.list_type == ListType.ANIME:
+        node.update(
+            {
+                "num_episodes": entry.total,
+                "start_season": {"year": 2020, "season": "spring"},
+                "source": "manga",
+                "average_episode_duration": 1440,
+                "rating": "pg_13",
+                "studios": [{"id": 1, "name": "Fake Studio"}],
+                "statistics": {"num_list_users": 100_000 - entry.id},
+            }
+        )
+    else:
+        node.update(
+            {
+                "num_chapters": entry.total,
+                "num_volumes": entry.volumes,
+                "authors": [],
+            }
+        )
+    if list_status:
+        node["my_list_status"] = api_list_status(entry)
+    return node
+
+
+def api_list_status(entry: FakeEntry) -> Json:
+    status: dict[str, Any] = {
+        "status": API_STATUS[entry.list_type][entry.status],
+        "score": entry.score,
+        "updated_at": _iso_time(entry.updated_at),
+    }
+    if entry.start_date is not None:
+        status["start_date"] = entry.start_date.isoformat()
+    if entry.finish_date is not None:
+        status["finish_date"] = entry.finish_date.isoformat()
+    if entry.list_type == ListType.ANIME:
+        status.update(
+            {
+                "num_episodes_watched": entry.progress,
+                "is_rewatching": entry.rewatching,
+                "num_times_rewatched": entry.times_rewatched,
+            }
+        )
+    else:
+        status.update(
+            {
+                "num_chapters_read": entry.progress,
+                "num_volumes_read": entry.progress_volumes,
+                "is_rereading": entry.rewatching,
+                "num_times_reread": entry.times_rewatched,
+            }
+        )
+    return status
+
+
+def _xml_date(d: date | None) -> str:
+    return d.isoformat() if d is not None else "0000-00-00"
+
+
+def xml_entry(entry: FakeEntry) -> str:
+    """
+    An <anime> or <manga> element, like the ones in the XML export
+    """
+    status = XML_STATUS[entry.list_type][entry.status]
+    rewatching = "1" if entry.rewatching else "0"
+    if entry.list_type == ListType.ANIME:
+        fields = [
+            ("series_animedb_id", entry.id),
+            ("series_title", f"<![CDATA[{entry.title}]]>"),
+            ("series_type", "TV"),
+            ("series_episodes", entry.total),
+            ("my_id", 0),
+            ("my_watched_episodes", entry.progress),
+            ("my_start_date", _xml_date(entry.start_date)),
+            ("my_finish_date", _xml_date(entry.finish_date)),
+            ("my_rated", ""),
+            ("my_score", entry.score),
+            ("my_storage", ""),
+            ("my_storage_value", "0.00"),
+            ("my_status", status),
+            ("my_comments", "<![CDATA[]]>"),
+            ("my_times_watched", entry.times_rewatched),
+            ("my_rewatch_value", ""),
+            ("my_priority", "LOW"),
+            ("my_tags", "<![CDATA[]]>"),
+            ("my_rewatching", rewatching),
+            ("my_rewatching_ep", 0),
+            ("my_discuss", "1"),
+            ("my_sns", "default"),
+            ("update_on_import", 0),
+        ]
+    else:
+        fields = [
+            ("manga_mangadb_id", entry.id),
+            ("manga_title", f"<![CDATA[{entry.title}]]>"),
+            ("manga_volumes", entry.volumes),
+            ("manga_chapters", entry.total),
+            ("my_id", 0),
+            ("my_read_volumes", entry.progress_volumes),
+            ("my_read_chapters", entry.progress),
+            ("my_start_date", _xml_date(entry.start_date)),
+            ("my_finish_date", _xml_date(entry.finish_date)),
+            ("my_scanalation_group", "<![CDATA[]]>"),
+            ("my_score", entry.score),
+            ("my_storage", ""),
+            ("my_retail_volumes", 0),
+            ("my_status", status),
+            ("my_comments", "<![CDATA[]]>"),
+            ("my_times_read", entry.times_rewatched),
+            ("my_tags", "<![CDATA[]]>"),
+            ("my_priority", "Low"),
+            ("my_reread_value", ""),
+            ("my_rereading", "YES" if entry.rewatching else "NO"),
+            ("my_discuss", "YES"),
+            ("my_sns", "default"),
+            ("update_on_import", 0),
+        ]
+    body = "".join(f"\t\t<{tag}>{value}</{tag}>\n" for tag, value in fields)
+    return f"\t<{entry.list_type.value}>\n{body}\t</{entry.list_type.value}>\n"
+
+
+def export_xml(list_type: ListType, username: str, entries: list[FakeEntry]) -> str:
+    """
+    An entire XML export, like the one from the export panel
+    """
+    counts = Counter(XML_STATUS[list_type][e.status] for e in entries)
+    info = [
+        ("user_id", 1),
+        ("user_name", escape(username)),
+        ("user_export_type", 1 if list_type == ListType.ANIME else 2),
+        (f"user_total_{list_type.value}", len(entries)),
+    ] + [
+        (f"user_total_{status.lower().replace(' ', '').replace('-', '')}", count)
+        for status, count in sorted(counts.items())
+    ]
+    myinfo = "".join(f"\t\t<{tag}>{value}</{tag}>\n" for tag, value in info)
+    return (
+        '<?xml version="1.0" encoding="UTF-8" ?>\n'
+        "<myanimelist>\n"
+        f"\t<myinfo>\n{myinfo}\t</myinfo>\n"
+        + "".join(xml_entry(e) for e in entries)
+        + "</myanimelist>\n"
+    )
+
+
+def history_popup_html(list_type: ListType, title: str, history: list[Any]) -> str:
+    """
+    The ajaxtb.php popup with the episode/chapter history for an entry
+    """
+    if list_type == ListType.ANIME:
+        container, prefix, label, verb, kind = (
+            "epdetails",
+            "eprow",
+            "Ep",
+            "watched",
+            "Episode",
+        )
+    else:
+        container, prefix, label, verb, kind = (
+            "chapdetails",
+            "chaprow",
+            "Chapter",
+            "read",
+            "Chapter",
+        )
+    rows = []
+    for count, epoch in history:
+        # the popup shows the time in the users timezone, parsed back as local time
+        when = datetime.fromtimestamp(epoch)
+        rows.append(
+            f'<div id="{prefix}{count}" class="spaceit_pad">{label} {count}, {verb} on {when.strftime("%m/%d/%Y at %H:%M")} <a href="#">Remove</a></div>'
+        )
+    return (
+        "<html><head><title>History</title></head><body>"
+        f'<div id="{container}">'
+        f'<div class="normal_header">{escape(title)} {kind} Details</div>'
+        + "".join(rows)
+        + "</div></body></html>"
+    )
+
+
+def _page(title: str, content: str, head: str = "") -> str:
+    return (
+        f"<html><head><title>{escape(title)}</title>{head}</head>"
+        f'<body><div id="myanimelist"><div id="content">{content}</div></div></body></html>'
+    )
+
+
+class FakeMal:
+    """
+    The data served by the fake server. Entries are generated from the config, unless
+    recorded_dir has a saved file for that route
+    """
+
+    def __init__(self, config: FakeConfig = FakeConfig()) -> None:
+        self.config = config
+        self.recorded_dir = config.recorded_dir
+
+    def _recorded(self, name: str) -> Json | None:
+        if self.recorded_dir is None:
+            return None
+        p = self.recorded_dir / name
+        if not p.exists():
+            return None
+        return json.loads(p.read_text())
+
+    def entries(self, list_type: ListType) -> list[FakeEntry]:
+        return self._entries[list_type]
+
+    @cached_property
+    def _entries(self) -> dict[ListType, list[FakeEntry]]:
+        return {
+            ListType.ANIME: [
+                _entry(self.config, ListType.ANIME, i)
+                for i in range(self.config.anime_count)
+            ],
+            ListType.MANGA: [
+                _entry(self.config, ListType.MANGA, i)
+                for i in range(self.config.manga_count)
+            ],
+        }
+
+    @cached_property
+    def _by_id(self) -> dict[tuple[ListType, int], FakeEntry]:
+        return {(e.list_type, e.id): e for lt in ListType for e in self.entries(lt)}
+
+    def entry(self, list_type: ListType, mal_id: int) -> FakeEntry | None:
+        return self._by_id.get((list_type, mal_id))
+
+    def load_json(self, list_type: ListType) -> list[Json]:
+        recorded = self._recorded(f"{list_type.value}list.json")
+        if recorded is not None:
+            return list(recorded)
+        return [load_json_entry(e) for e in self.entries(list_type)]
+
+    def api_list(self, list_type: ListType) -> list[Json]:
+        recorded = self._recorded(f"{list_type.value}list_api.json")
+        if recorded is not None:
+            return list(recorded)
+        return [api_node(e) for e in self.entries(list_type)]
+
+    def history(self, list_type: ListType, mal_id: int) -> tuple[str, list[Any]] | None:
+        """
+        The title and episode/chapter history for an entry
+        """
+        recorded = self._recorded(f"history/{list_type.value}/{mal_id}.json")
+        if recorded is not None:
+            return recorded["title"], recorded["episodes"]
+        entry = self.entry(list_type, mal_id)
+        if entry is None:
+            return None
+        return entry.title, entry.history
+
+    def recent_history(self, list_type: ListType) -> list[int]:
+        entries = [e for e in self.entries(list_type) if e.history]
+        return [e.id for e in entries[: self.config.recent_history]]
+
+    @cached_property
+    def forum_index(self) -> list[Json]:
+        recorded = self._recorded("forum/index.json")
+        if recorded is not None:
+            return list(recorded)
+        rng = random.Random(f"{self.config.seed}:forum")
+        return [
+            {
+                "id": 100_000 + i,
+                "title": f"Fake Topic {i}",
+                "created_at": _iso_time(BASE_TIME - 10**7 - i * 86400),
+                "created_by": {"id": 1, "name": "fake"},
+                "number_of_posts": rng.randint(1, self.config.max_posts),
+                "last_post_created_at": _iso_time(BASE_TIME - i * 3600),
+                "last_post_created_by": {"id": 2, "name": "someone"},
+                "is_locked": False,
+            }
+            for i in range(self.config.forum_topics)
+        ]
+
+    def forum_topic(self, topic_id: int) -> Json | None:
+        recorded = self._recorded(f"forum/{topic_id}.json")
+        if recorded is not None:
+            return {"title": recorded["title"], "posts": recorded["posts"]}
+        topic = next((t for t in self.forum_index if t["id"] == topic_id), None)
+        if topic is None:
+            return None
+        return {
+            "title": topic["title"],
+            "posts": [
+                {
+                    "id": topic_id * 1000 + n,
+                    "number": n,
+                    "created_at": _iso_time(BASE_TIME - 10**7 + n * 600),
+                    "created_by": {"id": n % 7, "name": f"user{n % 7}"},
+                    "body": f"Post {n} in topic {topic_id}. " * 5,
+                    "signature": "",
+                }
+                for n in range(1, topic["number_of_posts"] + 1)
+            ],
+            "poll": None,
+        }
+
+    @cached_property
+    def friends(self) -> list[Json]:
+        recorded = self._recorded("friends.json")
+        if recorded is not None:
+            return list(recorded)
+        return [
+            {
+                "user": {
+                    "username": f"friend{i}",
+                    "url": f"https://myanimelist.net/profile/friend{i}",
+                    "images": {},
+                },
+                "last_online": _iso_time(BASE_TIME - i * 3600),
+                "friends_since": _iso_time(BASE_TIME - 10**7 - i * 86400),
+            }
+            for i in range(self.config.friends)
+        ]
+
+    def message_ids(self, sent: bool) -> list[int]:
+        """
+        Message IDs, most recent first. Every third message is sent
+        """
+        return [
+            2_000_000 + n for n in range(self.config.messages) if (n % 3 == 2) == sent
+        ]
+
+    def thread_id(self, message_id: int) -> int:
+        # a few messages in each thread
+        return 50_000 + (message_id - 2_000_000) // 4
+
+    def thread_messages(self, thread_id: int) -> list[int]:
+        first = 2_000_000 + (thread_id - 50_000) * 4
+        return [
+            mid
+            for mid in range(first, first + 4)
+            if mid - 2_000_000 < self.config.messages
+        ]
+
+
+def _paginate(
+    items: list[Json], offset: int, limit: int, next_url: Callable[[int], str]
+) -> Json:
+    page = items[offset : offset + limit]
+    paging: dict[str, str] = {}
+    if offset + limit < len(items):
+        paging["next"] = next_url(offset + limit)
+    if offset > 0:
+        paging["previous"] = next_url(max(0, offset - limit))
+    return {"data": page, "paging": paging}
+
+
+class FakeMalHandler(BaseHTTPRequestHandler):
+    """
+    Routes requests to the FakeMal data. The server attributes fake/config/counts
+    are set by create_server
+    """
+
+    protocol_version = "HTTP/1.1"
+    # the headers and body are written separately, dont wait to combine them
+    disable_nagle_algorithm = True
+    server: "FakeMalServer"
+
+    # (method, path regex, handler name)
+    ROUTES: list[tuple[str, re.Pattern[str], str]] = [
+        ("GET", re.compile(r"^/(anime|manga)list/[^/]+/load\.json$"), "load_json"),
+        ("GET", re.compile(r"^/v2/users/[^/]+/(anime|manga)list$"), "api_list"),
+        ("GET", re.compile(r"^/v2/(anime|manga)/(\d+)$"), "api_detail"),
+        ("GET", re.compile(r"^/v2/forum/topics$"), "forum_topics"),
+        ("GET", re.compile(r"^/v2/forum/topic/(\d+)$"), "forum_topic"),
+        ("GET", re.compile(r"^/v4/users/[^/]+/friends$"), "friends"),
+        ("GET", re.compile(r"^/ajaxtb\.php$"), "history_popup"),
+        ("GET", re.compile(r"^/history/[^/]+/(anime|manga)$"), "history_page"),
+        ("GET", re.compile(r"^/mymessages\.php$"), "messages"),
+        ("GET", re.compile(r"^/panel\.php$"), "export_panel"),
+        ("POST", re.compile(r"^/panel\.php$"), "export_result"),
+        ("GET", re.compile(r"^/export/((anime|manga)list_\d+\.xml\.gz)$"), "export"),
+        ("GET", re.compile(r"^/login\.php$"), "login_page"),
+        ("POST", re.compile(r"^/login\.php$"), "login"),
+        ("POST", re.compile(r"^/v1/oauth2/token$"), "token"),
+        ("GET", re.compile(r"^/editprofile\.php$"), "account"),
+        ("GET", re.compile(r"^/$"), "homepage"),
+    ]
+
+    # routes which are never delayed or fail, so logging in always works
+    RELIABLE = {"login_page", "login", "token", "homepage", "account"}
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(f"fake_mal: {format % args}")
+
+    def do_GET(self) -> None:
+        self._route("GET")
+
+    def do_POST(self) -> None:
+        self._route("POST")
+
+    @property
+    def fake(self) -> FakeMal:
+        return self.server.fake
+
+    def _route(self, method: str) -> None:
+        parts = urlsplit(self.path)
+        self.query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if method == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode() if length else ""
+            self.form = {k: v[0] for k, v in parse_qs(body).items()}
+        for route_method, pattern, name in self.ROUTES:
+            m = pattern.match(parts.path)
+            if route_method == method and m:
+                self.server.record(name)
+                if name not in self.RELIABLE and self._inject():
+                    return
+                getattr(self, f"route_{name}")(*m.groups())
+                return
+        self.server.record("not_found")
+        self._send(404, "text/plain", "Not Found")
+
+    def _inject(self) -> bool:
+        """
+        Wait for the configured latency, and fail some requests. Returns True if an
+        error was sent
+        """
+        config = self.server.config
+        delay, fail, status = self.server.roll()
+        if delay > 0:
+            time.sleep(delay)
+        if not fail:
+            return False
+        self.server.record(f"error_{status}")
+        headers = {}
+        if status == 429:
+            headers["Retry-After"] = str(config.retry_after)
+        self._send(status, "text/plain", f"Injected {status} error", headers=headers)
+        return True
+
+    def _send(
+        self,
+        status: int,
+        content_type: str,
+        body: str | bytes,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json(self, data: Json, status: int = 200) -> None:
+        self._send(status, "application/json; charset=UTF-8", json.dumps(data))
+
+    def _html(self, html: str, status: int = 200) -> None:
+        self._send(status, "text/html; charset=UTF-8", html)
+
+    def _redirect(self, location: str, headers: dict[str, str] | None = None) -> None:
+        self._send(
+            302, "text/plain", "", headers={"Location": location, **(headers or {})}
+        )
+
+    def _base(self) -> str:
+        return f"http://{self.headers.get('Host')}"
+
+    def _logged_in(self) -> bool:
+        return f"{SESSION_COOKIE}=" in (self.headers.get("Cookie") or "")
+
+    def _require_login(self) -> bool:
+        """
+        Redirect to the login page if there's no session cookie. Returns True if redirected
+        """
+        if self._logged_in():
+            return False
+        self._redirect("/login.php?from=" + self.path.replace("&", "%26"))
+        return True
+
+    def _require_token(self) -> bool:
+        if self.headers.get("Authorization", "").startswith("Bearer "):
+            return False
+        self._json({"error": "invalid_token"}, status=401)
+        return True
+
+    def _int(self, key: str, default: int) -> int:
+        try:
+            return int(self.query.get(key, default))
+        except ValueError:
+            return default
+
+    # myanimelist.net
+
+    def route_load_json(self, list_type: str) -> None:
+        offset = self._int("offset", 0)
+        items = self.fake.load_json(ListType(list_type))
+        self._json(items[offset : offset + LOAD_JSON_CHUNK])
+
+    def route_history_popup(self) -> None:
+        if self._require_login():
+            return
+        for list_type in ListType:
+            key = f"detailed{list_type.value[0]}id"
+            if key in self.query:
+                history = self.fake.history(list_type, int(self.query[key]))
+                if history is None:
+                    self._html(_page("Error", "Invalid ID"), status=404)
+                    return
+                title, rows = history
+                self._html(history_popup_html(list_type, title, rows))
+                return
+        self._html(_page("Error", "Invalid request"), status=400)
+
+    def route_history_page(self, list_type: str) -> None:
+        if self._require_login():
+            return
+        lt = ListType(list_type)
+        rows = "".join(
+            f'<tr><td><a href="/{lt.value}.php?id={mal_id}">Entry {mal_id}</a></td></tr>'
+            for mal_id in self.fake.recent_history(lt)
+        )
+        self._html(_page("History", f"<table>{rows}</table>"))
+
+    def route_messages(self) -> None:
+        if self._require_login():
+            return
+        go = self.query.get("go", "")
+        if go == "read" and "threadid" in self.query:
+            self._message_thread(int(self.query["threadid"]))
+        elif go == "read":
+            message_id = self._int("id", 0)
+            thread_id = self.fake.thread_id(message_id)
+            self._html(
+                _page(
+                    "Message",
+                    f'<div class="dialog-text"><div class="mb4">Message {message_id}</div></div>'
+                    f'<a href="/mymessages.php?go=read&amp;id={message_id}&amp;threadid={thread_id}">View Message History</a>',
+                )
+            )
+        else:
+            offset = self._int("show", 0)
+            ids = self.fake.message_ids(sent=go == "sent")[
+                offset : offset + MESSAGE_CHUNK
+            ]
+            rows = "".join(
+                f'<tr><td><a class="subject-link" href="/mymessages.php?go=read&amp;id={mid}">Subject {mid}</a></td></tr>'
+                for mid in ids
+            )
+            self._html(_page("Messages", f"<table>{rows}</table>"))
+
+    def _message_thread(self, thread_id: int) -> None:
+        rows = "".join(
+            "<tr>"
+            f'<td class="date">{datetime.fromtimestamp(BASE_TIME - (mid - 2_000_000) * 3600).strftime("%b %d, %Y %I:%M %p")}</td>'
+            f'<td class="name">{"fake" if (mid - 2_000_000) % 3 == 2 else "friend0"}</td>'
+            f'<td class="subject">Message {mid} in thread {thread_id}</td>'
+            "</tr>"
+            for mid in self.fake.thread_messages(thread_id)
+        )
+        self._html(
+            _page(
+                "Message History",
+                f'<div class="dialog-text"><div class="mb4">re: Thread {thread_id}</div></div>'
+                f'<table class="pmessage-message-history">{rows}</table>',
+            )
+        )
+
+    def route_export_panel(self) -> None:
+        if self._require_login():
+            return
+        # a stub for the jQuery call which selects the list type
+        script = (
+            "<script>window.$ = function(sel) { var el = document.querySelector(sel);"
+            " return { val: function(v) { el.value = v; } }; };</script>"
+        )
+        self._html(
+            _page(
+                "Export",
+                '<form method="post" action="/panel.php?go=export2" id="dialog">'
+                '<select name="type" class="inputtext">'
+                '<option value="1">Anime List</option><option value="2">Manga List</option>'
+                "</select>"
+                '<input type="submit" class="inputButton" value="Export My List" '
+                "onclick=\"return confirm('Are you sure you want to export your list?');\">"
+                "</form>",
+                head=script,
+            )
+        )
+
+    def route_export_result(self) -> None:
+        if self._require_login():
+            return
+        list_type = ListType.MANGA if self.form.get("type") == "2" else ListType.ANIME
+        name = f"{list_type.value}list_{BASE_TIME}.xml.gz"
+        self._html(
+            _page(
+                "Export",
+                f'<div class="goodresult">Your list has been exported. <a href="/export/{name}">Download</a></div>',
+            )
+        )
+
+    def route_export(self, name: str, list_type: str) -> None:
+        if self._require_login():
+            return
+        lt = ListType(list_type)
+        data = gzip.compress(
+            export_xml(lt, "fake", self.fake.entries(lt)).encode("utf-8")
+        )
+        self._send(
+            200,
+            "application/x-gzip",
+            data,
+            headers={"Content-Disposition": f'attachment; filename="{name}"'},
+        )
+
+    def route_login_page(self) -> None:
+        self._html(
+            _page(
+                "Login",
+                '<form method="post" action="/login.php">'
+                '<input type="text" name="user_name" id="loginUserName">'
+                '<input type="password" name="password" id="login-password">'
+                '<input type="submit" class="inputButton btn-form-submit" value="Login">'
+                "</form>",
+            )
+        )
+
+    def route_login(self) -> None:
+        self._redirect(
+            "/",
+            headers={"Set-Cookie": f"{SESSION_COOKIE}=fake; Path=/; HttpOnly"},
+        )
+
+    def route_account(self) -> None:
+        if self._require_login():
+            return
+        self._html(_page("Edit Profile", "Account settings"))
+
+    def route_homepage(self) -> None:
+        self._html(_page("MyAnimeList.net", "Welcome"))
+
+    def route_token(self) -> None:
+        self._json(
+            {
+                "token_type": "Bearer",
+                "expires_in": 2678400,
+                "access_token": "fake-access-token",
+                "refresh_token": "fake-refresh-token",
+            }
+        )
+
+    # api.myanimelist.net
+
+    def _api_page(self, items: list[Json], default_limit: int) -> Json:
+        limit = self._int("limit", default_limit)
+        offset = self._int("offset", 0)
+        parts = urlsplit(self.path)
+        query = {k: v for k, v in self.query.items() if k != "offset"}
+
+        def next_url(new_offset: int) -> str:
+            params = "&".join(f"{k}={v}" for k, v in query.items())
+            return f"{self._base()}{parts.path}?{params}&offset={new_offset}"
+
+        return _paginate(items, offset, limit, next_url)
+
+    def route_api_list(self, list_type: str) -> None:
+        if self._require_token():
+            return
+        lt = ListType(list_type)
+        nodes = self.fake.api_list(lt)
+        if self.query.get("sort") == "list_updated_at":
+            nodes = sorted(
+                nodes,
+                key=lambda n: (n.get("my_list_status") or {}).get("updated_at", ""),
+                reverse=True,
+            )
+        fields = set(self.query.get("fields", "").split(","))
+        if fields == {"my_list_status"}:
+            nodes = [
+                {k: n[k] for k in ("id", "title", "my_list_status") if k in n}
+                for n in nodes
+            ]
+        self._json(self._api_page([{"node": n} for n in nodes], default_limit=100))
+
+    def route_api_detail(self, list_type: str, mal_id: str) -> None:
+        if self._require_token():
+            return
+        entry = self.fake.entry(ListType(list_type), int(mal_id))
+        if entry is None:
+            self._json({"error": "not_found"}, status=404)
+            return
+        self._json(api_node(entry, list_status=False))
+
+    def route_forum_topics(self) -> None:
+        if self._require_token():
+            return
+        # the same topics are returned for topics created by/commented on
+        topics = self.fake.forum_index
+        if "topic_user_name" in self.query:
+            topics = topics[::2]
+        self._json(self._api_page(topics, default_limit=100))
+
+    def route_forum_topic(self, topic_id: str) -> None:
+        if self._require_token():
+            return
+        topic = self.fake.forum_topic(int(topic_id))
+        if topic is None:
+            self._json({"error": "not_found"}, status=404)
+            return
+        page = self._api_page(topic["posts"], default_limit=100)
+        page["data"] = {
+            "title": topic["title"],
+            "posts": page["data"],
+            "poll": topic.get("poll"),
+        }
+        self._json(page)
+
+    # api.jikan.moe
+
+    def route_friends(self) -> None:
+        page = max(1, self._int("page", 1))
+        offset = (page - 1) * FRIEND_CHUNK
+        friends = self.fake.friends
+        last_page = max(1, -(-len(friends) // FRIEND_CHUNK))
+        self._json(
+            {
+                "pagination": {
+                    "last_visible_page": last_page,
+                    "has_next_page": page < last_page,
+                },
+                "data": friends[offset : offset + FRIEND_CHUNK],
+            }
+        )
+
+
+class FakeMalServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, address: tuple[str, int], fake: FakeMal, config: FakeConfig
+    ) -> None:
+        super().__init__(address, FakeMalHandler)
+        self.fake = fake
+        self.config = config
+        # how many requests each route received
+        self.counts: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(config.seed)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def roll(self) -> tuple[float, bool, int]:
+        """
+        Returns the delay for this response, whether it should fail, and the error status
+        """
+        with self._lock:
+            delay = self.config.latency + self._rng.random() * self.config.jitter
+            fail = self._rng.random() < self.config.error_rate
+            status = self._rng.choice([429, 500])
+        return delay, fail, status
+
+    def start(self) -> threading.Thread:
+        """
+        Serve requests in a background thread. Use shutdown to stop
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def create_server(
+    config: FakeConfig = FakeConfig(),
+    *,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    fake: FakeMal | None = None,
+) -> FakeMalServer:
+    """
+    Create a server, port 0 picks a free port. Servers can share the same FakeMal
+    """
+    return FakeMalServer((host, port), fake or FakeMal(config), config)
+
+
+@click.command(help="Run a local stand-in for MAL, the MAL API and Jikan")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, type=int, show_default=True)
+@click.option("--anime", "anime_count", default=FakeConfig.anime_count, type=int)
+@click.option("--manga", "manga_count", default=FakeConfig.manga_count, type=int)
+@click.option(
+    "--latency", default=0.0, type=float, help="seconds to delay each response"
+)
+@click.option(
+    "--jitter", default=0.0, type=float, help="random extra delay, in seconds"
+)
+@click.option(
+    "--error-rate", default=0.0, type=float, help="fraction of requests which fail"
+)
+@click.option("--seed", default=0, type=int)
+@click.option(
+    "--recorded-dir",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    default=None,
+    help="serve the saved files from this users malexport data directory",
+)
+def main(
+    host: str,
+    port: int,
+    anime_count: int,
+    manga_count: int,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    seed: int,
+    recorded_dir: Path | None,
+) -> None:
+    config = FakeConfig(
+        anime_count=anime_count,
+        manga_count=manga_count,
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        seed=seed,
+        recorded_dir=recorded_dir,
+    )
+    server = create_server(config, host=host, port=port)
+    click.echo(f"Serving fake MAL at {server.base_url}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        click.echo(dict(server.counts), err=True)
+
+
+if __name__ == "__main__":
+    main()
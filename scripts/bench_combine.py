@@ -0,0 +1,112 @@
+"""
+Benchmark malexport.parse.combine under each JSON backend, and the parse cache
+
+Writes a synthetic data directory (XML exports, load.json lists, API lists and
+history files, using the generators from malexport/utils/fake_mal.py) and times
+combine() with the standard library and orjson, then saving the results
+to and loading them from the parse cache
+
+    python3 scripts/bench_combine.py --anime 10000 --manga 3000
+"""
+
+import time
+import tempfile
+from pathlib import Path
+
+import click
+
+from malexport.common import (
+    JSON_BACKENDS,
+    serialize,
+    set_json_backend,
+    json_backend,
+)
+from malexport.list_type import ListType
+from malexport.parse.combine import combine
+from malexport.parse.cache import ParseCache
+from malexport.utils.fake_mal import (
+    FakeConfig,
+    _entry,
+    export_xml,
+    load_json_entry,
+    api_node,
+)
+
+
+def write_data_dir(data_dir: Path, config: FakeConfig, merged: bool) -> None:
+    for list_type, count in (
+        (ListType.ANIME, config.anime_count),
+        (ListType.MANGA, config.manga_count),
+    ):
+        entries = [_entry(config, list_type, i) for i in range(count)]
+        name = list_type.value
+        (data_dir / f"{name}list.xml").write_text(
+            export_xml(list_type, "fake", entries)
+        )
+        (data_dir / f"{name}list.json").write_text(
+            serialize([load_json_entry(e) for e in entries])
+        )
+        (data_dir / f"{name}list_api.json").write_text(
+            serialize([api_node(e) for e in entries])
+        )
+        history = {
+            str(e.id): {"title": e.title, "episodes": e.history}
+            for e in entries
+            if e.history
+        }
+        if merged:
+            (data_dir / f"{name}_history.json").write_text(serialize(history))
+        else:
+            history_dir = data_dir / "history" / name
+            history_dir.mkdir(parents=True)
+            for mal_id, data in history.items():
+                (history_dir / f"{mal_id}.json").write_text(serialize(data))
+
+
+@click.command()
+@click.option("--anime", "anime_count", default=FakeConfig.anime_count, type=int)
+@click.option("--manga", "manga_count", default=FakeConfig.manga_count, type=int)
+@click.option(
+    "--merged",
+    is_flag=True,
+    help="write history to one merged file, instead of a file per entry",
+)
+@click.option("--runs", default=3, type=int, help="best of this many runs")
+def main(anime_count: int, manga_count: int, merged: bool, runs: int) -> None:
+    config = FakeConfig(anime_count=anime_count, manga_count=manga_count)
+    with tempfile.TemporaryDirectory(prefix="malexport_bench_") as tmp:
+        data_dir = Path(tmp)
+        write_data_dir(data_dir, config, merged)
+        click.echo(f"{anime_count} anime, {manga_count} manga, best of {runs}")
+        results: dict[str, float] = {}
+        for backend in JSON_BACKENDS:
+            if set_json_backend(backend) != backend:
+                click.echo(f"{backend:<12}not installed")
+                continue
+            times = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                combine("fake", data_dir=data_dir)
+                times.append(time.perf_counter() - start)
+            results[json_backend()] = min(times)
+
+        cache = ParseCache(cache_dir=Path(tmp) / "cache")
+        combined = combine("fake", data_dir=data_dir)
+        start = time.perf_counter()
+        current, _ = cache.get("fake", data_dir)
+        cache.store("fake", data_dir, current, combined)
+        results["cache save"] = time.perf_counter() - start
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            _, cached = cache.get("fake", data_dir)
+            times.append(time.perf_counter() - start)
+            assert cached == combined
+        results["cache hit"] = min(times)
+    baseline = results["json"]
+    for name, took in results.items():
+        click.echo(f"{name:<12}{took:>8.3f}s{baseline / took:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
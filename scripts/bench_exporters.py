@@ -0,0 +1,208 @@
+"""
+Benchmark the exporters against the local fake MAL server (malexport/utils/fake_mal.py)
+
+Starts one fake server each for myanimelist.net, the MAL API and Jikan, points
+malexport at them, and times each exporter with a temporary data directory.
+Passing --runs 2 or more re-runs them against the saved data, to time updates
+
+    python3 scripts/bench_exporters.py --anime 3000 --latency 0.05 --error-rate 0.02
+
+The messages/export steps use selenium, so they only run with --browser
+"""
+
+import os
+import json
+import time
+import tempfile
+from pathlib import Path
+from collections.abc import Callable
+
+import click
+
+from malexport.utils.fake_mal import FakeConfig, FakeMal, create_server
+
+STEPS = ["lists", "api-lists", "forum", "friends", "history", "messages", "export"]
+BROWSER_STEPS = {"messages", "export"}
+
+
+@click.command()
+@click.option("--anime", "anime_count", default=FakeConfig.anime_count, type=int)
+@click.option("--manga", "manga_count", default=FakeConfig.manga_count, type=int)
+@click.option(
+    "--latency", default=0.0, type=float, help="seconds to delay each response"
+)
+@click.option(
+    "--jitter", default=0.0, type=float, help="random extra delay, in seconds"
+)
+@click.option(
+    "--error-rate", default=0.0, type=float, help="fraction of requests which fail"
+)
+@click.option("--seed", default=0, type=int)
+@click.option(
+    "--mal-wait",
+    default=0.0,
+    type=float,
+    help="seconds between requests to the fake myanimelist.net",
+)
+@click.option(
+    "--api-wait",
+    default=0.0,
+    type=float,
+    help="seconds between requests to the fake MAL API/Jikan",
+)
+@click.option("--workers", default=1, type=int, help="workers for history/forum")
+@click.option("--concurrency", default=1, type=int, help="load.json pages at a time")
+@click.option("--runs", default=1, type=int, help="times to run each step")
+@click.option(
+    "--step", "steps", type=click.Choice(STEPS), multiple=True, help="steps to run"
+)
+@click.option("--browser", is_flag=True, help="run the selenium steps")
+def main(
+    anime_count: int,
+    manga_count: int,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    seed: int,
+    mal_wait: float,
+    api_wait: float,
+    workers: int,
+    concurrency: int,
+    runs: int,
+    steps: tuple[str, ...],
+    browser: bool,
+) -> None:
+    config = FakeConfig(
+        anime_count=anime_count,
+        manga_count=manga_count,
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        seed=seed,
+    )
+    fake = FakeMal(config)
+    servers = {
+        site: create_server(config, fake=fake) for site in ("MAL", "MAL_API", "JIKAN")
+    }
+    for site, server in servers.items():
+        server.start()
+        os.environ[f"MALEXPORT_{site}_BASE_URL"] = server.base_url
+    os.environ["MALEXPORT_REQUEST_WAIT_TIME"] = str(int(mal_wait))
+    os.environ["MALEXPORT_MIN_REQUEST_WAIT_TIME"] = str(mal_wait)
+
+    # the base URLs are read when malexport is imported, so import after setting them
+    from malexport.paths import LocalDir
+    from malexport.list_type import ListType
+    from malexport.rate_limit import RATE_LIMITER
+    from malexport.exporter.mal_list import MalList
+    from malexport.exporter.api_list import APIList
+    from malexport.exporter.mal_session import MalSession
+    from malexport.exporter.forum import ForumManager
+    from malexport.exporter.friends import FriendDownloader
+    from malexport.exporter.history import HistoryManager
+
+    for site in ("MAL_API", "JIKAN"):
+        budget = RATE_LIMITER.budget(servers[site].base_url)
+        budget.interval = budget.min_interval = api_wait
+
+    tmp = tempfile.TemporaryDirectory(prefix="malexport_bench_")
+    localdir = LocalDir(
+        application_base=Path(tmp.name) / "data",
+        config_base=Path(tmp.name) / "config",
+        username="fake",
+    )
+    localdir.refresh_info.write_text(
+        json.dumps({"access_token": "fake", "refresh_token": "fake"})
+    )
+    localdir.credential_path.write_text("username: fake\npassword: fake\n")
+    localdir.cookie_path.write_text(
+        json.dumps(
+            {
+                "user_agent": None,
+                "cookies": [
+                    {
+                        "name": "MALSESSIONID",
+                        "value": "fake",
+                        "path": "/",
+                        "domain": servers["MAL"].server_address[0],
+                    }
+                ],
+            }
+        )
+    )
+    mal_session = MalSession("fake-client-id", localdir)
+
+    def lists() -> None:
+        for list_type in ListType:
+            MalList(list_type, localdir, concurrency=concurrency).update_list()
+
+    def api_lists() -> None:
+        for list_type in ListType:
+            APIList(list_type, localdir, mal_session).update_list()
+
+    def forum() -> None:
+        manager = ForumManager(localdir, mal_session, workers=workers)
+        manager.update_forum_index()
+        manager.update_changed_forum_posts()
+
+    def friends() -> None:
+        FriendDownloader(localdir).update_friend_index()
+
+    def history() -> None:
+        for list_type in ListType:
+            HistoryManager(
+                list_type, localdir, use_requests=True, workers=workers
+            ).update_history()
+
+    def messages() -> None:
+        from malexport.exporter.messages import MessageDownloader
+
+        MessageDownloader(localdir, workers=workers).update_messages()
+
+    def export() -> None:
+        from malexport.exporter.export_downloader import ExportDownloader
+
+        ExportDownloader(localdir).export_lists()
+
+    funcs: dict[str, Callable[[], None]] = {
+        "lists": lists,
+        "api-lists": api_lists,
+        "forum": forum,
+        "friends": friends,
+        "history": history,
+        "messages": messages,
+        "export": export,
+    }
+    # history needs a list to know which entries to request
+    selected = list(steps) or [s for s in STEPS if browser or s not in BROWSER_STEPS]
+    if "history" in selected and "lists" not in selected:
+        lists()
+
+    def total(errors: bool = False) -> int:
+        return sum(
+            count
+            for server in servers.values()
+            for route, count in server.counts.items()
+            if route.startswith("error_") == errors
+        )
+
+    click.echo(f"{'step':<12}{'run':>4}{'seconds':>10}{'requests':>10}{'errors':>8}")
+    try:
+        for run in range(1, runs + 1):
+            for step in selected:
+                requests_before, errors_before = total(), total(errors=True)
+                start = time.perf_counter()
+                funcs[step]()
+                took = time.perf_counter() - start
+                click.echo(
+                    f"{step:<12}{run:>4}{took:>10.2f}{total() - requests_before:>10}{total(errors=True) - errors_before:>8}"
+                )
+    finally:
+        for server in servers.values():
+            server.shutdown()
+            server.server_close()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark decoding XML export entries
+
+Writes a synthetic export (using the generators from malexport/utils/fake_mal.py)
+and times parsing it with the single pass decoder in malexport.parse.xml,
+compared to calling find once per field like it used to
+
+    python3 scripts/bench_xml_parse.py --entries 20000
+"""
+
+import time
+import tempfile
+from pathlib import Path
+from typing import Any
+from collections.abc import Callable
+
+import click
+import lxml.etree as ET  # type: ignore[import]
+
+from malexport.list_type import ListType
+from malexport.parse.xml import (
+    AnimeXML,
+    MangaXML,
+    ANIME_FIELDS,
+    MANGA_FIELDS,
+    FieldTable,
+    _iterparse,
+    parse_xml,
+)
+from malexport.utils.fake_mal import FakeConfig, _entry, export_xml
+
+
+def _find_decode(el: Any, fields: FieldTable) -> dict[str, Any]:
+    return {name: convert(el.find(tag).text) for tag, (name, convert) in fields.items()}
+
+
+def _parse_with_find(xml_file: str) -> list[Any]:
+    return [
+        (
+            AnimeXML(**_find_decode(el, ANIME_FIELDS))
+            if el.tag == "anime"
+            else MangaXML(**_find_decode(el, MANGA_FIELDS))
+        )
+        for el in ET.parse(xml_file).getroot()
+        if el.tag in ("anime", "manga")
+    ]
+
+
+def _parse_single_pass(xml_file: str) -> list[Any]:
+    return [
+        AnimeXML._parse(el) if el.tag == "anime" else MangaXML._parse(el)
+        for el in ET.parse(xml_file).getroot()
+        if el.tag in ("anime", "manga")
+    ]
+
+
+def _iterparse_only(xml_file: str) -> list[Any]:
+    return [el.tag for el in _iterparse(xml_file)]
+
+
+def _best(func: Callable[[str], Any], xml_file: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(xml_file)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+@click.command()
+@click.option("--entries", default=20000, type=int, help="entries in the export")
+@click.option(
+    "--type",
+    "_type",
+    type=click.Choice(["anime", "manga"], case_sensitive=False),
+    default="anime",
+)
+@click.option("--runs", default=5, type=int, help="best of this many runs")
+def main(entries: int, _type: str, runs: int) -> None:
+    list_type = ListType.__members__[_type.upper()]
+    config = FakeConfig(anime_count=entries, manga_count=entries)
+    with tempfile.TemporaryDirectory(prefix="malexport_bench_") as tmp:
+        xml_file = str(Path(tmp) / f"{list_type.value}list.xml")
+        Path(xml_file).write_text(
+            export_xml(
+                list_type,
+                "fake",
+                [_entry(config, list_type, i) for i in range(entries)],
+            )
+        )
+        assert _parse_with_find(xml_file) == parse_xml(xml_file).entries
+
+        results = {
+            "iterparse (no decoding)": _best(_iterparse_only, xml_file, runs),
+            "tree + find per field": _best(_parse_with_find, xml_file, runs),
+            "tree + single pass": _best(_parse_single_pass, xml_file, runs),
+            "parse_xml": _best(parse_xml, xml_file, runs),
+        }
+    baseline = results["tree + find per field"]
+    click.echo(f"{entries} {list_type.value} entries, best of {runs}")
+    for name, took in results.items():
+        click.echo(f"{name:<26}{took:>8.3f}s{baseline / took:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()